@@ -17,13 +17,19 @@ from sqlalchemy import create_engine, text
 from sqlalchemy.orm import Session
 from kafka import KafkaConsumer
 from fastapi.middleware.cors import CORSMiddleware
-from src.database import init_db, get_db
-from src.models import user, server, incident, rule, audit_log, incident_note, notification
+from src.database import init_db, get_db, async_engine
+from src.models import user, server, incident, rule, audit_log, incident_note, incident_event, notification
 from src.routes import incidents_router, rules_router, ingest_router, auth_router, servers, notifications_router
 from src.routes.events import router as events_router
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from src.core.limiter import limiter
+from src.services.ingest_queue import ingest_queue
+from src.services.heartbeat_buffer import heartbeat_buffer, HEARTBEAT_FLUSH_INTERVAL_MS
+from src.services.liveness import liveness
+from src.services.broadcaster import broadcaster
+from src.services.incident_throttle import incident_throttle, INCIDENT_THROTTLE_SECONDS
+from src.services.anomaly_detector import shutdown_training_pool, warm_up_recent_detectors
 from fastapi import Request, Response
 
 class ContentSizeLimitMiddleware:
@@ -83,6 +89,7 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # incident list pagination
 )
 
 app.add_middleware(ContentSizeLimitMiddleware, max_content_length=50*1024) # 50KB limit against Memory Exhaustion DoS
@@ -117,6 +124,17 @@ engine = create_engine(DATABASE_URL)
 ##############################################################
 # STARTUP
 ##############################################################
+# (table, column, type) added to existing databases on boot; create_all only
+# creates missing tables, never missing columns.
+_COLUMN_MIGRATIONS = [
+    ("rules", "target_server", "VARCHAR(255)"),
+    ("incidents", "fingerprint", "VARCHAR(64)"),
+    ("incidents", "first_seen", "TIMESTAMP"),
+    ("incidents", "last_seen", "TIMESTAMP"),
+    ("organizations", "incident_seq", "INTEGER NOT NULL DEFAULT 0"),
+    ("rules", "window_spec", "TEXT"),
+]
+
 @app.on_event("startup")
 def startup_event():
     logger.info("⚙️ Initializing database tables...")
@@ -126,18 +144,81 @@ def startup_event():
         logger.error(f"init_db failed: {e}")
         
     # Auto-migration for new columns
+    for table, column, ddl in _COLUMN_MIGRATIONS:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                logger.info(f"✅ Added {column} column to {table} table.")
+        except Exception:
+            logger.info(f"ℹ️ {column} column check (already exists)")
+
     try:
         with engine.begin() as conn:
-            conn.execute(text("ALTER TABLE rules ADD COLUMN target_server VARCHAR(255)"))
-            logger.info("✅ Added target_server column to rules table.")
-    except Exception:
-        logger.info("ℹ️ target_server column check (already exists)")
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_incidents_open_fingerprint "
+                "ON incidents (fingerprint) WHERE status = 'Open'"
+            ))
+    except Exception as e:
+        logger.warning(f"Could not create ix_incidents_open_fingerprint: {e}")
+
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_incidents_timestamp_id ON incidents (timestamp, id)"))
+    except Exception as e:
+        logger.warning(f"Could not create ix_incidents_timestamp_id: {e}")
+
+    # Catch the per-org incident counter up with ids assigned before it existed
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "UPDATE organizations SET incident_seq = ("
+                "  SELECT MAX(org_incident_id) FROM incidents WHERE incidents.organization_id = organizations.id"
+                ") WHERE incident_seq < ("
+                "  SELECT COALESCE(MAX(org_incident_id), 0) FROM incidents WHERE incidents.organization_id = organizations.id"
+                ")"
+            ))
+    except Exception as e:
+        logger.warning(f"Could not seed organizations.incident_seq: {e}")
+
+    try:
+        db = next(get_db())
+        try:
+            warm_up_recent_detectors(db)
+        finally:
+            db.close()
+    except Exception as e:
+        logger.warning(f"ML warm-up skipped: {e}")
+
+    # Coalesce heartbeat writes (one bulk UPDATE per interval instead of one per heartbeat)
+    if HEARTBEAT_FLUSH_INTERVAL_MS > 0:
+        heartbeat_buffer.start()
+
+    # Push server_online / server_offline transitions instead of recomputing per request
+    try:
+        liveness.start(asyncio.get_running_loop())
+    except RuntimeError:
+        liveness.start()
+    except Exception as e:
+        logger.warning(f"Liveness tracker not started: {e}")
+
+    # Collapse storms of identical alerts into periodic alert_count updates
+    if INCIDENT_THROTTLE_SECONDS > 0:
+        try:
+            incident_throttle.start(asyncio.get_running_loop())
+        except RuntimeError:
+            incident_throttle.start()
+
+    # Fan SSE events out to the other workers (BROADCAST_BACKEND=postgres)
+    try:
+        broadcaster.start_bus(asyncio.get_running_loop())
+    except Exception as e:
+        logger.error(f"Cross-worker SSE fan-out not started: {e}")
 
     # Start Kafka consumer in a background daemon thread
     if os.getenv("KAFKA_ENABLED") == "true":
         try:
-            from src.services.kafka_consumer import start_consumer
-            
+            from src.services.kafka_consumer import consumer_pool, KAFKA_CONSUMER_WORKERS
+
             # Capture the main event loop to pass to the consumer thread
             try:
                 loop = asyncio.get_running_loop()
@@ -145,13 +226,32 @@ def startup_event():
                 loop = asyncio.new_event_loop()
                 asyncio.set_event_loop(loop)
 
-            t = threading.Thread(target=start_consumer, args=(True, 20, 5, loop), daemon=True, name="kafka-consumer-thread")
-            t.start()
-            logger.info("🧵 Kafka consumer thread started (daemon).")
+            consumer_pool.start(KAFKA_CONSUMER_WORKERS, loop)
         except Exception as e:
             logger.error(f"Failed to start Kafka consumer: {e}")
     else:
         logger.info("❌ Kafka consumer DISABLED (KAFKA_ENABLED != true). Direct Mode active.")
+        if ingest_queue.enabled:
+            logger.info("📥 Direct Mode ingest queue ENABLED (202 Accepted + background workers).")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Let queued Direct Mode events finish before the worker exits
+    await ingest_queue.stop(drain=True)
+
+    if os.getenv("KAFKA_ENABLED") == "true":
+        from src.services.kafka_consumer import consumer_pool
+        # Workers finish (and commit) their in-flight batch before leaving the group
+        await asyncio.to_thread(consumer_pool.stop)
+
+    shutdown_training_pool()
+    heartbeat_buffer.stop(flush=True)
+    liveness.stop()
+    incident_throttle.stop(flush=True)
+    broadcaster.stop_bus()
+    if async_engine is not None:
+        await async_engine.dispose()
 
 
 ##############################################################
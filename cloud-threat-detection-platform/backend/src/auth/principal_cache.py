@@ -0,0 +1,154 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+
+from src.models.user import User
+from src.services.broadcast_bus import BROADCAST_BACKEND
+from src.services.broadcaster import broadcaster
+
+# How long a resolved principal is trusted without a query. Invalidations
+# reach the other workers over the broadcast bus; the TTL only bounds
+# staleness when one is missed (bus reconnecting, out-of-band writes), or
+# when several workers run without a bus, where it defaults to a short one.
+_WORKERS = int(os.getenv("WEB_CONCURRENCY", "1") or 1)
+AUTH_CACHE_TTL_SECONDS = float(os.getenv(
+    "AUTH_CACHE_TTL_SECONDS", "2" if _WORKERS > 1 and BROADCAST_BACKEND == "local" else "30"
+))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+_STALE_KEY = "principal_cache_stale"
+
+
+class PrincipalCache:
+    """
+    TTL + LRU cache of authenticated users, keyed by the SHA-256 of the API
+    key or by the JWT subject. Entries hold plain column values; a hit is
+    attached to the request session with merge(load=False), so it behaves
+    like a loaded User (lazy relationships, updates) without a SELECT.
+    """
+    def __init__(self, ttl: float = AUTH_CACHE_TTL_SECONDS, max_entries: int = AUTH_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, values)
+        self._by_user: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def api_key_entry(api_key: str) -> str:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()
+
+    @staticmethod
+    def subject_entry(subject: str) -> str:
+        return "sub:" + subject
+
+    # ---------------------------------------------------------
+    # Lookup
+    # ---------------------------------------------------------
+    def get(self, db: Session, key: str) -> Optional[User]:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop_locked(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            values = entry[1]
+
+        user = User(**values)
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+
+    def put(self, key: str, user: User):
+        if self.ttl <= 0 or user.id is None:
+            return
+        state = inspect(user)
+        values = {attr.key: state.dict[attr.key] for attr in state.mapper.column_attrs if attr.key in state.dict}
+        with self._lock:
+            self._drop_locked(key)
+            self._entries[key] = (time.monotonic() + self.ttl, values)
+            self._by_user.setdefault(user.id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop_locked(next(iter(self._entries)))
+
+    def resolve_api_key(self, db: Session, api_key: str) -> Optional[User]:
+        key = self.api_key_entry(api_key)
+        user = self.get(db, key)
+        if user is None:
+            user = db.query(User).filter(User.api_key == api_key).first()
+            if user is not None:
+                self.put(key, user)
+        return user
+
+    # ---------------------------------------------------------
+    # Invalidation
+    # ---------------------------------------------------------
+    def _drop_locked(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._by_user.get(entry[1].get("id"))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_user[entry[1].get("id")]
+
+    def invalidate_user(self, user_id: int, broadcast: bool = True):
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._drop_locked(key)
+        if broadcast:
+            broadcaster.invalidate("principal_user", user_id)
+
+    def invalidate_organization(self, organization_id: int, broadcast: bool = True):
+        with self._lock:
+            for key in [k for k, (_, v) in self._entries.items() if v.get("organization_id") == organization_id]:
+                self._drop_locked(key)
+        if broadcast:
+            broadcaster.invalidate("principal_org", organization_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Single global cache used by get_current_user and the API-key dependencies
+principal_cache = PrincipalCache()
+
+
+# Safety net for writes that don't call invalidate_*() (admin scripts, tests,
+# future routes): any flushed change to a User drops it now and again after
+# commit, so a request racing the transaction can't re-cache the old row.
+# Other workers are told once the change is committed.
+def _user_changed(mapper, connection, target):
+    principal_cache.invalidate_user(target.id, broadcast=False)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_STALE_KEY, set()).add(target.id)
+
+
+def _after_commit(session: Session):
+    for user_id in session.info.pop(_STALE_KEY, ()):
+        principal_cache.invalidate_user(user_id)
+
+
+broadcaster.on_invalidate("principal_user", lambda user_id: principal_cache.invalidate_user(user_id, broadcast=False))
+broadcaster.on_invalidate("principal_org", lambda org_id: principal_cache.invalidate_organization(org_id, broadcast=False))
+
+event.listen(User, "after_update", _user_changed)
+event.listen(User, "after_delete", _user_changed)
+event.listen(Session, "after_commit", _after_commit)
@@ -1,8 +1,11 @@
 # src/database.py
 
 import os
+from fastapi import Depends
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 
 # Get DB URL from environment or fallback to SQLite for local development
 # Get DB URL from environment or fallback to Postgres for local development
@@ -29,6 +32,7 @@ def init_db():
     Import model metadata and create database tables.
     """
     from src.models.incident import Incident
+    from src.models.incident_event import IncidentEvent
     from src.models.rule import Rule
     from src.models.user import User
 
@@ -51,3 +55,77 @@ def get_db():
     except Exception as e:
         print(f"DEBUG: CRASH in get_db: {e}")
         raise e
+
+
+# ---------------------------------------------------------
+# 🔥 Async sessions (async def request handlers)
+# ---------------------------------------------------------
+
+# "true": the I/O-only async handlers (incident status, notes, assignment)
+# use an asyncpg / aiosqlite engine, so their queries are awaited on the event
+# loop. "false": they run the same session code on the sync engine in a
+# worker thread. CPU-heavy paths (ingest: ML scoring, rule evaluation) always
+# run on the sync engine in the threadpool.
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() == "true"
+
+_ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def async_database_url(url: str = DATABASE_URL) -> str:
+    """DATABASE_URL with its driver swapped for the asyncio one."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"DB_ASYNC is not supported for {backend!r} databases")
+    return parsed.set(drivername=_ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+class ThreadedSession:
+    """
+    The slice of the AsyncSession API the async handlers use, backed by a
+    sync Session: run_sync(fn, *args) calls fn(session, *args) in the
+    threadpool instead of on the event loop.
+    """
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+
+async_engine = None
+AsyncSessionLocal = None
+
+
+def async_session_dependency(session_factory):
+    """get_async_db for an async_sessionmaker (also used by tests on their own engine)."""
+    async def get_async_db():
+        """
+        Dependency for an AsyncSession per request.
+        Handlers run their ORM code with `await db.run_sync(fn, ...)`.
+        """
+        async with session_factory() as db:
+            yield db
+    return get_async_db
+
+
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(async_database_url())
+    # No expire on commit: attributes can't lazy-load outside run_sync()
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    get_async_db = async_session_dependency(AsyncSessionLocal)
+else:
+    async def get_async_db(db: Session = Depends(get_db)):
+        """
+        Dependency for an async session per request (sync engine fallback).
+        Handlers run their ORM code with `await db.run_sync(fn, ...)`.
+        """
+        yield ThreadedSession(db)
@@ -5,4 +5,5 @@ from .incident import Incident, incident_assignments
 from .rule import Rule
 from .audit_log import AuditLog
 from .incident_note import IncidentNote
+from .incident_event import IncidentEvent
 from .notification import Notification
@@ -1,6 +1,6 @@
 # src/models/incident.py
 
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Table
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Table, Index, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from src.database import Base
@@ -48,12 +48,30 @@ class Incident(Base):
     # Alert Count (for grouping)
     alert_count = Column(Integer, default=1)
 
+    # Dedup correlation key: sha1(org, source, event_type, rule). Indexed for open incidents only.
+    fingerprint = Column(String(64), nullable=True)
+
     # When incident was detected
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+    # First / last time a matching event was seen (merged events live in incident_events)
+    first_seen = Column(DateTime, nullable=True)
+    last_seen = Column(DateTime, nullable=True)
+
     # When incident was updated by IR actions
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Many-to-Many Assignment
     assignees = relationship("User", secondary=incident_assignments, backref="assigned_incidents")
 
+    __table_args__ = (
+        # Partial index: merge lookups only ever target OPEN incidents
+        Index(
+            "ix_incidents_open_fingerprint", "fingerprint",
+            postgresql_where=text("status = 'Open'"),
+            sqlite_where=text("status = 'Open'"),
+        ),
+        # Keyset pagination of the incident list: ORDER BY timestamp DESC, id DESC
+        Index("ix_incidents_timestamp_id", "timestamp", "id"),
+    )
+
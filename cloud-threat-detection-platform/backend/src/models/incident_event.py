@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from datetime import datetime
+from src.database import Base
+
+class IncidentEvent(Base):
+    """
+    Append-only history of events merged into an incident.
+    Kept out of Incident.description so merges stay a constant-cost INSERT.
+    """
+    __tablename__ = "incident_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    incident_id = Column(Integer, ForeignKey("incidents.id"), nullable=False, index=True)
+
+    event_id = Column(String(64), nullable=True)
+    event_type = Column(String(255), nullable=True)
+    summary = Column(Text, nullable=True) # Truncated JSON of the event
+    timestamp = Column(DateTime, default=datetime.utcnow)
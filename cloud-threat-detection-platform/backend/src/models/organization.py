@@ -10,6 +10,8 @@ class Organization(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Last org_incident_id handed out (see services/incident_sequence.py)
+    incident_seq = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Relationships
     users = relationship("User", back_populates="brand_organization")
@@ -23,6 +23,15 @@ class Rule(Base):
     organization_id = Column(Integer, nullable=True) # Linked to Organization.id (Logic-enforced FK)
     organization = Column(String(255), nullable=True) # Legacy/Backup string identifier
     target_server = Column(String(255), nullable=True) # Specific server hostname or None for Global
+    # Optional sliding-window aggregation, JSON: {"seconds", "threshold", "agg", "field", "group_by"}
+    # e.g. {"seconds": 60, "threshold": 5, "agg": "count", "group_by": "source"}
+    window_spec = Column(Text, nullable=True)
+
+    def get_window(self):
+        try:
+            return json.loads(self.window_spec) if self.window_spec else None
+        except Exception:
+            return None
 
     def get_conditions(self):
         try:
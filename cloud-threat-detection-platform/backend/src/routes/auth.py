@@ -15,6 +15,7 @@ from src.schemas.auth import UserCreate, UserResponse, Token, AuditLogOut
 from src.auth.security import get_password_hash, verify_password, verify_and_update_password, create_access_token, SECRET_KEY, ALGORITHM
 from sqlalchemy.orm import joinedload
 from src.services.email_service import EmailService
+from src.auth.principal_cache import principal_cache
 
 router = APIRouter(tags=["Authentication"])
 
@@ -43,9 +44,13 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credentials_exception
 
-    user = db.query(User).options(joinedload(User.assigned_servers)).filter(User.email == email).first()
+    cache_key = principal_cache.subject_entry(email)
+    user = principal_cache.get(db, cache_key)
     if user is None:
-        raise credentials_exception
+        user = db.query(User).options(joinedload(User.assigned_servers)).filter(User.email == email).first()
+        if user is None:
+            raise credentials_exception
+        principal_cache.put(cache_key, user)
     # Deactivated accounts cannot authenticate (returns 401 so the client logs out).
     if getattr(user, "is_active", True) is False:
         raise credentials_exception
@@ -55,8 +60,8 @@ from fastapi import Header
 
 def get_current_user_by_api_key(x_api_key: str = Header(..., alias="X-API-Key"), db: Session = Depends(get_db)):
     """Authenticate agent using X-API-Key header."""
-    user = db.query(User).filter(User.api_key == x_api_key).first()
-    if not user:
+    user = principal_cache.resolve_api_key(db, x_api_key)
+    if not user or getattr(user, "is_active", True) is False:
          raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API Key",
@@ -234,6 +239,12 @@ def delete_user(user_id: int, current_user: User = Depends(get_current_user), db
         # B. Delete notes AUTHORED by this user (on ANY incident)
         db.execute(text("DELETE FROM incident_notes WHERE user_id = :uid"), {"uid": user_id})
 
+        # C. Delete merged-event history of incidents owned by this user
+        db.execute(text("""
+            DELETE FROM incident_events
+            WHERE incident_id IN (SELECT id FROM incidents WHERE user_id = :uid)
+        """), {"uid": user_id})
+
         # 3. INCIDENTS (Parent)
         db.query(Incident).filter(Incident.user_id == user_id).delete()
         
@@ -250,6 +261,7 @@ def delete_user(user_id: int, current_user: User = Depends(get_current_user), db
         # 7. DELETE USER
         db.delete(user_to_delete)
         db.commit()
+        principal_cache.invalidate_user(user_id)
 
     except Exception as e:
         import traceback
@@ -396,6 +408,7 @@ def update_user_profile(payload: UserUpdate, current_user: User = Depends(get_cu
         current_user.full_name = payload.full_name
 
     db.commit()
+    principal_cache.invalidate_user(current_user.id)
     db.refresh(current_user)
 
     # Notify chat co-participants that this person's display name changed.
@@ -437,6 +450,8 @@ def update_organization(payload: OrganizationUpdate, current_user: User = Depend
     db.query(User).filter(User.organization_id == org.id).update({User.organization: payload.name})
 
     db.commit()
+    # Bulk UPDATE bypasses the ORM events, so drop the org's cached users explicitly
+    principal_cache.invalidate_organization(org.id)
     return {"message": f"Organization renamed from '{old_name}' to '{payload.name}' successfully."}
 
 @router.post("/generate-api-key")
@@ -456,6 +471,8 @@ def generate_api_key(background_tasks: BackgroundTasks, current_user: User = Dep
     db.add(log)
     
     db.commit()
+    # The old key must stop working right away
+    principal_cache.invalidate_user(current_user.id)
     
     # Send Notification (Background Task)
     try:
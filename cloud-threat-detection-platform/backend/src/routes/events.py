@@ -3,19 +3,26 @@ from fastapi import APIRouter, Request, Depends, HTTPException, Query
 from fastapi.responses import StreamingResponse
 import asyncio
 import json
-from src.services.broadcaster import broadcaster
+from typing import Optional
+from src.services.broadcaster import broadcaster, DISCONNECT
+from src.auth.permissions import admin_only
+from src.models.user import User
 from src.routes.auth import get_current_user
 from src.database import get_db
 from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/events", tags=["Events"])
 
-async def event_generator(request: Request, organization_id):
+async def event_generator(request: Request, organization_id, last_event_id: Optional[str] = None):
     """
     Generator that yields Server-Sent Events for a single organization.
     Subscribes scoped to the caller's org so events never cross tenants.
+    Each event carries an `id:`; the browser sends it back as Last-Event-ID
+    when it reconnects and only the missed events are replayed.
     """
-    sid, queue = await broadcaster.subscribe(organization_id)
+    # Browsers send the header on automatic reconnects; the query param is for manual resumes
+    last_event_id = request.headers.get("last-event-id") or last_event_id
+    sid, queue = await broadcaster.subscribe(organization_id, last_event_id=last_event_id)
     try:
         while True:
             # If client disconnected, exit
@@ -23,8 +30,13 @@ async def event_generator(request: Request, organization_id):
                 break
             try:
                 event = await asyncio.wait_for(queue.get(), timeout=15.0)
-                # SSE format: data: <json>\n\n
-                yield f"data: {json.dumps(event)}\n\n"
+                if event is DISCONNECT:
+                    # Fell too far behind (SSE_OVERFLOW_POLICY=disconnect); the client reconnects
+                    break
+                # SSE format: [id: <id>\n]data: <json>\n\n
+                event_id = getattr(event, "event_id", None)
+                prefix = f"id: {event_id}\n" if event_id else ""
+                yield f"{prefix}data: {json.dumps(event)}\n\n"
             except asyncio.TimeoutError:
                 # keep the connection alive with a ping comment
                 yield ": ping\n\n"
@@ -35,6 +47,7 @@ async def event_generator(request: Request, organization_id):
 async def stream(
     request: Request, 
     token: str = Query(..., description="JWT Token for authentication"),
+    last_event_id: Optional[str] = Query(None, description="Resume after this event id (same as the Last-Event-ID header)"),
     db: Session = Depends(get_db)
 ):
     # Validate User
@@ -44,6 +57,12 @@ async def stream(
         raise HTTPException(status_code=401, detail="Invalid Authentication")
 
     return StreamingResponse(
-        event_generator(request, user.organization_id),
+        event_generator(request, user.organization_id, last_event_id),
         media_type="text/event-stream",
     )
+
+
+@router.get("/stats")
+def stream_stats(current_user: User = Depends(admin_only)):
+    """Connected SSE clients of the caller's organization with queue depth and drop counts."""
+    return broadcaster.stats(current_user.organization_id)
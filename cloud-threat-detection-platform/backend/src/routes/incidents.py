@@ -1,17 +1,45 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
-from typing import List
+from typing import List, Optional
+import base64
+import os
 
-from src.database import get_db
+from src.database import get_db, get_async_db
 from src.models.incident import Incident
+from src.models.incident_event import IncidentEvent
 from src.routes.auth import get_current_user
 from src.models.user import User
 from src.services.broadcaster import broadcaster
+from src.services.incident_stats import incident_stats
+from src.services.incident_sequence import incident_sequence
+from src.services.incident_throttle import incident_throttle
 import json
 
 router = APIRouter(prefix="/incidents", tags=["Incidents"])
 
+INCIDENTS_PAGE_SIZE = int(os.getenv("INCIDENTS_PAGE_SIZE", "100"))
+INCIDENTS_PAGE_MAX = 500
+
+
+# Cursor stand-in for a NULL timestamp
+_NULL_TS = "null"
+
+
+def _encode_cursor(incident: Incident) -> str:
+    raw = f"{incident.timestamp.isoformat() if incident.timestamp else _NULL_TS}|{incident.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        ts, incident_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return (None if ts == _NULL_TS else datetime.fromisoformat(ts)), int(incident_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 
 def _get_incident_scoped(incident_id: int, current_user: User, db: Session) -> Incident:
     """
@@ -31,11 +59,8 @@ def _get_incident_scoped(incident_id: int, current_user: User, db: Session) -> I
 @router.post("/", response_model=dict)
 def create_incident(title: str, description: str, severity: str, status: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     
-    # Calculate next scoped ID (friendly ID)
-    # Lock or just query (using max) - for this scale, max() is fine.
-    # We use current_user.organization_id
-    last_inc = db.query(Incident).filter(Incident.organization_id == current_user.organization_id).order_by(Incident.org_incident_id.desc()).first()
-    next_id = (last_inc.org_incident_id or 0) + 1 if last_inc else 1
+    # Next scoped ID (friendly ID) from the organization's counter
+    next_id = incident_sequence.next_id(db, current_user.organization_id)
     
     new_incident = Incident(
         title=title,
@@ -48,6 +73,8 @@ def create_incident(title: str, description: str, severity: str, status: str, db
         timestamp=datetime.utcnow()
     )
     db.add(new_incident)
+    db.flush()
+    incident_stats.created(db, new_incident)
     db.commit()
     db.refresh(new_incident)
 
@@ -55,7 +82,21 @@ def create_incident(title: str, description: str, severity: str, status: str, db
 
 
 @router.get("/", response_model=List[dict])
-def get_all_incidents(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_all_incidents(
+    response: Response,
+    limit: int = INCIDENTS_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    severity: Optional[str] = None,
+    status: Optional[str] = None,
+    source: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Newest-first page of incidents (slim rows: no description / notes; see
+    GET /incidents/{id}). Keyset pagination on (timestamp, id): pass the
+    X-Next-Cursor response header back as `cursor` for the next page.
+    """
     try:
         if current_user.role == 'admin':
             # Admin: See all incidents in the Organization
@@ -63,7 +104,6 @@ def get_all_incidents(db: Session = Depends(get_db), current_user: User = Depend
         else:
             # Analyst/Viewer: See Own incidents OR incidents from Assigned Servers
             from src.models.server import Server
-            from sqlalchemy import or_
             
             # Subquery or Join for filtering
             # We want incidents where:
@@ -95,23 +135,57 @@ def get_all_incidents(db: Session = Depends(get_db), current_user: User = Depend
                 # Fallback to own incidents only to prevent crash
                 query = db.query(Incident).filter(Incident.user_id == current_user.id)
             
-        incidents = query.order_by(Incident.timestamp.desc()).all()
+        if severity:
+            query = query.filter(func.lower(Incident.severity) == severity.lower())
+        if status:
+            query = query.filter(func.lower(Incident.status) == status.lower())
+        if source:
+            query = query.filter(Incident.source == source)
+        if cursor:
+            ts, last_id = _decode_cursor(cursor)
+            # Keep the dialect's own NULL placement so the (timestamp, id) index
+            # still serves the sort: DESC puts NULLs first on Postgres, last on SQLite.
+            nulls_first = db.bind.dialect.name == "postgresql"
+            if ts is None:
+                after = and_(Incident.timestamp.is_(None), Incident.id < last_id)
+                query = query.filter(or_(after, Incident.timestamp.isnot(None)) if nulls_first else after)
+            else:
+                after = or_(
+                    Incident.timestamp < ts,
+                    and_(Incident.timestamp == ts, Incident.id < last_id)
+                )
+                query = query.filter(after if nulls_first else or_(after, Incident.timestamp.is_(None)))
+
+        limit = max(1, min(limit, INCIDENTS_PAGE_MAX))
+        incidents = (
+            query.options(selectinload(Incident.assignees))
+            .order_by(Incident.timestamp.desc(), Incident.id.desc())
+            .limit(limit + 1)
+            .all()
+        )
+        if len(incidents) > limit:
+            incidents = incidents[:limit]
+            response.headers["X-Next-Cursor"] = _encode_cursor(incidents[-1])
+
         return [
             {
                 "id": i.id,
                 "org_incident_id": i.org_incident_id,
                 "event_id": getattr(i, "event_id", None),
                 "title": i.title,
-                "description": i.description,
+                "source": i.source,
                 "severity": i.severity,
                 "status": i.status,
-                "response_notes": i.response_notes,
                 "alert_count": getattr(i, "alert_count", 1),
                 "timestamp": i.timestamp,
+                "first_seen": i.first_seen,
+                "last_seen": i.last_seen,
                 "assignees": [{"username": u.username, "role": u.role} for u in i.assignees]
             }
             for i in incidents
         ]
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -119,6 +193,27 @@ def get_all_incidents(db: Session = Depends(get_db), current_user: User = Depend
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/stats", response_model=dict)
+def get_incident_stats(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """
+    Aggregates for dashboards: counts by severity, status and source plus
+    hourly (24h) and daily (30d) histograms of new incidents. Admins get the
+    whole organization, served from incrementally maintained counters;
+    analysts and viewers get the incidents they can list (their own and
+    those of servers assigned to them), aggregated in the DB per request.
+    """
+    if current_user.organization_id is None:
+        raise HTTPException(status_code=400, detail="User has no organization")
+    if current_user.role == 'admin':
+        stats = incident_stats.snapshot(db, current_user.organization_id)
+    else:
+        hostnames = [s.hostname for s in current_user.assigned_servers]
+        visible = or_(Incident.user_id == current_user.id, Incident.source.in_(hostnames))
+        stats = incident_stats.scoped_snapshot(db, current_user.organization_id, visible)
+    stats["generated_at"] = datetime.utcnow().isoformat()
+    return stats
+
+
 @router.get("/{incident_id}", response_model=dict)
 def get_incident(incident_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     incident = _get_incident_scoped(incident_id, current_user, db)
@@ -133,27 +228,62 @@ def get_incident(incident_id: int, db: Session = Depends(get_db), current_user:
         "response_notes": incident.response_notes,
         "alert_count": getattr(incident, "alert_count", 1),
         "timestamp": incident.timestamp,
+        "first_seen": incident.first_seen,
+        "last_seen": incident.last_seen,
         "assignees": [{"username": u.username, "role": u.role} for u in incident.assignees]
     }
 
 
+@router.get("/{incident_id}/events", response_model=List[dict])
+def get_incident_events(incident_id: int, limit: int = 50, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """Most recent events merged into this incident (newest first)."""
+    _get_incident_scoped(incident_id, current_user, db)
+    limit = max(1, min(limit, 500))
+    events = db.query(IncidentEvent).filter(IncidentEvent.incident_id == incident_id).order_by(IncidentEvent.id.desc()).limit(limit).all()
+
+    return [
+        {
+            "id": e.id,
+            "event_id": e.event_id,
+            "event_type": e.event_type,
+            "summary": e.summary,
+            "timestamp": e.timestamp
+        }
+        for e in events
+    ]
+
+
 @router.delete("/{incident_id}", response_model=dict)
 def delete_incident(incident_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     incident = _get_incident_scoped(incident_id, current_user, db)
 
+    db.query(IncidentEvent).filter(IncidentEvent.incident_id == incident.id).delete(synchronize_session=False)
+    incident_stats.deleted(db, incident)
     db.delete(incident)
     db.commit()
+    incident_throttle.forget_incident(incident_id)
     return {"message": "Incident deleted successfully"}
 
 
 @router.put("/{incident_id}/update-status")
-async def update_incident_status(incident_id: int, new_status: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def update_incident_status(incident_id: int, new_status: str, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    organization_id, events = await db.run_sync(_update_status, incident_id, new_status, current_user)
+
+    # Broadcast live update, then the note for the status change
+    for event in events:
+        await broadcaster.publish(event, organization_id=organization_id)
+
+    return {"message": "Status updated successfully"}
+
+
+def _update_status(db: Session, incident_id: int, new_status: str, current_user: User):
+    """Status change + its system note in one commit. Returns (organization_id, events to broadcast)."""
+    current_user = db.merge(current_user, load=False)
     incident = _get_incident_scoped(incident_id, current_user, db)
 
     old_status = incident.status
     incident.status = new_status
-    db.commit()
-    db.refresh(incident)
+    incident_stats.changed(db, incident.organization_id, "status", old_status, new_status)
 
     # 1. Log as System Note
     from src.models.incident_note import IncidentNote
@@ -166,29 +296,28 @@ async def update_incident_status(incident_id: int, new_status: str, db: Session
     )
     db.add(system_note)
     db.commit()
+    incident_throttle.forget_incident(incident_id)
+    db.refresh(incident)
 
-    # Broadcast live update
-    await broadcaster.publish({
-        "type": "status_update",
-        "incident_id": incident.id,
-        "new_status": incident.status,
-        "timestamp": str(incident.updated_at)
-    }, organization_id=incident.organization_id)
-    
-    # Broadcast note for the status change
-    await broadcaster.publish({
-        "type": "note_added",
-        "incident_id": incident.id,
-        "note": {
-            "id": system_note.id,
-            "content": system_note.content,
-            "user": current_user.username,
-            "timestamp": system_note.timestamp.isoformat(),
-            "is_system": True
-        }
-    }, organization_id=incident.organization_id)
-
-    return {"message": "Status updated successfully"}
+    return incident.organization_id, [
+        {
+            "type": "status_update",
+            "incident_id": incident.id,
+            "new_status": incident.status,
+            "timestamp": str(incident.updated_at)
+        },
+        {
+            "type": "note_added",
+            "incident_id": incident.id,
+            "note": {
+                "id": system_note.id,
+                "content": system_note.content,
+                "user": current_user.username,
+                "timestamp": system_note.timestamp.isoformat(),
+                "is_system": True
+            }
+        },
+    ]
 
 
 # ------------------------------------------------------------------
@@ -216,11 +345,35 @@ def get_incident_notes(incident_id: int, db: Session = Depends(get_db), current_
     ]
 
 @router.post("/{incident_id}/notes")
-async def create_incident_note(incident_id: int, payload: dict, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def create_incident_note(incident_id: int, payload: dict, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     # 1. Access Control: Viewers cannot post
     if current_user.role == 'viewer':
          raise HTTPException(status_code=403, detail="Viewers cannot add notes.")
 
+    organization_id, note_payload = await db.run_sync(_add_note, incident_id, payload, current_user)
+
+    # Broadcast Note
+    await broadcaster.publish({
+        "type": "note_added",
+        "incident_id": incident_id,
+        "note": note_payload
+    }, organization_id=organization_id)
+    
+    # TODO: Broadcast Notification to specific users? 
+    # For now, frontend will poll or we need a 'private' channel. 
+    # Since existing channel is global for org events? Actually our SSE is unfiltered properly yet?
+    # SSE right now is technically hitting all listeners connected to that endpoint.
+    # To notify effectively, we'd need a user-specific SSE channel or filter on frontend.
+    # Let's rely on polling for notifications for MVP or assume global stream allows filtering by user_id if we send it?
+    # Security risk if we send private notifs to public stream.
+    # So we will rely on polling for notifications bell for now.
+
+    return {"message": "Note added", "id": note_payload["id"]}
+
+
+def _add_note(db: Session, incident_id: int, payload: dict, current_user: User):
+    """Store the note and mention notifications. Returns (organization_id, note payload)."""
+    current_user = db.merge(current_user, load=False)
     from src.models.incident_note import IncidentNote
     from src.models.notification import Notification
     import re
@@ -288,8 +441,7 @@ async def create_incident_note(incident_id: int, payload: dict, db: Session = De
     db.commit()
     db.refresh(new_note)
 
-    # Broadcast Note
-    note_payload = {
+    return incident.organization_id, {
         "id": new_note.id,
         "content": new_note.content,
         "user": current_user.username,
@@ -297,22 +449,6 @@ async def create_incident_note(incident_id: int, payload: dict, db: Session = De
         "timestamp": new_note.timestamp.isoformat(),
         "is_system": False
     }
-    await broadcaster.publish({
-        "type": "note_added",
-        "incident_id": incident.id,
-        "note": note_payload
-    }, organization_id=incident.organization_id)
-    
-    # TODO: Broadcast Notification to specific users? 
-    # For now, frontend will poll or we need a 'private' channel. 
-    # Since existing channel is global for org events? Actually our SSE is unfiltered properly yet?
-    # SSE right now is technically hitting all listeners connected to that endpoint.
-    # To notify effectively, we'd need a user-specific SSE channel or filter on frontend.
-    # Let's rely on polling for notifications for MVP or assume global stream allows filtering by user_id if we send it?
-    # Security risk if we send private notifs to public stream.
-    # So we will rely on polling for notifications bell for now.
-
-    return {"message": "Note added", "id": new_note.id}
 
 
 @router.get("/{incident_id}/candidates", response_model=List[dict])
@@ -384,12 +520,23 @@ def title_case_users(users):
 
 
 @router.post("/{incident_id}/assign")
-async def assign_incident(incident_id: int, payload: dict, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def assign_incident(incident_id: int, payload: dict, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     """
     Assign incident V2.
     - Analyst: Can only "take" unassigned incidents ("assign_to": "me").
     - Admin: Can multi-assign anyone found in candidates.
     """
+    response, organization_id, events = await db.run_sync(_assign, incident_id, payload, current_user)
+
+    for event in events:
+        await broadcaster.publish(event, organization_id=organization_id)
+
+    return response
+
+
+def _assign(db: Session, incident_id: int, payload: dict, current_user: User):
+    """Returns (response, organization_id, events to broadcast)."""
+    current_user = db.merge(current_user, load=False)
     incident = _get_incident_scoped(incident_id, current_user, db)
 
     assign_input = payload.get("assign_to", "") # Can be string "me" or list ["@bob", "@alice"] or string "@bob @alice"
@@ -409,23 +556,21 @@ async def assign_incident(incident_id: int, payload: dict, db: Session = Depends
         # Execute "Take"
         if current_user not in incident.assignees:
             incident.assignees.append(current_user)
-            db.commit()
+            # System Note, committed with the assignment
+            _log_assignment_note(db, incident, current_user, [current_user])
             db.refresh(incident)
             
             # Broadcast (No Notification DB Record needed - self action)
-            await broadcaster.publish({
+            event = {
                 "type": "assignment_update",
                 "incident_id": incident.id,
                 "assignees": [{"username": u.username, "role": u.role} for u in incident.assignees],
                 "timestamp": str(datetime.utcnow())
-            }, organization_id=incident.organization_id)
-            
-            # System Note
-            _log_assignment_note(db, incident, current_user, [current_user])
+            }
             
-            return {"message": "You have taken this incident.", "assignees": _serialize_assignees(incident)}
+            return {"message": "You have taken this incident.", "assignees": _serialize_assignees(incident)}, incident.organization_id, [event]
         
-        return {"message": "Already assigned to you."}
+        return {"message": "Already assigned to you."}, None, []
 
     # ADMIN FLOW
     if current_user.role == 'admin':
@@ -433,7 +578,7 @@ async def assign_incident(incident_id: int, payload: dict, db: Session = Depends
         target_usernames = _parse_assignment_input(assign_input, current_user)
         
         if not target_usernames:
-             return {"message": "No users selected."}
+             return {"message": "No users selected."}, None, []
              
         # Resolve Users (Server-side candidates check implied? Or strict lookup?)
         # Requirement: "Validate before submit... disable if not in candidates" (Frontend).
@@ -469,10 +614,7 @@ async def assign_incident(incident_id: int, payload: dict, db: Session = Depends
                 newly_assigned.append(u)
         
         if not newly_assigned:
-             return {"message": "Users already assigned."}
-             
-        db.commit()
-        db.refresh(incident)
+             return {"message": "Users already assigned."}, None, []
         
         # Notifications (Admins -> Others)
         from src.models.notification import Notification
@@ -486,20 +628,20 @@ async def assign_incident(incident_id: int, payload: dict, db: Session = Depends
                     timestamp=datetime.utcnow()
                 )
                 db.add(notif)
-        db.commit()
+
+        # System Note, committed with the assignment and notifications
+        _log_assignment_note(db, incident, current_user, newly_assigned)
+        db.refresh(incident)
 
         # Broadcast
-        await broadcaster.publish({
+        event = {
             "type": "assignment_update",
             "incident_id": incident.id,
             "assignees": _serialize_assignees(incident),
             "timestamp": str(datetime.utcnow())
-        }, organization_id=incident.organization_id)
-        
-        # System Note
-        _log_assignment_note(db, incident, current_user, newly_assigned)
+        }
 
-        return {"message": f"Assigned {len(newly_assigned)} users.", "assignees": _serialize_assignees(incident)}
+        return {"message": f"Assigned {len(newly_assigned)} users.", "assignees": _serialize_assignees(incident)}, incident.organization_id, [event]
 
     # Fallback
     raise HTTPException(status_code=403, detail="Permission denied.")
@@ -1,17 +1,20 @@
 from fastapi import APIRouter, HTTPException, Depends, Header
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 import json
+import logging
 import os
 from kafka import KafkaProducer
 from sqlalchemy.orm import Session
 from datetime import datetime
 
-from src.database import get_db
+from src.database import get_db, SessionLocal
 from src.models.user import User
 from src.models.server import Server
 
 router = APIRouter(prefix="/ingest", tags=["Ingest"])
-from src.services.anomaly_detector import detect_anomaly
+from src.services.anomaly_detector import detect_anomaly, detect_anomalies_batch
+
+logger = logging.getLogger("ctdirp.ingest")
 
 # Kafka settings
 KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
@@ -33,7 +36,7 @@ def get_producer():
             )
         except Exception as e:
             # log error but don't crash app, just disable producer
-            print(f"Kafka Producer Initialization Failed: {e}")
+            logger.error(f"Kafka Producer Initialization Failed: {e}")
             return None
     return producer
 
@@ -60,16 +63,17 @@ api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token", auto_error=False)
 
 from src.routes.auth import get_current_user
+from src.auth.principal_cache import principal_cache
 
-async def get_user_for_ingest(
+def get_user_for_ingest(
     x_api_key: Optional[str] = Security(api_key_header),
     token: Optional[str] = Security(oauth2_scheme),
     db: Session = Depends(get_db)
 ):
     # 1. Try API Key
     if x_api_key:
-        user = db.query(User).filter(User.api_key == x_api_key).first()
-        if user:
+        user = principal_cache.resolve_api_key(db, x_api_key)
+        if user and getattr(user, "is_active", True) is not False:
             return user
     
     # 2. Try JWT Token (if no API key or invalid)
@@ -82,7 +86,132 @@ async def get_user_for_ingest(
     raise HTTPException(status_code=401, detail="Missing or Invalid Authentication (API Key or Bearer Token required)")
 
 from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from src.core.limiter import limiter
+from src.auth.permissions import admin_only
+from src.services.ingest_queue import ingest_queue, QueueFullError
+from src.services.heartbeat_buffer import heartbeat_buffer
+from src.services.liveness import liveness
+
+# ----------------------------
+# Shared pipeline (single + batch ingest)
+# ----------------------------
+
+def _tag_event(payload: EventPayload, user: User) -> dict:
+    """Event dict tagged with User ID AND Organization ID (for Rule Isolation)."""
+    payload.generate_id()
+    event_dict = payload.dict()
+    event_dict["user_id"] = user.id
+    event_dict["organization_id"] = getattr(user, "organization_id", None)
+    return event_dict
+
+
+def _track_server(payload: EventPayload, user: User, db: Session):
+    """
+    SERVER TRACKING (Asset Inventory): register or refresh the heartbeat's server. Does not commit.
+    Known servers are coalesced in heartbeat_buffer (no DB round trip) once it is running.
+    """
+    server_id = heartbeat_buffer.lookup(user.id, payload.source)
+    if server_id is not None and heartbeat_buffer.running:
+        heartbeat_buffer.record(
+            server_id,
+            ip_address=payload.data.get("ip") if payload.data else None,
+            os_info=payload.data.get("os") if payload.data else None,
+        )
+        liveness.beat_on_commit(db, server_id, user.organization_id, payload.source)
+        return None
+
+    server = db.query(Server).filter(Server.hostname == payload.source, Server.user_id == user.id).first()
+    if not server:
+        # Register new server
+        server = Server(
+            user_id=user.id,
+            hostname=payload.source,
+            name=payload.source, # Default name is hostname
+            ip_address=payload.data.get("ip") if payload.data else None,
+            os_info=payload.data.get("os") if payload.data else None,
+            status="online",
+            last_heartbeat=datetime.utcnow()
+        )
+        db.add(server)
+        # Flush so a second heartbeat for the same host in one batch finds it
+        db.flush()
+    else:
+        # Update existing
+        server.last_heartbeat = datetime.utcnow()
+        server.status = "online"
+        if payload.data:
+            if payload.data.get("ip"): server.ip_address = payload.data.get("ip")
+            if payload.data.get("os"): server.os_info = payload.data.get("os")
+        # Only rows loaded from the DB are known to be committed
+        heartbeat_buffer.remember(user.id, payload.source, server.id)
+    liveness.beat_on_commit(db, server.id, user.organization_id, payload.source)
+    return server
+
+
+_NOT_SCORED = object()
+
+
+def _detect_ml_anomaly(event_dict: dict, user: User, db: Session, commit: bool = True, anomaly=_NOT_SCORED):
+    """
+    ML ANOMALY DETECTION: feed heartbeat anomalies back into the Rule Engine as incident triggers.
+    Batch callers pass the `anomaly` already computed by detect_anomalies_batch.
+    """
+    try:
+        if anomaly is _NOT_SCORED:
+            # Pass dictionary representation to detector with ORG CONTEXT
+            anomaly = detect_anomaly(event_dict, organization_id=user.organization_id)
+
+        if anomaly:
+            logger.info(f"🧠 ML DETECTED ANOMALY: {anomaly}")
+            ml_alert_payload = {
+                "source": event_dict["source"],
+                "event_type": "ml_anomaly",
+                "user_id": user.id,
+                "organization_id": user.organization_id, # PASS ORG ID
+                "details": anomaly['reason'],
+                "score": anomaly['score'],
+                "severity": "medium", # ML findings are usually medium until verified
+                "data": anomaly['features']
+            }
+            # Process this new anomaly event immediately
+            # (Note: This might create a second broadcast, which is fine)
+            from src.services.rule_engine import process_event as process_rule_event
+            process_rule_event(ml_alert_payload, db, commit=commit)
+
+    except Exception as e:
+        if not commit:
+            raise
+        logger.exception(f"Error in anomaly detection pipeline: {e}")
+
+
+def _sse_payload(event_dict: dict, results: list) -> dict:
+    """
+    Live update for the dashboard. rule_engine returns result dicts that carry
+    the ORM "incident"; the first one (if any) is attached to the payload.
+    None when every result was absorbed by the incident throttle (the
+    flusher reports those as one alerts_merged event).
+    """
+    if results and all(r.get("throttled") for r in results):
+        return None
+    sse_payload = {
+        "type": "event",
+        "event": event_dict,
+        "rule_results": [r["title"] for r in results] if results else None
+    }
+    if results:
+        inc_data = results[0].get("incident")
+        if inc_data:
+            sse_payload["incident"] = {
+                "id": inc_data.id,
+                "title": inc_data.title,
+                "severity": inc_data.severity,
+                "status": inc_data.status,
+                "timestamp": inc_data.timestamp.isoformat() if inc_data.timestamp else None
+            }
+    return sse_payload
+
 
 @router.post("/")
 @limiter.limit("5/second")
@@ -96,138 +225,233 @@ async def ingest_event(
     Secure Ingest Endpoint:
     1. Validates X-API-Key.
     2. Updates Server Inventory (Heartbeat).
-    3. Sends event to Kafka (tagged with user_id).
+    3. Runs ML anomaly detection + Rule Engine and broadcasts results (Direct Mode).
     """
-    
-    # Generate ID if missing
-    payload.generate_id()
-    event_dict = payload.dict()
-    
-    # Tag with User ID AND Organization ID (for Rule Isolation)
-    event_dict["user_id"] = user.id
-    if hasattr(user, "organization_id"):
-        event_dict["organization_id"] = user.organization_id
-    else:
-        # Fallback for old User objects in memory? (Shouldn't happen with fresh fetch)
-        event_dict["organization_id"] = None
+    event_dict = _tag_event(payload, user)
 
     # ----------------------------
-    # 1) SERVER TRACKING (Asset Inventory)
+    # 0) QUEUED MODE: hand off to the worker pool, answer 202 immediately
     # ----------------------------
-    if payload.event_type == "system_heartbeat":
-        server = db.query(Server).filter(Server.hostname == payload.source, Server.user_id == user.id).first()
-        if not server:
-            # Register new server
-            server = Server(
-                user_id=user.id,
-                hostname=payload.source,
-                name=payload.source, # Default name is hostname
-                ip_address=payload.data.get("ip") if payload.data else None,
-                os_info=payload.data.get("os") if payload.data else None,
-                status="online",
-                last_heartbeat=datetime.utcnow()
+    if ingest_queue.enabled:
+        try:
+            ingest_queue.submit((payload, event_dict, user.id))
+        except QueueFullError:
+            raise HTTPException(
+                status_code=503,
+                detail="Ingest queue is full, retry later",
+                headers={"Retry-After": "1"}
             )
-            db.add(server)
-        else:
-            # Update existing
-            server.last_heartbeat = datetime.utcnow()
-            server.status = "online"
-            if payload.data:
-                if payload.data.get("ip"): server.ip_address = payload.data.get("ip")
-                if payload.data.get("os"): server.os_info = payload.data.get("os")
-        
-        db.commit()
+        return JSONResponse(status_code=202, content={
+            "status": "accepted",
+            "message": "Event queued for processing",
+            "event_id": payload.event_id
+        })
 
     # ----------------------------
-    # 1.5) ML ANOMALY DETECTION
+    # 1) DIRECT PROCESSING (No Kafka): server tracking, ML + rules, one commit
     # ----------------------------
+    try:
+        from src.services.broadcaster import broadcaster
+
+        # ML scoring + rule evaluation are CPU work on a sync session: keep them off the event loop
+        broadcast = await run_in_threadpool(_process_unit, db, payload, event_dict, user)
+    except Exception as e:
+        await run_in_threadpool(db.rollback)
+        # Return 500 so the agent knows the event was not processed.
+        raise HTTPException(status_code=500, detail=f"Processing error: {e}")
+
+    # Broadcast only what was committed (scoped to the event's organization)
+    if broadcast is not None:
+        sse_payload, organization_id = broadcast
+        await broadcaster.publish(sse_payload, organization_id=organization_id)
+
+    return {
+        "status": "ok",
+        "message": "Event ingested successfully",
+        "event_id": payload.event_id
+    }
+
+
+def _process_unit(db: Session, payload: EventPayload, event_dict: dict, user: User) -> Optional[tuple]:
+    """
+    Full pipeline for one event as a single unit of work: server tracking,
+    ML feedback and rule results are flushed, then committed once.
+    Returns (sse_payload, organization_id), read before the commit expires
+    the ORM objects, or None when there is nothing to broadcast.
+    Raises on failure; the caller rolls back.
+    """
+    from src.services.rule_engine import process_event
+
     if payload.event_type == "system_heartbeat":
-        try:
-            # Pass dictionary representation to detector with ORG CONTEXT
-            anomaly = detect_anomaly(event_dict, organization_id=user.organization_id)
-            
-            if anomaly:
-                print(f"🧠 ML DETECTED ANOMALY: {anomaly}")
-                # Feed back into Rule Engine as an Incident Trigger
-                ml_alert_payload = {
-                    "source": payload.source,
-                    "event_type": "ml_anomaly",
-                    "user_id": user.id,
-                    "organization_id": user.organization_id, # PASS ORG ID
-                    "details": anomaly['reason'],
-                    "score": anomaly['score'],
-                    "severity": "medium", # ML findings are usually medium until verified
-                    "data": anomaly['features']
-                }
-                # Process this new anomaly event immediately
-                # (Note: This might create a second broadcast, which is fine)
-                from src.services.rule_engine import process_event as process_rule_event
-                process_rule_event(ml_alert_payload, db)
+        _track_server(payload, user, db)
+        _detect_ml_anomaly(event_dict, user, db, commit=False)
+    results = process_event(event_dict, db, commit=False)
+    sse_payload = _sse_payload(event_dict, results)
+    organization_id = user.organization_id
+    db.commit()
+    return (sse_payload, organization_id) if sse_payload is not None else None
+
+
+def _process_queued_event(job) -> tuple:
+    """
+    Ingest queue handler (runs in a worker thread with its own session).
+    Same pipeline as ingest_event, committed once per event.
+    """
+    payload, event_dict, user_id = job
+
+    db = SessionLocal()
+    try:
+        user = db.get(User, user_id)
+        if user is None:
+            raise ValueError(f"User {user_id} no longer exists")
+        return _process_unit(db, payload, event_dict, user)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+ingest_queue.handler = _process_queued_event
+
+
+@router.get("/queue/stats", dependencies=[Depends(admin_only)])
+def ingest_queue_stats():
+    """Depth, throughput and lag of the Direct Mode ingest queue."""
+    return ingest_queue.stats()
+
+
+@router.get("/consumers/stats", dependencies=[Depends(admin_only)])
+def kafka_consumer_stats():
+    """Per-worker throughput and partition assignment of the Kafka consumer pool."""
+    from src.services.kafka_consumer import consumer_pool
+    return {"workers": consumer_pool.snapshot()}
 
-        except Exception as e:
-            print(f"Error in anomaly detection pipeline: {e}")
 
 # ----------------------------
-    # 2) DIRECT PROCESSING (No Kafka)
-    # ----------------------------
+# BATCH INGEST
+# ----------------------------
+INGEST_BATCH_MAX_EVENTS = int(os.getenv("INGEST_BATCH_MAX_EVENTS", "500"))
+
+
+def _parse_batch_body(body: bytes, content_type: str) -> list:
+    """Accept a JSON array, {"events": [...]} or NDJSON (one event per line)."""
+    text = body.decode("utf-8", errors="replace").strip()
+    if not text:
+        return []
+
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        items = []
+        for line_no, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid JSON on line {line_no}")
+        return items
+
     try:
-        # Import internally to avoid circular deps if any, 
-        # though rule_engine shouldn't import ingest.
-        from src.services.rule_engine import process_event
-        
-        # Process directly (Synchronous)
-        results = process_event(event_dict, db)
-        
-        # Optional: Broadcast to Frontend via SSE (if main.py supports it easily, 
-        # but rule_engine usually returns results. 
-        # For simplicity in this "Direct Mode", we verify specific logic in rule_engine.
-        # Note: The original Kafka consumer also did broadcasting. 
-        # Ideally, `process_event` should just return results, and WE handle broadcasting here.
-        # But let's check if rule_engine does broadcasting? 
-        # Checking previous file view... rule_engine returns a list of result dicts.
-        # It does NOT broadcast. The Kafka consumer did the broadcasting.
-        
-        # We should probably add a simple broadcast here if we want the frontend to see it live.
-        # Let's import the broadcaster.
-        from src.services.broadcaster import broadcaster
-        import asyncio
-        
-        # We need the main loop to broadcast? 
-        # In a route handler (async), we can just await broadcaster.publish()!
-        # Much simpler than the thread hack in consumer.
-        
-        sse_payload = {
-            "type": "event",
-            "event": event_dict,
-            "rule_results": [r["title"] for r in results] if results else None
-        }
-        
-        # If an incident was created/merged, we should try to include it.
-        # The rule_engine returns a list of result dicts that contain "incident": object.
-        # Let's pick the first one for the payload if it exists.
-        if results:
-            inc_data = results[0].get("incident")
-            if inc_data:
-                # inc_data is the ORM object in rule_engine.py
-                sse_payload["incident"] = {
-                    "id": inc_data.id,
-                    "title": inc_data.title,
-                    "severity": inc_data.severity,
-                    "status": inc_data.status,
-                    "timestamp": inc_data.timestamp.isoformat() if inc_data.timestamp else None
-                }
-        
-        # Fire and forget broadcast (scoped to the event's organization)
-        await broadcaster.publish(sse_payload, organization_id=user.organization_id)
-            
+        parsed = json.loads(text)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array of events or NDJSON")
+    if isinstance(parsed, dict) and isinstance(parsed.get("events"), list):
+        parsed = parsed["events"]
+    if not isinstance(parsed, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array of events or NDJSON")
+    return parsed
+
+
+def _process_batch(db: Session, parsed: list, user: User) -> tuple:
+    """
+    Score and evaluate the parsed events of a batch in one transaction
+    (a savepoint per event). Runs in the threadpool.
+    Returns (per-event results, SSE payloads to publish after the commit).
+    """
+    from src.services.rule_engine import process_event
+
+    results = []
+    broadcasts = []
+
+    # Score every heartbeat up front: one score_samples call per model
+    anomalies = detect_anomalies_batch([e for _, _, e in parsed], organization_id=user.organization_id)
+
+    for (index, payload, event_dict), anomaly in zip(parsed, anomalies):
+        try:
+            with db.begin_nested():
+                if payload.event_type == "system_heartbeat":
+                    _track_server(payload, user, db)
+                    _detect_ml_anomaly(event_dict, user, db, commit=False, anomaly=anomaly)
+                rule_results = process_event(event_dict, db, commit=False)
+        except Exception as e:
+            results.append({"index": index, "event_id": payload.event_id, "status": "error", "error": f"Processing error: {e}"})
+            continue
+
+        results.append({
+            "index": index,
+            "event_id": payload.event_id,
+            "status": "ok",
+            "incident_ids": [r["incident_id"] for r in rule_results]
+        })
+        sse_payload = _sse_payload(event_dict, rule_results)
+        if sse_payload is not None:
+            broadcasts.append(sse_payload)
+
+    db.commit()
+    return results, broadcasts
+
+
+@router.post("/batch")
+@limiter.limit("5/second")
+async def ingest_batch(
+    request: Request,
+    user: User = Depends(get_user_for_ingest),
+    db: Session = Depends(get_db)
+):
+    """
+    Batch Ingest Endpoint for agents that buffer events.
+    Authenticates once, then runs server tracking, ML and rule evaluation for
+    every event inside ONE transaction (a savepoint per event, so a bad event
+    is reported without discarding the rest). Returns per-event results in
+    request order. Body size is capped by the global 50KB limit and the event
+    count by INGEST_BATCH_MAX_EVENTS.
+    """
+    items = _parse_batch_body(await request.body(), request.headers.get("content-type", ""))
+    if len(items) > INGEST_BATCH_MAX_EVENTS:
+        raise HTTPException(status_code=413, detail=f"Too many events in batch (Max {INGEST_BATCH_MAX_EVENTS})")
+
+    from src.services.broadcaster import broadcaster
+
+    results = []
+    parsed = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("event must be a JSON object")
+            payload = EventPayload(**item)
+        except (ValidationError, ValueError, TypeError) as e:
+            results.append({"index": index, "status": "error", "error": str(e)})
+            continue
+        parsed.append((index, payload, _tag_event(payload, user)))
+
+    organization_id = user.organization_id
+    try:
+        # Scoring and rule evaluation for the whole batch: keep it off the event loop
+        processed, broadcasts = await run_in_threadpool(_process_batch, db, parsed, user)
     except Exception as e:
-        # Log but don't fail the request 500 if rule engine crashes, 
-        # though for direct ingestion, maybe we should?
-        # Let's return 500 so user knows it failed.
+        await run_in_threadpool(db.rollback)
         raise HTTPException(status_code=500, detail=f"Processing error: {e}")
+    results.extend(processed)
 
+    # Broadcast only after the batch is durable
+    for sse_payload in broadcasts:
+        await broadcaster.publish(sse_payload, organization_id=organization_id)
+
+    results.sort(key=lambda r: r["index"])
+    accepted = sum(1 for r in results if r["status"] == "ok")
     return {
         "status": "ok",
-        "message": "Event ingested successfully",
-        "event_id": payload.event_id
+        "accepted": accepted,
+        "rejected": len(results) - accepted,
+        "results": results
     }
@@ -3,8 +3,9 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from src.database import SessionLocal
 from src.models.rule import Rule
-from pydantic import BaseModel
-from typing import List, Optional
+from src.services.rule_cache import rule_cache
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Literal, Optional
 import json
 from datetime import datetime
 
@@ -24,6 +25,20 @@ class ConditionModel(BaseModel):
     op: str     # equals, contains, gt, lt
     value: Optional[str] = None
 
+class WindowModel(BaseModel):
+    """Fire only when matching events aggregate past `threshold` within `seconds`."""
+    seconds: float = Field(..., gt=0, le=86400)
+    threshold: float
+    agg: Literal["count", "sum"] = "count"
+    field: Optional[str] = None     # summed value for agg="sum", e.g. "data.net_out_mb"
+    group_by: Optional[str] = "source"  # separate window per value of this field
+
+    @model_validator(mode="after")
+    def _sum_needs_field(self):
+        if self.agg == "sum" and not self.field:
+            raise ValueError("window.field is required when agg is 'sum'")
+        return self
+
 class RuleCreateModel(BaseModel):
     name: str
     description: Optional[str] = None
@@ -31,6 +46,7 @@ class RuleCreateModel(BaseModel):
     severity: Optional[str] = "medium"
     enabled: Optional[bool] = True
     target_server: Optional[str] = None
+    window: Optional[WindowModel] = None
 
 @router.post("/", response_model=dict)
 def create_rule(payload: RuleCreateModel, current_user = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -43,11 +59,13 @@ def create_rule(payload: RuleCreateModel, current_user = Depends(get_current_use
         created_at=datetime.utcnow(),
         organization_id=current_user.organization_id,
         organization=current_user.organization,
-        target_server=payload.target_server
+        target_server=payload.target_server,
+        window_spec=payload.window.model_dump_json() if payload.window else None
     )
     db.add(rule)
     db.commit()
     db.refresh(rule)
+    rule_cache.invalidate(current_user.organization_id)
     return {"message": "Rule created", "id": rule.id}
 
 @router.get("/", response_model=List[dict])
@@ -65,6 +83,7 @@ def list_rules(current_user = Depends(get_current_user), db: Session = Depends(g
             "enabled": r.enabled,
             "created_at": r.created_at,
             "target_server": r.target_server,
+            "window": r.get_window(),
         })
     return output
 
@@ -77,4 +96,5 @@ def delete_rule(rule_id: int, current_user = Depends(get_current_user), db: Sess
     
     db.delete(rule)
     db.commit()
+    rule_cache.invalidate(current_user.organization_id)
     return {"message": "Rule deleted"}
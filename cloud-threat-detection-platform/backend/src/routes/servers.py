@@ -12,9 +12,14 @@ from src.routes.auth import get_current_user, get_current_user_by_api_key
 from src.auth.permissions import admin_only
 from src.services.rule_engine import process_event
 from src.services.anomaly_detector import detect_anomaly
+from src.services.heartbeat_buffer import heartbeat_buffer
+from src.services.liveness import liveness, SERVER_OFFLINE_AFTER_SECONDS
 from fastapi.responses import FileResponse
+import logging
 import os
 
+logger = logging.getLogger("ctdirp.servers")
+
 router = APIRouter(prefix="/servers", tags=["Servers"])
 # Base path for static files
 STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "static")
@@ -70,10 +75,7 @@ from src.services.anomaly_detector import manager
 @router.get("/ml/status")
 def get_ml_status(user: User = Depends(get_current_user)):
     """Get the training status of all ML Engines for this Org."""
-    org_prefix = f"{user.organization_id}:"
-    my_detectors = [d for k, d in manager.detectors.items() if str(k).startswith(org_prefix)]
-    
-    return [d.get_status() for d in my_detectors]
+    return manager.statuses(user.organization_id)
 
 @router.post("/ml/reset")
 def reset_ml_model(payload: MLResetPayload, user: User = Depends(get_current_user)):
@@ -81,8 +83,7 @@ def reset_ml_model(payload: MLResetPayload, user: User = Depends(get_current_use
     if user.role != 'admin':
         raise HTTPException(status_code=403, detail="Only admins can reset the ML brain.")
     
-    target_key = f"{user.organization_id}:{payload.source}"
-    detector = manager.detectors.get(target_key)
+    detector = manager.find(user.organization_id, payload.source)
     
     if detector:
         detector.reset()
@@ -96,8 +97,7 @@ def approve_ml_model(payload: MLResetPayload, user: User = Depends(get_current_u
     if user.role != 'admin':
         raise HTTPException(status_code=403, detail="Only admins can approve the ML brain.")
     
-    target_key = f"{user.organization_id}:{payload.source}"
-    detector = manager.detectors.get(target_key)
+    detector = manager.find(user.organization_id, payload.source)
     
     if detector:
         detector.approve()
@@ -122,8 +122,24 @@ def server_heartbeat(
     """
     Agent Heartbeat.
     Registers server if new (scoped to API Key owner).
-    Updates last_heartbeat if existing.
+    Updates last_heartbeat if existing (coalesced in memory once heartbeat_buffer runs).
     """
+    server_id = heartbeat_buffer.lookup(user.id, payload.hostname)
+    if server_id is not None and heartbeat_buffer.running:
+        heartbeat_buffer.record(server_id, ip_address=payload.ip, cpu_usage=payload.cpu, ram_usage=payload.ram)
+    else:
+        server_id = _write_heartbeat(payload, user, db)
+    _check_heartbeat(payload, user, db)
+    # Server write and any incidents from the checks: one transaction
+    db.commit()
+    heartbeat_buffer.remember(user.id, payload.hostname, server_id)
+    if liveness.running:
+        liveness.beat(server_id, user.organization_id, payload.hostname)
+    return {"status": "acknowledged", "server_id": server_id}
+
+
+def _write_heartbeat(payload: HeartbeatSchema, user: User, db: Session) -> int:
+    """Write-through path: register the server or update it in the DB."""
     server = db.query(Server).filter(
         Server.hostname == payload.hostname,
         Server.user_id == user.id
@@ -151,78 +167,86 @@ def server_heartbeat(
         server.ram_usage = payload.ram
         server.status = "online" # DB status (informational)
         
-    db.commit()
-    db.refresh(server)
-    
+    db.flush()
+    return server.id
+
+
+def _check_heartbeat(payload: HeartbeatSchema, user: User, db: Session):
+    """
+    Run static rules and the ML detector on the heartbeat's metrics.
+    Writes are flushed into the caller's transaction inside a savepoint, so a
+    failing check never loses the heartbeat itself.
+    """
     # -----------------------------------------------
     # 🔍 RULE ENGINE CHECK (Anomaly Detection)
     # -----------------------------------------------
     try:
-        # 1. Static Rules (CPU > 90%)
-        event_payload = {
-            "source": server.hostname,
-            "event_type": "system_metric",
-            "user_id": user.id,
-            "data": {
+        with db.begin_nested():
+            # 1. Static Rules (CPU > 90%)
+            event_payload = {
+                "source": payload.hostname,
+                "event_type": "system_metric",
+                "user_id": user.id,
+                "data": {
+                    "cpu": payload.cpu,
+                    "ram": payload.ram
+                },
                 "cpu": payload.cpu,
                 "ram": payload.ram
-            },
-            "cpu": payload.cpu,
-            "ram": payload.ram
-        }
-        process_event(event_payload, db)
-
-        # 2. ML Anomaly Detection (Isolation Forest)
-        ml_event = {
-            "event_type": "system_heartbeat", # detector expects this
-            "data": {"cpu": payload.cpu, "ram": payload.ram}
-        }
-        # Pass Org ID for multi-tenant isolation
-        anomaly = detect_anomaly(ml_event, organization_id=user.organization_id)
-        
-        if anomaly:
-            print(f"🧠 ML DETECTED ANOMALY: {anomaly}")
-            # Feed back into Rule Engine as an Incident Trigger
-            ml_alert_payload = {
-                "source": server.hostname,
-                "event_type": "ml_anomaly",
-                "user_id": user.id,
-                "details": anomaly['reason'],
-                "score": anomaly['score'],
-                "severity": "medium" # ML findings are usually medium until verified
             }
-            process_event(ml_alert_payload, db)
+            process_event(event_payload, db, commit=False)
+
+            # 2. ML Anomaly Detection (Isolation Forest)
+            ml_event = {
+                "event_type": "system_heartbeat", # detector expects this
+                "data": {"cpu": payload.cpu, "ram": payload.ram}
+            }
+            # Pass Org ID for multi-tenant isolation
+            anomaly = detect_anomaly(ml_event, organization_id=user.organization_id)
+        
+            if anomaly:
+                logger.info(f"🧠 ML DETECTED ANOMALY: {anomaly}")
+                # Feed back into Rule Engine as an Incident Trigger
+                ml_alert_payload = {
+                    "source": payload.hostname,
+                    "event_type": "ml_anomaly",
+                    "user_id": user.id,
+                    "details": anomaly['reason'],
+                    "score": anomaly['score'],
+                    "severity": "medium" # ML findings are usually medium until verified
+                }
+                process_event(ml_alert_payload, db, commit=False)
             
     except Exception as e:
-        print(f"Error in anomaly detection: {e}")
-
-    return {"status": "acknowledged", "server_id": server.id}
+        logger.exception(f"Error in anomaly detection: {e}")
 
 @router.get("", response_model=List[ServerResponse])
 def list_servers(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """List servers. Admins see all in Org. Analysts/Viewers see Own + Assigned."""
     
+    from sqlalchemy.orm import selectinload
+    query = db.query(Server).options(selectinload(Server.allowed_users))
     if current_user.role == 'admin':
         # Admin: See all in Organization
-        servers = db.query(Server).join(User).filter(User.organization == current_user.organization).all()
+        servers = query.join(User).filter(User.organization == current_user.organization).all()
     else:
         # Analyst/Viewer: See Own OR Assigned
         from sqlalchemy import or_
-        servers = db.query(Server).filter(
+        servers = query.filter(
             or_(
                 Server.user_id == current_user.id,
                 Server.allowed_users.any(id=current_user.id)
             )
         ).all()
-        
-        
-        # ).all() removed
-        pass
-        
-    # Dynamic Status Check & ID Population
+
+    # Status from the liveness tracker (precomputed); recompute only if it isn't running
     for s in servers:
         s.allowed_user_ids = [u.id for u in s.allowed_users] # Populate for Pydantic
-        if s.last_heartbeat and (datetime.utcnow() - s.last_heartbeat).total_seconds() > 90:
+        heartbeat_buffer.overlay(s) # Latest not-yet-flushed heartbeat
+        tracked = liveness.status(s.id) if liveness.running else None
+        if tracked:
+            s.status = tracked
+        elif s.last_heartbeat and (datetime.utcnow() - s.last_heartbeat).total_seconds() > SERVER_OFFLINE_AFTER_SECONDS:
             s.status = "offline"
     return servers
 
@@ -332,4 +356,6 @@ def delete_server(
     
     db.delete(server)
     db.commit()
+    heartbeat_buffer.forget(server_id)
+    liveness.forget(server_id)
     return {"message": "Server deleted"}
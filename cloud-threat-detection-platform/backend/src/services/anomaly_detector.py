@@ -1,10 +1,18 @@
 
+import asyncio
+import json
 import logging
 import numpy as np
 import joblib
 import os
+import queue
+import threading
+import time
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
 from sklearn.ensemble import IsolationForest
-from collections import deque
+from collections import OrderedDict, deque
+from src.services.model_store import model_store, get_buffer_store
 
 logger = logging.getLogger("ctdirp.ml")
 logger.setLevel(logging.INFO)
@@ -18,62 +26,279 @@ if not os.path.exists(MODEL_DIR):
     os.makedirs(MODEL_DIR)
 
 TRAINING_BUFFER_SIZE = 100
-ANOMALY_THRESHOLD = -0.6
+ANOMALY_THRESHOLD = -0.6  # Fallback cut-off for models without a fitted offset_
+
+# Heartbeats arriving within this window are scored together, one score_samples
+# call per model. 0 scores inline (no added latency).
+ML_SCORING_WINDOW_MS = int(os.getenv("ML_SCORING_WINDOW_MS", "0"))
+ML_SCORING_MAX_BATCH = int(os.getenv("ML_SCORING_MAX_BATCH", "1024"))
+
+# Max concurrent IsolationForest fits (process pool size). Extra jobs queue, so
+# a fleet-wide restart doesn't fork hundreds of fits. 0 trains inline.
+ML_TRAINING_WORKERS = int(os.getenv("ML_TRAINING_WORKERS", "2"))
+
+# Detectors kept in memory; idle ones beyond this are persisted and evicted (LRU).
+ML_MAX_DETECTORS = int(os.getenv("ML_MAX_DETECTORS", "5000"))
+# Preload detectors for servers seen in the last N minutes at startup (0 = off).
+ML_WARMUP_RECENT_MINUTES = int(os.getenv("ML_WARMUP_RECENT_MINUTES", "0"))
+# How often a detector re-reads its model pointer to pick up versions trained,
+# approved or reset by another worker process.
+ML_MODEL_REFRESH_SECONDS = float(os.getenv("ML_MODEL_REFRESH_SECONDS", "5"))
+
+_training_pool = None
+_training_pool_lock = threading.Lock()
+
+
+def _fit_model(X: np.ndarray) -> IsolationForest:
+    """Runs in a worker process: must stay top-level so it can be pickled."""
+    model = IsolationForest(n_estimators=100, contamination=0.05, random_state=42)
+    model.fit(X)
+    return model
+
+
+def get_training_pool() -> ProcessPoolExecutor | None:
+    """Lazily create the shared training pool (spawned: the app process is threaded)."""
+    global _training_pool
+    if ML_TRAINING_WORKERS <= 0:
+        return None
+    with _training_pool_lock:
+        if _training_pool is None:
+            _training_pool = ProcessPoolExecutor(
+                max_workers=ML_TRAINING_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"🧵 ML training pool started ({ML_TRAINING_WORKERS} workers).")
+        return _training_pool
+
+
+def shutdown_training_pool(wait: bool = False):
+    """Stop the training pool on app shutdown (queued fits are dropped)."""
+    global _training_pool
+    with _training_pool_lock:
+        if _training_pool is not None:
+            _training_pool.shutdown(wait=wait, cancel_futures=True)
+            _training_pool = None
+
+
+def extract_features(event: dict) -> list | None:
+    """5-dimensional feature vector of a heartbeat, or None if it can't be scored."""
+    if event.get("event_type") != "system_heartbeat":
+        return None
+    data = event.get("data") or {}
+    cpu = data.get("cpu")
+    ram = data.get("ram")
+    if cpu is None or ram is None:
+        return None
+    return [cpu, ram, data.get("disk_write_mb", 0.0), data.get("net_out_mb", 0.0), data.get("process_count", 0)]
+
+
+def _artifact_base(organization_id, source: str) -> str:
+    """Path (without extension) of a detector's model / state files."""
+    safe_source = "".join(c if c.isalnum() else "_" for c in source)
+    return os.path.join(MODEL_DIR, f"model_org_{organization_id}_src_{safe_source}")
+
 
 class AnomalyDetector:
     def __init__(self, organization_id: int | str = "global", source: str = "unknown"):
         self.organization_id = organization_id
         self.source = source
         # Unique model path per organization AND source
-        safe_source = "".join(c if c.isalnum() else "_" for c in source)
-        self.model_path = os.path.join(MODEL_DIR, f"model_org_{organization_id}_src_{safe_source}.pkl")
+        self.base = _artifact_base(organization_id, source)
+        self.buffer_key = os.path.basename(self.base)
+        self.state_path = self.base + ".state.json"
         
         self.model = None
+        self.model_version = None
         self.buffer = deque(maxlen=TRAINING_BUFFER_SIZE)
+        self.shared_buffer = get_buffer_store(TRAINING_BUFFER_SIZE)
+        self._shared_samples = 0
         self.is_trained = False
         self.training_mode = True
         self.pending_approval = False
+        self.training_future = None
+        self._generation = 0  # bumped by reset() so stale training results are dropped
+        self._lock = threading.Lock()
+        self._checked_at = time.monotonic()
         
         # Load existing model if available
-        if os.path.exists(self.model_path):
-            try:
-                self.model = joblib.load(self.model_path)
-                self.is_trained = True
-                self.training_mode = False
-                logger.info(f"🧠 Loaded existing ML model for Org {organization_id} (Server: {source}).")
-            except Exception as e:
-                logger.error(f"Failed to load model for Org {organization_id} (Server: {source}): {e}")
+        try:
+            model, version, approved = model_store.load(self.base)
+            if model is not None:
+                self._install(model, version, approved)
+                logger.info(f"🧠 Loaded ML model v{version} for Org {organization_id} (Server: {source}).")
+        except Exception as e:
+            logger.error(f"Failed to load model for Org {organization_id} (Server: {source}): {e}")
 
-    def train(self):
-        """Train the Isolation Forest model on buffered data."""
-        if len(self.buffer) < TRAINING_BUFFER_SIZE:
+        if self.shared_buffer is not None:
+            self._shared_samples = self.shared_buffer.count(self.buffer_key)
+        self._load_state()
+
+    def _install(self, model, version, approved: bool):
+        self.model = model
+        self.model_version = version
+        self.is_trained = True
+        self.training_mode = False
+        self.pending_approval = not approved
+
+    def refresh(self, force: bool = False):
+        """Pick up model versions / approvals / resets made by other workers."""
+        now = time.monotonic()
+        if not force and now - self._checked_at < ML_MODEL_REFRESH_SECONDS:
+            return
+        self._checked_at = now
+        if self.is_training:
             return
+        meta = model_store.read_meta(self.base)
+        if meta is None or meta.get("latest") is None:
+            if self.model_version:  # versioned model deleted elsewhere -> reset there
+                with self._lock:
+                    self._generation += 1
+                    self.model, self.model_version = None, None
+                    self.is_trained, self.training_mode, self.pending_approval = False, True, False
+            return
+        latest = meta["latest"]
+        try:
+            if latest != self.model_version:
+                model, version, approved = model_store.load(self.base)
+                with self._lock:
+                    self._install(model, version, approved)
+                logger.info(f"🧠 Picked up ML model v{version} for Org {self.organization_id} (Server: {self.source}).")
+            else:
+                self.pending_approval = meta.get("approved") != latest
+        except Exception as e:
+            logger.error(f"Failed to refresh model for Org {self.organization_id} (Server: {self.source}): {e}")
 
-        logger.info(f"🧠 Training model for Org {self.organization_id} (Server: {self.source}) on {len(self.buffer)} events...")
+    def _load_state(self):
+        """Restore the in-process training buffer written by save_state()."""
+        if self.shared_buffer is not None or not self.training_mode or not os.path.exists(self.state_path):
+            return
         try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+            self.buffer.extend(state.get("buffer", []))
+        except Exception as e:
+            logger.error(f"Failed to load ML state for Org {self.organization_id} (Server: {self.source}): {e}")
+
+    def save_state(self):
+        """Persist the in-process training buffer so eviction loses nothing."""
+        if self.shared_buffer is not None:
+            return  # Already durable in the shared store
+        if not self.training_mode or not self.buffer:
+            if os.path.exists(self.state_path):
+                os.remove(self.state_path)
+            return
+        state = {
+            "organization_id": self.organization_id,
+            "source": self.source,
+            "buffer": list(self.buffer),
+        }
+        tmp = self.state_path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp, self.state_path)
+        except Exception as e:
+            logger.error(f"Failed to save ML state for Org {self.organization_id} (Server: {self.source}): {e}")
+
+    @property
+    def samples(self) -> int:
+        return self._shared_samples if self.shared_buffer is not None else len(self.buffer)
+
+    @property
+    def is_training(self) -> bool:
+        return self.training_future is not None and not self.training_future.done()
+
+    def train(self):
+        """
+        Train the Isolation Forest model on buffered data in the training pool.
+        The detector stays in Training mode until the fit completes; the new
+        model is then swapped in by _on_trained. Concurrent callers race for
+        the training slot under the lock, so only one fit is ever started.
+        """
+        with self._lock:
+            if self.samples < TRAINING_BUFFER_SIZE or self.is_training:
+                return
+            # Placeholder until the fit is submitted: is_training is already True
+            reserved = self.training_future = Future()
+
+        if self.shared_buffer is not None:
+            # Only one worker process trains a given server
+            if not self.shared_buffer.claim(self.buffer_key):
+                self._unreserve(reserved)
+                return
+            X = np.array(self.shared_buffer.load(self.buffer_key))
+        else:
             X = np.array(self.buffer)
-            self.model = IsolationForest(n_estimators=100, contamination=0.05, random_state=42)
-            self.model.fit(X)
-            
-            self.is_trained = True
-            self.training_mode = False
-            self.pending_approval = True # Prevent Data Poisoning: Wait for Admin
-            
-            # Save model
-            joblib.dump(self.model, self.model_path)
-            logger.info(f"✅ Model trained and saved for Org {self.organization_id} (Server: {self.source})!")
-            
+
+        logger.info(f"🧠 Training model for Org {self.organization_id} (Server: {self.source}) on {len(X)} events...")
+        generation = self._generation
+        pool = get_training_pool()
+        try:
+            if pool is None:
+                future = Future()
+                future.set_result(_fit_model(X))
+            else:
+                future = pool.submit(_fit_model, X)
         except Exception as e:
             logger.error(f"Training failed for Org {self.organization_id} (Server: {self.source}): {e}")
+            self._unreserve(reserved)
+            self._release_claim()
+            return
+
+        with self._lock:
+            if self.training_future is reserved:
+                self.training_future = future
+        future.add_done_callback(lambda f: self._on_trained(f, generation))
+
+    def _unreserve(self, reserved: Future):
+        with self._lock:
+            if self.training_future is reserved:
+                self.training_future = None
+
+    def _release_claim(self):
+        if self.shared_buffer is not None:
+            self.shared_buffer.release(self.buffer_key)
+
+    def _on_trained(self, future: Future, generation: int):
+        """Publish and swap in the fitted model (runs on the pool's callback thread)."""
+        try:
+            model = future.result()
+        except Exception as e:
+            logger.error(f"Training failed for Org {self.organization_id} (Server: {self.source}): {e}")
+            self._release_claim()
+            return
+
+        try:
+            if generation != self._generation:
+                logger.info(f"🧠 Discarding stale model for {self.source} (reset during training).")
+                return
+            # New version starts unapproved: Prevent Data Poisoning, Wait for Admin
+            version = model_store.save(self.base, model)
+            with self._lock:
+                if generation != self._generation:
+                    return
+                self._install(model, version, approved=False)
+                self.buffer.clear()
+            if self.shared_buffer is not None:
+                self.shared_buffer.clear(self.buffer_key)
+                self._shared_samples = 0
+            self.save_state()
+            logger.info(f"✅ Model v{version} trained and saved for Org {self.organization_id} (Server: {self.source})!")
+        except Exception as e:
+            logger.error(f"Failed to save model for Org {self.organization_id} (Server: {self.source}): {e}")
+        finally:
+            self._release_claim()
 
     def get_status(self) -> dict:
         """Returns the current status of the ML model."""
         return {
             "mode": "Training" if self.training_mode else ("Pending Approval" if self.pending_approval else "Active"),
-            "samples": len(self.buffer),
+            "samples": self.samples,
             "required_samples": TRAINING_BUFFER_SIZE,
-            "progress": int((len(self.buffer) / TRAINING_BUFFER_SIZE) * 100) if self.training_mode else 100,
+            "progress": min(100, int((self.samples / TRAINING_BUFFER_SIZE) * 100)) if self.training_mode else 100,
             "trained": self.is_trained,
+            "model_version": self.model_version,
+            "training_in_progress": self.is_training,
             "pending_approval": self.pending_approval,
             "organization_id": self.organization_id,
             "source": self.source
@@ -81,105 +306,296 @@ class AnomalyDetector:
 
     def reset(self):
         """Resets the model to training mode."""
-        self.buffer.clear()
-        self.model = None
-        self.is_trained = False
-        self.training_mode = True
-        self.pending_approval = False
-        if os.path.exists(self.model_path):
+        with self._lock:
+            self._generation += 1
+            self.buffer.clear()
+            self.model = None
+            self.model_version = None
+            self.is_trained = False
+            self.training_mode = True
+            self.pending_approval = False
+            self.training_future = None
+        model_store.delete(self.base)
+        if self.shared_buffer is not None:
+            self.shared_buffer.clear(self.buffer_key)
+            self._shared_samples = 0
+        if os.path.exists(self.state_path):
             try:
-                os.remove(self.model_path)
-                logger.info(f"🗑️ Deleted ML model file for Org {self.organization_id} (Server: {self.source}).")
+                os.remove(self.state_path)
             except Exception as e:
                 logger.error(f"Failed to delete model file: {e}")
+        logger.info(f"🗑️ Deleted ML model files for Org {self.organization_id} (Server: {self.source}).")
         logger.info(f"🔄 ML Model for {self.source} Reset to Training Mode.")
 
     def approve(self):
         """Approves the trained model for active inference."""
         self.pending_approval = False
+        model_store.approve(self.base, self.model_version)
         logger.info(f"✅ ML Model for Org {self.organization_id} (Server: {self.source}) APPROVED by Admin.")
 
+    @property
+    def is_active(self) -> bool:
+        """Trained, approved and ready to score."""
+        return self.is_trained and self.model is not None and not self.pending_approval
+
+    def observe(self, features: list):
+        """Training Phase: buffer a sample and train once the buffer is full."""
+        if self.is_training:
+            return # Buffer is frozen while its snapshot is being fitted
+        if self.shared_buffer is not None:
+            self._shared_samples = self.shared_buffer.append(self.buffer_key, features)
+        else:
+            self.buffer.append(features)
+        remaining = TRAINING_BUFFER_SIZE - self.samples
+        if remaining % 10 == 0:
+            logger.info(f"🧠 Org {self.organization_id} ({self.source}) Learning... {self.samples}/{TRAINING_BUFFER_SIZE} samples.")
+
+        if self.samples >= TRAINING_BUFFER_SIZE:
+            self.train()
+
+    def score_rows(self, rows: list) -> list | None:
+        """Score many feature vectors with a single forest traversal."""
+        model = self.model
+        if model is None:
+            return None
+        try:
+            return model.score_samples(np.asarray(rows, dtype=float)).tolist()
+        except Exception as e:
+            logger.error(f"Inference error Org {self.organization_id} ({self.source}) (Model Mismatch? Resetting...): {e}")
+            self.reset() # Auto-reset if shape mismatch occurs
+            return None
+
+    def verdict(self, features: list, score: float) -> dict | None:
+        """
+        Same decision as model.predict() without a second traversal:
+        IsolationForest flags a sample when score_samples < offset_.
+        """
+        threshold = getattr(self.model, "offset_", ANOMALY_THRESHOLD)
+        if score >= threshold:
+            return None
+
+        cpu, ram, disk, net, procs = features
+        logger.warning(f"🚨 Org {self.organization_id} ({self.source}) Anomaly Detected! Score: {score:.2f} | Data: {features}")
+        return {
+            "score": float(score),
+            "reason": f"Anomaly Detected (Score: {score:.2f})",
+            "features": {
+                "cpu": cpu, "ram": ram,
+                "disk_mb": disk, "net_mb": net, "procs": procs
+            }
+        }
+
     def process_event(self, event: dict) -> dict | None:
         """
         Process a heartbeat event.
         Returns anomaly details if anomalous, else None.
         """
-        # Only process system_heartbeat
-        if event.get("event_type") != "system_heartbeat":
+        features = extract_features(event)
+        if features is None:
             return None
 
-        data = event.get("data", {})
-        cpu = data.get("cpu")
-        ram = data.get("ram")
-        disk = data.get("disk_write_mb", 0.0)
-        net = data.get("net_out_mb", 0.0)
-        procs = data.get("process_count", 0)
+        # 1. Training Phase
+        if self.training_mode:
+            self.observe(features)
+            return None
 
-        if cpu is None or ram is None:
+        # 2. Inference Phase (dormant until Admin validation)
+        if not self.is_active:
             return None
 
-        # 5-Dimensional Feature Vector
-        features = [cpu, ram, disk, net, procs]
+        score = scorer.score(self, features)
+        return self.verdict(features, score) if score is not None else None
 
-        # 1. Training Phase
-        if self.training_mode:
-            self.buffer.append(features)
-            remaining = TRAINING_BUFFER_SIZE - len(self.buffer)
-            if remaining % 10 == 0:
-                logger.info(f"🧠 Org {self.organization_id} ({self.source}) Learning... {len(self.buffer)}/{TRAINING_BUFFER_SIZE} samples.")
-            
-            if len(self.buffer) >= TRAINING_BUFFER_SIZE:
-                self.train()
-            
-            return None 
-
-        # 2. Inference Phase
-        if self.is_trained and self.model:
-            if self.pending_approval:
-                return None # Model is dormant until Admin validation
-                
-            try:
-                X = np.array([features])
-                pred = self.model.predict(X)[0]
-                score = self.model.score_samples(X)[0]
-
-                if pred == -1:
-                    logger.warning(f"🚨 Org {self.organization_id} ({self.source}) Anomaly Detected! Score: {score:.2f} | Data: {features}")
-                    return {
-                        "score": float(score),
-                        "reason": f"Anomaly Detected (Score: {score:.2f})",
-                        "features": {
-                            "cpu": cpu, "ram": ram, 
-                            "disk_mb": disk, "net_mb": net, "procs": procs
-                        }
-                    }
-            except Exception as e:
-                logger.error(f"Inference error Org {self.organization_id} ({self.source}) (Model Mismatch? Resetting...): {e}")
-                self.reset() # Auto-reset if shape mismatch occurs
 
-        return None
+# -------------------------------------------------------------------
+# Windowed scoring
+# -------------------------------------------------------------------
+class ScoringBatcher:
+    """
+    Collects feature vectors submitted by concurrent callers for up to
+    ML_SCORING_WINDOW_MS, then scores each model's rows in one call.
+    Callers block on a future for their own score, so only worker threads
+    (threadpool ingest, queue workers, Kafka consumers) are batched; a call
+    made on an event loop thread is scored inline rather than stall the loop.
+    """
+    def __init__(self, window_ms: int = ML_SCORING_WINDOW_MS, max_batch: int = ML_SCORING_MAX_BATCH):
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def score(self, detector: "AnomalyDetector", features: list) -> float | None:
+        if self.window_ms <= 0 or self._on_event_loop():
+            scores = detector.score_rows([features])
+            return scores[0] if scores else None
+
+        self._ensure_started()
+        fut = Future()
+        self._queue.put((detector, features, fut))
+        return fut.result()
+
+    @staticmethod
+    def _on_event_loop() -> bool:
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True, name="ml-scoring-batcher")
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window_ms / 1000.0
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            groups = {}
+            for detector, features, fut in batch:
+                groups.setdefault(id(detector), (detector, []))[1].append((features, fut))
+
+            for detector, items in groups.values():
+                try:
+                    scores = detector.score_rows([f for f, _ in items])
+                except Exception as e:
+                    for _, fut in items:
+                        fut.set_exception(e)
+                    continue
+                for i, (_, fut) in enumerate(items):
+                    fut.set_result(scores[i] if scores else None)
+
+
+scorer = ScoringBatcher()
 
 # -------------------------------------------------------------------
 # Multi-Tenant Manager
 # -------------------------------------------------------------------
 class OrganizationMLManager:
-    def __init__(self):
-        self.detectors = {} # { "org_id:source": AnomalyDetector }
+    """
+    LRU registry of detectors keyed "org_id:source". Beyond ML_MAX_DETECTORS
+    the least recently used idle detector is persisted (save_state) and
+    dropped; the next event for that server reloads it from disk.
+    Detectors with a fit in flight are never evicted. The last status of
+    evicted detectors is kept for listings, bounded by the same limit.
+    """
+    def __init__(self, max_detectors: int = ML_MAX_DETECTORS):
+        self.max_detectors = max_detectors
+        self.detectors: "OrderedDict[str, AnomalyDetector]" = OrderedDict()
+        self.evicted = 0
+        self._evicted_status: "OrderedDict[str, dict]" = OrderedDict()  # key -> last get_status() of evicted detectors
+        self._lock = threading.Lock()
 
-    def get_detector(self, organization_id: int | str | None, source: str) -> AnomalyDetector:
+    @staticmethod
+    def _key(organization_id, source) -> tuple:
         org_key = str(organization_id) if organization_id is not None else "global"
         safe_source = str(source) if source else "unknown"
-        key = f"{org_key}:{safe_source}"
-        
-        if key not in self.detectors:
-            logger.info(f"🆕 Initializing new AnomalyDetector for Org: {org_key}, Server: {safe_source}")
-            self.detectors[key] = AnomalyDetector(organization_id=org_key, source=safe_source)
-        
-        return self.detectors[key]
+        return f"{org_key}:{safe_source}", org_key, safe_source
+
+    def get_detector(self, organization_id: int | str | None, source: str) -> AnomalyDetector:
+        key, org_key, safe_source = self._key(organization_id, source)
+        with self._lock:
+            detector = self.detectors.get(key)
+            if detector is not None:
+                self.detectors.move_to_end(key)
+        if detector is not None:
+            detector.refresh()
+            return detector
+
+        # joblib.load outside the lock so one cold server doesn't stall the rest
+        logger.info(f"🆕 Initializing AnomalyDetector for Org: {org_key}, Server: {safe_source}")
+        detector = AnomalyDetector(organization_id=org_key, source=safe_source)
+
+        with self._lock:
+            existing = self.detectors.get(key)
+            if existing is not None:
+                self.detectors.move_to_end(key)
+                return existing
+            self.detectors[key] = detector
+            self._evicted_status.pop(key, None)
+            self._evict_locked()
+        return detector
+
+    def find(self, organization_id: int | str | None, source: str) -> AnomalyDetector | None:
+        """Detector for an existing server (in memory or persisted), else None."""
+        key, org_key, safe_source = self._key(organization_id, source)
+        with self._lock:
+            known = key in self.detectors or key in self._evicted_status
+        base = _artifact_base(org_key, safe_source)
+        if known or model_store.exists(base) or os.path.exists(base + ".state.json"):
+            return self.get_detector(organization_id, source)
+        return None
+
+    def statuses(self, organization_id: int | str | None) -> list:
+        """get_status() of every known detector of an org, evicted ones included."""
+        prefix = f"{self._key(organization_id, None)[1]}:"
+        with self._lock:
+            live = [d for k, d in self.detectors.items() if k.startswith(prefix)]
+            evicted = [st for k, st in self._evicted_status.items() if k.startswith(prefix)]
+        return [d.get_status() for d in live] + evicted
+
+    def _evict_locked(self):
+        if len(self.detectors) <= self.max_detectors:
+            return
+        for key in list(self.detectors.keys()):
+            if len(self.detectors) <= self.max_detectors:
+                break
+            detector = self.detectors[key]
+            if detector.is_training:
+                continue
+            detector.save_state()
+            self._evicted_status[key] = detector.get_status()
+            self._evicted_status.move_to_end(key)
+            if len(self._evicted_status) > self.max_detectors:
+                self._evicted_status.popitem(last=False)
+            del self.detectors[key]
+            self.evicted += 1
+            logger.info(f"♻️ Evicted idle AnomalyDetector {key} (persisted).")
+
+    def warm_up(self, servers: list):
+        """Preload detectors for (organization_id, source) pairs, most recent last."""
+        for organization_id, source in servers[-self.max_detectors:]:
+            try:
+                self.get_detector(organization_id, source)
+            except Exception as e:
+                logger.error(f"ML warm-up failed for {organization_id}:{source}: {e}")
+        logger.info(f"🔥 ML warm-up loaded {len(servers)} detector(s).")
 
 # Global Singleton Manager
 manager = OrganizationMLManager()
 
+
+def warm_up_recent_detectors(db, minutes: int = ML_WARMUP_RECENT_MINUTES):
+    """Startup hook: preload detectors for servers that heartbeated recently."""
+    if minutes <= 0:
+        return
+    from datetime import datetime, timedelta
+    from src.models.server import Server
+    from src.models.user import User
+
+    cutoff = datetime.utcnow() - timedelta(minutes=minutes)
+    rows = (
+        db.query(User.organization_id, Server.hostname)
+        .join(User, User.id == Server.user_id)
+        .filter(Server.last_heartbeat >= cutoff)
+        .order_by(Server.last_heartbeat)
+        .all()
+    )
+    manager.warm_up([(org_id, hostname) for org_id, hostname in rows])
+
 def detect_anomaly(event: dict, organization_id: int | str | None = None) -> dict | None:
     # Prefer explicit org_id, then check event dict
     if organization_id is None:
@@ -189,3 +605,32 @@ def detect_anomaly(event: dict, organization_id: int | str | None = None) -> dic
     detector = manager.get_detector(organization_id, source)
     return detector.process_event(event)
 
+
+def detect_anomalies_batch(events: list, organization_id: int | str | None = None) -> list:
+    """
+    Vectorised detect_anomaly for a batch of events (batch ingest, Kafka).
+    Training samples are buffered in order; rows for active models are
+    grouped per detector and scored with one score_samples call each.
+    Returns one result (anomaly dict or None) per input event.
+    """
+    results = [None] * len(events)
+    groups = {}
+    for i, event in enumerate(events):
+        features = extract_features(event)
+        if features is None:
+            continue
+        org_id = organization_id if organization_id is not None else event.get("organization_id")
+        detector = manager.get_detector(org_id, event.get("source", "unknown"))
+        if detector.training_mode:
+            detector.observe(features)
+        elif detector.is_active:
+            groups.setdefault(id(detector), (detector, []))[1].append((i, features))
+
+    for detector, rows in groups.values():
+        scores = detector.score_rows([f for _, f in rows])
+        if scores is None:
+            continue
+        for (i, features), score in zip(rows, scores):
+            results[i] = detector.verdict(features, score)
+    return results
+
@@ -0,0 +1,198 @@
+# backend/src/services/broadcast_bus.py
+
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import uuid
+from typing import Callable, Optional
+
+logger = logging.getLogger("ctdirp.broadcaster")
+
+# "local": events reach SSE clients of this process only (single worker).
+# "postgres": every publish is also sent with NOTIFY and replayed by all other
+# workers, so any worker can serve any dashboard.
+BROADCAST_BACKEND = os.getenv("BROADCAST_BACKEND", "local")
+BROADCAST_CHANNEL = os.getenv("BROADCAST_CHANNEL", "ctdirp_events")
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+NOTIFY_MAX_PAYLOAD = 7900
+
+
+def encode(origin: str, organization_id: int, event: dict, seq: Optional[int] = None) -> str:
+    return json.dumps({"origin": origin, "org": organization_id, "event": event, "seq": seq}, default=str)
+
+
+def decode(payload: str):
+    """(origin, organization_id, event, seq) from a bus message; seq is the origin's stream id."""
+    message = json.loads(payload)
+    return message["origin"], message["org"], message["event"], message.get("seq")
+
+
+# Cache invalidations share the channel with events; the fixed key order
+# lets receivers tell them apart without parsing every event twice.
+_INVALIDATION_PREFIX = '{"invalidate": '
+
+
+def encode_invalidation(origin: str, topic: str, key) -> str:
+    return json.dumps({"invalidate": topic, "key": key, "origin": origin}, default=str)
+
+
+def decode_invalidation(payload: str):
+    """(origin, topic, key) for an invalidation message, None for an event."""
+    if not payload.startswith(_INVALIDATION_PREFIX):
+        return None
+    message = json.loads(payload)
+    return message["origin"], message["invalidate"], message["key"]
+
+
+class PostgresNotifyBus:
+    """
+    Cross-process fan-out over Postgres LISTEN/NOTIFY. publish() only enqueues
+    (the event loop never blocks on the DB); a sender thread issues
+    pg_notify() and a listener thread hands every received message to
+    `on_message(payload)`. Both reconnect on failure. Event ids come from a
+    Postgres sequence, so every worker numbers the stream the same way.
+    """
+    def __init__(self, dsn: str, channel: str = BROADCAST_CHANNEL):
+        self.dsn = dsn
+        self.channel = channel
+        self.sequence = f"{channel}_seq"
+        self.node_id = uuid.uuid4().hex
+        self.sent = 0
+        self.received = 0
+        self.oversized = 0
+        self._outbox: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=10000)
+        self._stop = threading.Event()
+        self._threads = []
+        self._on_message: Optional[Callable[[str], None]] = None
+        self._seq_conn = None
+        self._seq_lock = threading.Lock()
+
+    def _connect(self):
+        import psycopg2
+        conn = psycopg2.connect(self.dsn)
+        conn.autocommit = True
+        return conn
+
+    def next_seq(self) -> int:
+        """Next event id of the stream shared by all workers (blocking: call off the event loop)."""
+        with self._seq_lock:
+            try:
+                if self._seq_conn is None:
+                    self._seq_conn = self._connect()
+                    with self._seq_conn.cursor() as cur:
+                        cur.execute(f'CREATE SEQUENCE IF NOT EXISTS "{self.sequence}"')
+                with self._seq_conn.cursor() as cur:
+                    cur.execute("SELECT nextval(%s)", (self.sequence,))
+                    return cur.fetchone()[0]
+            except Exception:
+                if self._seq_conn is not None:
+                    try:
+                        self._seq_conn.close()
+                    except Exception:
+                        pass
+                    self._seq_conn = None
+                raise
+
+    def publish(self, payload: str):
+        if len(payload.encode()) >= NOTIFY_MAX_PAYLOAD:
+            self.oversized += 1
+            logger.warning(f"Event too large for NOTIFY ({len(payload)} bytes); delivered to this worker only")
+            return
+        try:
+            self._outbox.put_nowait(payload)
+        except queue.Full:
+            logger.warning("Broadcast outbox full, dropping cross-worker event")
+
+    def _send_loop(self):
+        conn = None
+        while not self._stop.is_set():
+            payload = self._outbox.get()
+            if payload is None:
+                break
+            try:
+                if conn is None:
+                    conn = self._connect()
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+                self.sent += 1
+            except Exception as e:
+                logger.error(f"NOTIFY failed, reconnecting: {e}")
+                conn = None
+                self._stop.wait(1)
+        if conn is not None:
+            conn.close()
+
+    def _listen_loop(self):
+        conn = None
+        while not self._stop.is_set():
+            try:
+                if conn is None:
+                    conn = self._connect()
+                    with conn.cursor() as cur:
+                        cur.execute(f'LISTEN "{self.channel}"')
+                    logger.info(f"📡 Listening for cross-worker events on '{self.channel}'")
+                if select.select([conn], [], [], 1.0)[0]:
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self.received += 1
+                        try:
+                            self._on_message(notify.payload)
+                        except Exception:
+                            logger.exception("Bad cross-worker event")
+            except Exception as e:
+                logger.error(f"LISTEN connection lost, reconnecting: {e}")
+                conn = None
+                self._stop.wait(1)
+        if conn is not None:
+            conn.close()
+
+    def start(self, on_message: Callable[[str], None]):
+        self._on_message = on_message
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._send_loop, daemon=True, name="broadcast-notify"),
+            threading.Thread(target=self._listen_loop, daemon=True, name="broadcast-listen"),
+        ]
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        self._stop.set()
+        try:
+            self._outbox.put_nowait(None)
+        except queue.Full:
+            pass
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads = []
+        with self._seq_lock:
+            if self._seq_conn is not None:
+                self._seq_conn.close()
+                self._seq_conn = None
+
+    def stats(self) -> dict:
+        return {
+            "backend": "postgres",
+            "sent": self.sent,
+            "received": self.received,
+            "oversized": self.oversized,
+            "outbox": self._outbox.qsize(),
+        }
+
+
+def create_bus(backend: str = BROADCAST_BACKEND) -> Optional[PostgresNotifyBus]:
+    """The configured cross-process bus, or None for single-process ("local") delivery."""
+    if backend == "local":
+        return None
+    if backend == "postgres":
+        from sqlalchemy.engine import make_url
+        from src.database import DATABASE_URL
+        url = make_url(DATABASE_URL)
+        if not url.drivername.startswith("postgresql"):
+            raise ValueError("BROADCAST_BACKEND=postgres requires a PostgreSQL DATABASE_URL")
+        return PostgresNotifyBus(url.set(drivername="postgresql").render_as_string(hide_password=False))
+    raise ValueError(f"Unknown BROADCAST_BACKEND {backend!r} (expected 'local' or 'postgres')")
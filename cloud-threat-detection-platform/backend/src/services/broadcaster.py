@@ -1,39 +1,164 @@
 # backend/src/services/broadcaster.py
 import asyncio
+import logging
+import os
 import uuid
-from typing import Dict, Optional, Tuple
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from src.services.broadcast_bus import BROADCAST_BACKEND, create_bus, decode, decode_invalidation, encode, encode_invalidation
+
+logger = logging.getLogger("ctdirp.broadcaster")
+
+# Events buffered per SSE client before the overflow policy applies
+SSE_QUEUE_MAXSIZE = int(os.getenv("SSE_QUEUE_MAXSIZE", "1000"))
+# drop_oldest | drop_newest | disconnect
+SSE_OVERFLOW_POLICY = os.getenv("SSE_OVERFLOW_POLICY", "drop_oldest")
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+
+# Recent events kept per organization for Last-Event-ID replay
+SSE_REPLAY_BUFFER = int(os.getenv("SSE_REPLAY_BUFFER", "500"))
+
+# Queued in place of events when a subscriber is cut off; event_generator stops on it
+DISCONNECT = None
+
+
+class StampedEvent(dict):
+    """An event dict carrying its SSE id ("<stream>-<seq>") as an attribute."""
+    __slots__ = ("event_id", "seq")
+
+
+class _Subscriber:
+    __slots__ = ("sid", "organization_id", "queue", "dropped", "disconnected")
+
+    def __init__(self, sid: str, organization_id: Optional[int], maxsize: int):
+        self.sid = sid
+        self.organization_id = organization_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.disconnected = False
+
 
 class Broadcaster:
     """
     Small pub/sub broadcaster, partitioned by organization for tenant isolation.
-    Each subscriber registers with its organization id; an event is delivered
-    only to subscribers of the same organization.
+    Subscribers are indexed by organization id, so publishing only touches the
+    target organization's subscribers. Each subscriber has a bounded queue;
+    when a slow client fills it the overflow policy drops its oldest event,
+    drops the new one, or disconnects it.
     """
-    def __init__(self):
-        # subscriber_id -> (organization_id, queue)
-        self.subscribers: Dict[str, Tuple[Optional[int], asyncio.Queue]] = {}
+    def __init__(self, maxsize: int = SSE_QUEUE_MAXSIZE, overflow_policy: str = SSE_OVERFLOW_POLICY):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"SSE_OVERFLOW_POLICY must be one of {OVERFLOW_POLICIES}, got {overflow_policy!r}")
+        self.maxsize = maxsize
+        self.overflow_policy = overflow_policy
+        # subscriber_id -> subscriber, and organization_id -> {subscriber_id: subscriber}
+        self.subscribers: Dict[str, _Subscriber] = {}
+        self._by_org: Dict[Optional[int], Dict[str, _Subscriber]] = {}
         self.lock = asyncio.Lock()
+        self.bus = None
+        self._loop = None
+        self._invalidation_handlers: Dict[str, Callable[[Any], None]] = {}
+        # Ids are "<stream>-<seq>". Single process: seq counts per organization
+        # and the stream token changes on every start, so stale ids are
+        # recognised. With a bus, the origin worker takes seq from the bus's
+        # shared sequence and sends it along, so every worker stamps an event
+        # with the same id and any of them can replay it.
+        self.stream_id = uuid.uuid4().hex[:12]
+        self._seq: Dict[int, int] = {}
+        self._history: Dict[int, Deque[StampedEvent]] = {}
+        # org -> highest seq that may be missing from its history (evicted, or
+        # published before this worker heard from the org)
+        self._floor: Dict[int, int] = {}
+        self.replay_size = SSE_REPLAY_BUFFER
 
-    async def subscribe(self, organization_id: Optional[int]) -> Tuple[str, asyncio.Queue]:
-        """Create a queue for a new subscriber scoped to its organization."""
-        q = asyncio.Queue()
+    async def subscribe(self, organization_id: Optional[int], last_event_id: Optional[str] = None) -> Tuple[str, asyncio.Queue]:
+        """
+        Create a queue for a new subscriber scoped to its organization.
+        With last_event_id (a reconnect), the events missed since then are
+        queued first, or a single {"type": "resync"} event when they are no
+        longer buffered and the client must refetch.
+        """
         sid = str(uuid.uuid4())
+        sub = _Subscriber(sid, organization_id, self.maxsize)
         async with self.lock:
-            self.subscribers[sid] = (organization_id, q)
-        return sid, q
+            # No await between replay and registration: no publish can slip in between
+            if last_event_id:
+                missed = self.replay(organization_id, last_event_id)
+                if missed is None:
+                    sub.queue.put_nowait({"type": "resync", "reason": "events since Last-Event-ID are no longer buffered"})
+                else:
+                    for event in missed:
+                        sub.queue.put_nowait(event)
+            self.subscribers[sid] = sub
+            self._by_org.setdefault(organization_id, {})[sid] = sub
+        return sid, sub.queue
+
+    def replay(self, organization_id: Optional[int], last_event_id: str) -> Optional[List[StampedEvent]]:
+        """Buffered events after last_event_id, or None if the gap can't be filled."""
+        stream, _, seq = last_event_id.rpartition("-")
+        if stream != self.stream_id or not seq.isdigit() or organization_id is None:
+            return None
+        seq = int(seq)
+        if self.bus is None:
+            if seq > self._seq.get(organization_id, 0):
+                return None
+            floor = self._floor.get(organization_id, 0)
+        else:
+            floor = self._floor.get(organization_id)
+            if floor is None:
+                return None  # nothing seen for this org yet: can't tell what was missed
+        if seq < floor:
+            return None
+        missed = [e for e in self._history.get(organization_id, ()) if e.seq > seq]
+        if len(missed) > self.maxsize > 0:
+            return None
+        return missed
 
     async def unsubscribe(self, sid: str):
         async with self.lock:
-            entry = self.subscribers.pop(sid, None)
-        if entry is not None:
-            _, q = entry
-            # drain queue to avoid pending put waits
-            while not q.empty():
-                try:
-                    q.get_nowait()
-                    q.task_done()
-                except asyncio.QueueEmpty:
-                    break
+            sub = self.subscribers.pop(sid, None)
+            if sub is not None:
+                org_subs = self._by_org.get(sub.organization_id)
+                if org_subs is not None:
+                    org_subs.pop(sid, None)
+                    if not org_subs:
+                        del self._by_org[sub.organization_id]
+        if sub is not None:
+            self._drain(sub.queue)
+
+    @staticmethod
+    def _drain(q: asyncio.Queue):
+        while not q.empty():
+            try:
+                q.get_nowait()
+                q.task_done()
+            except asyncio.QueueEmpty:
+                break
+
+    def _deliver(self, sub: _Subscriber, event: dict):
+        if sub.disconnected:
+            return
+        try:
+            sub.queue.put_nowait(event)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        sub.dropped += 1
+        if self.overflow_policy == "drop_oldest":
+            try:
+                sub.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+            sub.queue.put_nowait(event)
+        elif self.overflow_policy == "disconnect":
+            # Replace the backlog with the stop marker; the stream ends and the client reconnects
+            sub.disconnected = True
+            self._drain(sub.queue)
+            sub.queue.put_nowait(DISCONNECT)
+            logger.warning(f"SSE subscriber {sub.sid[:8]} (org={sub.organization_id}) disconnected: queue full")
+        # drop_newest: the event is simply not queued
 
     async def publish(self, event: dict, organization_id: Optional[int] = None):
         """
@@ -45,17 +170,121 @@ class Broadcaster:
         """
         if organization_id is None:
             return
-        async with self.lock:
-            subs = list(self.subscribers.items())
-        for sid, (sub_org, q) in subs:
-            if sub_org != organization_id:
-                continue
-            # put_nowait so one slow consumer won't block the publisher
-            try:
-                q.put_nowait(event)
-            except asyncio.QueueFull:
-                # drop the event for that subscriber if its queue is full
-                pass
+        if self.bus is None:
+            seq = self._seq.get(organization_id, 0) + 1
+            self._seq[organization_id] = seq
+            self._fanout(event, organization_id, seq)
+            return
+        try:
+            seq = await asyncio.get_running_loop().run_in_executor(None, self.bus.next_seq)
+        except Exception as e:
+            # Still delivered, just without an id: a reconnect after it resumes from the one before
+            logger.error(f"Could not number event for org={organization_id}: {e}")
+            seq = None
+        self._fanout(event, organization_id, seq)
+        self.bus.publish(encode(self.bus.node_id, organization_id, event, seq))
+
+    def _remember(self, organization_id: int, event: StampedEvent):
+        """Buffer an event for replay, kept in seq order (bus events can arrive out of order)."""
+        history = self._history.get(organization_id)
+        if history is None:
+            history = self._history[organization_id] = deque(maxlen=self.replay_size)
+            if self.bus is not None:
+                self._floor.setdefault(organization_id, event.seq - 1)
+        if history.maxlen == 0:
+            self._floor[organization_id] = max(self._floor.get(organization_id, 0), event.seq)
+            return
+        i = len(history)
+        while i and history[i - 1].seq > event.seq:
+            i -= 1
+        if len(history) == history.maxlen:
+            if i == 0:
+                self._floor[organization_id] = max(self._floor.get(organization_id, 0), event.seq)
+                return
+            self._floor[organization_id] = max(self._floor.get(organization_id, 0), history.popleft().seq)
+            i -= 1
+        history.insert(i, event)
+
+    def _fanout(self, event: dict, organization_id: int, seq: Optional[int]):
+        """Stamp the event with its id, buffer it and deliver locally."""
+        event = StampedEvent(event)
+        event.seq = seq
+        event.event_id = f"{self.stream_id}-{seq}" if seq is not None else None
+        if seq is not None:
+            self._remember(organization_id, event)
+
+        # Subscriptions only change on the event loop, so this org's snapshot is consistent
+        org_subs = self._by_org.get(organization_id)
+        if not org_subs:
+            return
+        for sub in list(org_subs.values()):
+            self._deliver(sub, event)
+
+    # ---------------------------------------------------------
+    # Cross-process fan-out (BROADCAST_BACKEND)
+    # ---------------------------------------------------------
+    def on_invalidate(self, topic: str, handler: Callable[[Any], None]):
+        """Run handler(key) when another worker publishes invalidate(topic, key)."""
+        self._invalidation_handlers[topic] = handler
+
+    def invalidate(self, topic: str, key: Any):
+        """
+        Ask the other workers to drop their cached `topic` state for `key`
+        (callers have already dropped their own). Safe from any thread; a
+        no-op without a bus, where the caches' TTLs bound staleness.
+        """
+        bus = self.bus
+        if bus is not None:
+            bus.publish(encode_invalidation(bus.node_id, topic, key))
+
+    def _receive(self, payload: str):
+        invalidation = decode_invalidation(payload)
+        if invalidation is not None:
+            origin, topic, key = invalidation
+            handler = self._invalidation_handlers.get(topic)
+            if handler is not None and origin != self.bus.node_id:
+                handler(key)
+            return
+        origin, organization_id, event, seq = decode(payload)
+        if organization_id is None or origin == self.bus.node_id:
+            return  # our own publish, already delivered locally
+        self._fanout(event, organization_id, seq)
+
+    def start_bus(self, main_loop, bus=None):
+        """Attach the configured bus; received events are fanned out on main_loop."""
+        self.bus = bus if bus is not None else create_bus()
+        if self.bus is None:
+            return
+        self._loop = main_loop
+        # Every worker on the channel shares the stream (and its sequence)
+        self.stream_id = self.bus.channel
+        self.bus.start(lambda payload: self._loop.call_soon_threadsafe(self._receive, payload))
+        logger.info(f"📡 Cross-worker SSE fan-out enabled ({BROADCAST_BACKEND}).")
+
+    def stop_bus(self):
+        if self.bus is not None:
+            self.bus.stop()
+            self.bus = None
+
+    def stats(self, organization_id: Optional[int] = None) -> dict:
+        """Queue depth and drop counters per subscriber (optionally for one organization)."""
+        subs = self.subscribers.values() if organization_id is None else self._by_org.get(organization_id, {}).values()
+        return {
+            "overflow_policy": self.overflow_policy,
+            "queue_maxsize": self.maxsize,
+            "bus": self.bus.stats() if self.bus is not None else {"backend": "local"},
+            "subscribers": [
+                {
+                    "id": sub.sid,
+                    "organization_id": sub.organization_id,
+                    "queued": sub.queue.qsize(),
+                    "dropped": sub.dropped,
+                    "disconnected": sub.disconnected,
+                }
+                for sub in list(subs)
+            ],
+        }
+
 
 # Single global broadcaster instance that other modules can import
 broadcaster = Broadcaster()
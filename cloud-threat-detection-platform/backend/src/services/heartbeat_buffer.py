@@ -0,0 +1,212 @@
+# backend/src/services/heartbeat_buffer.py
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import bindparam
+
+from src.database import SessionLocal
+from src.models.server import Server
+
+logger = logging.getLogger("ctdirp.heartbeats")
+logger.setLevel(logging.INFO)
+
+# Flush period of the coalesced heartbeat table. 0 keeps the legacy write-through path.
+HEARTBEAT_FLUSH_INTERVAL_MS = int(os.getenv("HEARTBEAT_FLUSH_INTERVAL_MS", "1000"))
+# (user, hostname) -> server id entries kept; least recently used are evicted
+HEARTBEAT_ID_CACHE_SIZE = int(os.getenv("HEARTBEAT_ID_CACHE_SIZE", "10000"))
+
+
+class HeartbeatBuffer:
+    """
+    Latest heartbeat per server, kept in memory and written to `servers` in
+    bulk (one executemany per flush) instead of one UPDATE + commit per
+    heartbeat. Only servers already known are buffered; registering a new
+    server still goes through the DB. Until start() is called every caller
+    falls back to writing through (tests, scripts).
+    Ids whose row is gone at flush time (deleted via another worker) are
+    dropped, so the next heartbeat re-registers the server.
+    """
+    def __init__(self, max_ids: int = HEARTBEAT_ID_CACHE_SIZE):
+        self.running = False
+        self.max_ids = max_ids
+        self.session_factory = SessionLocal
+        self.flushes = 0
+        self.rows_written = 0
+        self._pending: Dict[int, dict] = {}
+        self._inflight: Dict[int, dict] = {}
+        self._ids: "OrderedDict[Tuple[int, str], int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------------------------------------------------------
+    # Server id cache (skips the per-heartbeat SELECT)
+    # ---------------------------------------------------------
+    def lookup(self, user_id: int, hostname: str) -> Optional[int]:
+        key = (user_id, hostname)
+        with self._lock:
+            server_id = self._ids.get(key)
+            if server_id is not None:
+                self._ids.move_to_end(key)
+            return server_id
+
+    def remember(self, user_id: int, hostname: str, server_id: int):
+        key = (user_id, hostname)
+        with self._lock:
+            self._ids[key] = server_id
+            self._ids.move_to_end(key)
+            while len(self._ids) > self.max_ids:
+                self._ids.popitem(last=False)
+
+    def forget(self, server_id: int):
+        """Drop a deleted server so its buffered heartbeat is never written back."""
+        with self._lock:
+            self._forget_locked({server_id})
+
+    def _forget_locked(self, server_ids: set):
+        for server_id in server_ids:
+            self._pending.pop(server_id, None)
+        for key in [k for k, v in self._ids.items() if v in server_ids]:
+            del self._ids[key]
+
+    # ---------------------------------------------------------
+    # Recording & reading
+    # ---------------------------------------------------------
+    def record(self, server_id: int, **fields):
+        """Coalesce a heartbeat: later values overwrite earlier ones until the next flush."""
+        fields = {k: v for k, v in fields.items() if v is not None}
+        fields["last_heartbeat"] = datetime.utcnow()
+        fields["status"] = "online"
+        with self._lock:
+            self._pending.setdefault(server_id, {}).update(fields)
+
+    def latest(self, server_id: int) -> Optional[dict]:
+        """Not-yet-persisted values for a server (pending wins over in-flight)."""
+        with self._lock:
+            inflight = self._inflight.get(server_id)
+            pending = self._pending.get(server_id)
+        if inflight is None and pending is None:
+            return None
+        merged = dict(inflight or {})
+        merged.update(pending or {})
+        return merged
+
+    def overlay(self, server: Server) -> Server:
+        """Apply buffered values to a loaded Server (read-only use, e.g. list_servers)."""
+        values = self.latest(server.id)
+        if values:
+            for field, value in values.items():
+                setattr(server, field, value)
+        return server
+
+    # ---------------------------------------------------------
+    # Flushing
+    # ---------------------------------------------------------
+    def flush(self) -> int:
+        """Write every buffered server in one transaction. Returns rows written."""
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            self._inflight = batch
+
+        # executemany needs a uniform column set, so group rows by the fields they carry
+        groups: Dict[tuple, list] = {}
+        for server_id, fields in batch.items():
+            cols = tuple(sorted(fields))
+            groups.setdefault(cols, []).append({"_id": server_id, **fields})
+
+        table = Server.__table__
+        db = self.session_factory()
+        try:
+            matched, exact = 0, True
+            for cols, rows in groups.items():
+                stmt = table.update().where(table.c.id == bindparam("_id")).values(
+                    {c: bindparam(c) for c in cols}
+                )
+                result = db.execute(stmt, rows)
+                exact = exact and result.supports_sane_multi_rowcount()
+                matched += result.rowcount
+            missing = set()
+            if not exact or matched < len(batch):
+                # Some servers were deleted (possibly through another worker)
+                existing = {sid for (sid,) in db.query(Server.id).filter(Server.id.in_(list(batch)))}
+                missing = set(batch) - existing
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Heartbeat flush failed ({len(batch)} servers), will retry: {e}")
+            with self._lock:
+                # Re-queue, without clobbering heartbeats that arrived meanwhile
+                for server_id, fields in batch.items():
+                    merged = dict(fields)
+                    merged.update(self._pending.get(server_id, {}))
+                    self._pending[server_id] = merged
+                self._inflight = {}
+            return 0
+        finally:
+            db.close()
+
+        with self._lock:
+            self._inflight = {}
+            if missing:
+                self._forget_locked(missing)
+        if missing:
+            logger.info(f"Dropped {len(missing)} deleted server(s) from the heartbeat cache: {sorted(missing)}")
+        written = len(batch) - len(missing)
+        self.flushes += 1
+        self.rows_written += written
+        return written
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Heartbeat flusher error")
+
+    def start(self, session_factory=None, interval_ms: int = HEARTBEAT_FLUSH_INTERVAL_MS):
+        """Enable coalescing. interval_ms <= 0 enables it without the flusher thread (manual flush)."""
+        if session_factory is not None:
+            self.session_factory = session_factory
+        self.running = True
+        self._stop.clear()
+        if interval_ms > 0 and (self._thread is None or not self._thread.is_alive()):
+            self._thread = threading.Thread(target=self._run, args=(interval_ms / 1000.0,),
+                                            daemon=True, name="heartbeat-flusher")
+            self._thread.start()
+            logger.info(f"💓 Heartbeat coalescing enabled (flush every {interval_ms}ms).")
+
+    def stop(self, flush: bool = True):
+        """Stop the flusher and (by default) persist whatever is still buffered."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.running = False
+        if flush:
+            self.flush()
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+            self._inflight.clear()
+            self._ids.clear()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+        }
+
+
+# Single global buffer; started by main.startup_event
+heartbeat_buffer = HeartbeatBuffer()
@@ -0,0 +1,80 @@
+# backend/src/services/incident_dedup.py
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from src.services.session_hooks import committed, defer, discard_rolled_back
+
+INCIDENT_DEDUP_CACHE_SIZE = int(os.getenv("INCIDENT_DEDUP_CACHE_SIZE", "10000"))
+
+_PENDING_KEY = "fingerprint_index_pending"
+
+
+def incident_fingerprint(organization_id: Optional[int], source: Optional[str], event_type: Optional[str],
+                         rule_key: Any, user_id: Optional[int] = None) -> str:
+    """
+    Correlation key for merging events into an open incident:
+    (org, source, event_type, rule). Events without an org fall back to the
+    reporting user so legacy data stays isolated per user.
+    """
+    scope = f"org:{organization_id}" if organization_id is not None else f"user:{user_id}"
+    raw = f"{scope}|{source}|{event_type}|{rule_key}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class FingerprintIndex:
+    """
+    Bounded LRU of fingerprint -> open incident id, sitting in front of the
+    partial index on incidents.fingerprint. Entries are hints only: callers
+    re-check the row (still open, same fingerprint) before trusting a hit.
+    """
+    def __init__(self, maxsize: int = INCIDENT_DEDUP_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint: str) -> Optional[int]:
+        with self._lock:
+            incident_id = self._entries.get(fingerprint)
+            if incident_id is not None:
+                self._entries.move_to_end(fingerprint)
+            return incident_id
+
+    def put(self, fingerprint: str, incident_id: int):
+        with self._lock:
+            self._entries[fingerprint] = incident_id
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def put_on_commit(self, db: Session, fingerprint: str, incident_id: int):
+        """put() once `db` commits; dropped if the write rolls back."""
+        defer(db, _PENDING_KEY, (fingerprint, incident_id))
+
+    def _commit(self, session: Session):
+        for fingerprint, incident_id in committed(session, _PENDING_KEY):
+            self.put(fingerprint, incident_id)
+
+    def _rollback(self, session: Session, previous_transaction):
+        discard_rolled_back(session, _PENDING_KEY, previous_transaction)
+
+    def discard(self, fingerprint: str):
+        with self._lock:
+            self._entries.pop(fingerprint, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Single global index shared by the rule engine (API workers and Kafka consumer)
+fingerprint_index = FingerprintIndex()
+
+event.listen(Session, "after_commit", fingerprint_index._commit)
+event.listen(Session, "after_soft_rollback", fingerprint_index._rollback)
@@ -0,0 +1,76 @@
+# backend/src/services/incident_sequence.py
+
+import logging
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from src.database import SessionLocal
+from src.models.organization import Organization
+
+logger = logging.getLogger("ctdirp.incident_sequence")
+logger.setLevel(logging.INFO)
+
+# Ids reserved per round-trip. 1 allocates inside the caller's transaction
+# (gap-free unless it rolls back, but the org row stays locked until commit).
+# Larger blocks are reserved in their own short transaction and handed out
+# from memory, so parallel consumers never wait on each other; ids left in a
+# block when the process exits are skipped.
+INCIDENT_ID_BLOCK_SIZE = int(os.getenv("INCIDENT_ID_BLOCK_SIZE", "1"))
+
+
+class IncidentSequence:
+    """
+    Friendly per-organization incident numbers (org_incident_id) from the
+    organizations.incident_seq counter, bumped with UPDATE ... RETURNING
+    instead of a MAX() scan over incidents. The UPDATE takes the row lock,
+    so concurrent writers can never read the same value.
+    """
+    def __init__(self, block_size: int = INCIDENT_ID_BLOCK_SIZE):
+        self.block_size = block_size
+        self.session_factory = SessionLocal
+        self._blocks: Dict[int, Tuple[int, int]] = {}  # org_id -> (next, last)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def reserve(db: Session, organization_id: int, count: int = 1) -> int:
+        """Advance the counter by `count` in db's transaction; returns the first reserved id."""
+        last = db.execute(
+            update(Organization)
+            .where(Organization.id == organization_id)
+            .values(incident_seq=Organization.incident_seq + count)
+            .returning(Organization.incident_seq)
+        ).scalar_one()
+        return last - count + 1
+
+    def next_id(self, db: Session, organization_id: Optional[int]) -> int:
+        if organization_id is None:
+            return 1
+        if self.block_size <= 1:
+            return self.reserve(db, organization_id)
+
+        with self._lock:
+            nxt, last = self._blocks.get(organization_id, (1, 0))
+            if nxt > last:
+                # Own transaction: the lock is held for the refill only, not the caller's batch
+                refill = self.session_factory()
+                try:
+                    nxt = self.reserve(refill, organization_id, self.block_size)
+                    refill.commit()
+                finally:
+                    refill.close()
+                last = nxt + self.block_size - 1
+                logger.info(f"🔢 Reserved incident ids {nxt}-{last} for org={organization_id}")
+            self._blocks[organization_id] = (nxt + 1, last)
+            return nxt
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+
+
+# Single global allocator shared by the rule engine and incident routes
+incident_sequence = IncidentSequence()
@@ -0,0 +1,219 @@
+# backend/src/services/incident_stats.py
+
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from src.models.incident import Incident
+from src.services.session_hooks import committed, defer, discard_rolled_back
+
+logger = logging.getLogger("ctdirp.incident_stats")
+logger.setLevel(logging.INFO)
+
+# Reseed from the DB after this long: corrects drift from writes made by other
+# worker processes or raw SQL that bypass the hooks below.
+INCIDENT_STATS_TTL_SECONDS = float(os.getenv("INCIDENT_STATS_TTL_SECONDS", "300"))
+HISTOGRAM_DAYS = 30
+
+_PENDING_KEY = "incident_stats_pending"
+
+
+def _bucket(ts: Optional[datetime]) -> Optional[str]:
+    return ts.strftime("%Y-%m-%d %H:00") if ts else None
+
+
+class _OrgCounters:
+    def __init__(self):
+        self.loaded_at = time.monotonic()
+        self.total = 0
+        self.alerts = 0
+        self.severity = Counter()
+        self.status = Counter()
+        self.source = Counter()
+        self.hourly = Counter()  # "YYYY-MM-DD HH:00" -> incidents created
+        self.hourly_since = None  # oldest bucket kept in hourly
+
+    def prune_hourly(self):
+        """Drops buckets that have aged out of the HISTOGRAM_DAYS window."""
+        since = _bucket(datetime.utcnow() - timedelta(days=HISTOGRAM_DAYS))
+        if since == self.hourly_since:
+            return
+        self.hourly_since = since
+        for key in [k for k in self.hourly if k < since]:
+            del self.hourly[key]
+
+    def apply(self, delta: dict):
+        self.prune_hourly()
+        self.total += delta.get("total", 0)
+        self.alerts += delta.get("alerts", 0)
+        for field in ("severity", "status", "source", "hourly"):
+            counter = getattr(self, field)
+            for key, n in delta.get(field, {}).items():
+                if field == "hourly" and key < self.hourly_since:
+                    continue
+                counter[key] += n
+                if counter[key] <= 0:
+                    del counter[key]
+
+
+class IncidentStats:
+    """
+    Per-organization incident aggregates for GET /incidents/stats.
+    Seeded lazily with GROUP BY queries, then kept current by deltas that
+    writers record on their session; deltas are applied only once that
+    session commits, and dropped when their transaction (or the savepoint
+    they were recorded in) rolls back. Views restricted to part of an
+    organization (scoped_snapshot) are aggregated on request instead.
+    """
+    def __init__(self, ttl: float = INCIDENT_STATS_TTL_SECONDS):
+        self.ttl = ttl
+        self._orgs: Dict[int, _OrgCounters] = {}
+        self._lock = threading.Lock()
+
+    # ---------------------------------------------------------
+    # Recording (called by writers, inside their transaction)
+    # ---------------------------------------------------------
+    def _record(self, db: Session, organization_id: Optional[int], delta: dict):
+        if organization_id is None:
+            return
+        defer(db, _PENDING_KEY, (organization_id, delta))
+
+    def created(self, db: Session, incident: Incident):
+        self._record(db, incident.organization_id, {
+            "total": 1,
+            "alerts": incident.alert_count or 1,
+            "severity": {incident.severity: 1},
+            "status": {incident.status: 1},
+            "source": {incident.source: 1} if incident.source else {},
+            "hourly": {_bucket(incident.timestamp): 1} if incident.timestamp else {},
+        })
+
+    def deleted(self, db: Session, incident: Incident):
+        self._record(db, incident.organization_id, {
+            "total": -1,
+            "alerts": -(incident.alert_count or 1),
+            "severity": {incident.severity: -1},
+            "status": {incident.status: -1},
+            "source": {incident.source: -1} if incident.source else {},
+            "hourly": {_bucket(incident.timestamp): -1} if incident.timestamp else {},
+        })
+
+    def changed(self, db: Session, organization_id: Optional[int], field: str, old, new):
+        """field is "severity" or "status"."""
+        if old != new:
+            self._record(db, organization_id, {field: {old: -1, new: 1}})
+
+    def alert(self, db: Session, organization_id: Optional[int], n: int = 1):
+        self._record(db, organization_id, {"alerts": n})
+
+    def _commit(self, session: Session):
+        pending = committed(session, _PENDING_KEY)
+        if not pending:
+            return
+        with self._lock:
+            for organization_id, delta in pending:
+                counters = self._orgs.get(organization_id)
+                if counters is not None:  # unseeded orgs read the committed rows on first use
+                    counters.apply(delta)
+
+    def _rollback(self, session: Session, previous_transaction):
+        discard_rolled_back(session, _PENDING_KEY, previous_transaction)
+
+    # ---------------------------------------------------------
+    # Reading
+    # ---------------------------------------------------------
+    def _seed(self, db: Session, organization_id: int) -> _OrgCounters:
+        counters = self._aggregate(db, db.query(Incident).filter(Incident.organization_id == organization_id))
+        logger.info(f"📊 Seeded incident stats for org={organization_id} ({counters.total} incidents)")
+        return counters
+
+    @staticmethod
+    def _aggregate(db: Session, scoped) -> _OrgCounters:
+        counters = _OrgCounters()
+
+        total, alerts = scoped.with_entities(
+            func.count(Incident.id), func.coalesce(func.sum(func.coalesce(Incident.alert_count, 1)), 0)
+        ).one()
+        counters.total, counters.alerts = total, int(alerts)
+        for field, column in (("severity", Incident.severity), ("status", Incident.status), ("source", Incident.source)):
+            rows = scoped.with_entities(column, func.count(Incident.id)).group_by(column).all()
+            getattr(counters, field).update({k: n for k, n in rows if k is not None})
+
+        if db.bind.dialect.name == "sqlite":
+            bucket = func.strftime("%Y-%m-%d %H:00", Incident.timestamp)
+        else:
+            bucket = func.to_char(func.date_trunc("hour", Incident.timestamp), "YYYY-MM-DD HH24:00")
+        since = datetime.utcnow() - timedelta(days=HISTOGRAM_DAYS)
+        rows = (
+            scoped.filter(Incident.timestamp >= since)
+            .with_entities(bucket, func.count(Incident.id))
+            .group_by(bucket)
+            .all()
+        )
+        counters.hourly.update({k: n for k, n in rows if k is not None})
+        return counters
+
+    def snapshot(self, db: Session, organization_id: int, top_sources: int = 20) -> dict:
+        with self._lock:
+            counters = self._orgs.get(organization_id)
+        if counters is None or time.monotonic() - counters.loaded_at > self.ttl:
+            counters = self._seed(db, organization_id)
+            with self._lock:
+                self._orgs[organization_id] = counters
+        with self._lock:
+            return self._render(counters, top_sources)
+
+    def scoped_snapshot(self, db: Session, organization_id: int, visible, top_sources: int = 20) -> dict:
+        """snapshot() over the org's incidents matching `visible` (a filter clause), read from the DB."""
+        scoped = db.query(Incident).filter(Incident.organization_id == organization_id, visible)
+        return self._render(self._aggregate(db, scoped), top_sources)
+
+    @staticmethod
+    def _render(counters: _OrgCounters, top_sources: int) -> dict:
+        now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        counters.prune_hourly()
+        hourly = [
+            {"bucket": _bucket(now - timedelta(hours=h)), "count": counters.hourly.get(_bucket(now - timedelta(hours=h)), 0)}
+            for h in range(23, -1, -1)
+        ]
+        daily_counts = Counter()
+        for key, n in counters.hourly.items():
+            daily_counts[key[:10]] += n
+        today = now.date()
+        daily = [
+            {"bucket": (today - timedelta(days=d)).isoformat(), "count": daily_counts.get((today - timedelta(days=d)).isoformat(), 0)}
+            for d in range(HISTOGRAM_DAYS - 1, -1, -1)
+        ]
+        return {
+            "total": counters.total,
+            "alerts": counters.alerts,
+            "by_severity": dict(counters.severity),
+            "by_status": dict(counters.status),
+            "by_source": dict(counters.source.most_common(top_sources)),
+            "hourly": hourly,
+            "daily": daily,
+        }
+
+    def invalidate(self, organization_id: Optional[int] = None):
+        with self._lock:
+            if organization_id is None:
+                self._orgs.clear()
+            else:
+                self._orgs.pop(organization_id, None)
+
+    def clear(self):
+        self.invalidate()
+
+
+# Single global aggregate store shared by the rule engine and incident routes
+incident_stats = IncidentStats()
+
+event.listen(Session, "after_commit", incident_stats._commit)
+event.listen(Session, "after_soft_rollback", incident_stats._rollback)
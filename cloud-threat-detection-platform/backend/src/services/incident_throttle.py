@@ -0,0 +1,221 @@
+# backend/src/services/incident_throttle.py
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import bindparam, event, func
+from sqlalchemy.orm import Session
+
+from src.database import SessionLocal
+from src.models.incident import Incident
+from src.services.broadcaster import broadcaster
+from src.services.incident_stats import incident_stats
+from src.services.session_hooks import committed, defer, discard_rolled_back
+
+logger = logging.getLogger("ctdirp.incident_throttle")
+logger.setLevel(logging.INFO)
+
+# After an event is written into an incident, repeats with the same fingerprint
+# (org, source, event_type, rule) only bump an in-memory counter for this long.
+# 0 disables throttling: every event merges through the DB.
+INCIDENT_THROTTLE_SECONDS = float(os.getenv("INCIDENT_THROTTLE_SECONDS", "0"))
+# How often suppressed counts are written to incidents.alert_count
+INCIDENT_THROTTLE_FLUSH_MS = int(os.getenv("INCIDENT_THROTTLE_FLUSH_MS", "2000"))
+
+_PENDING_KEY = "incident_throttle_pending"
+
+
+class _Window:
+    __slots__ = ("incident_id", "organization_id", "title", "severity", "opened_at")
+
+    def __init__(self, incident: Incident, opened_at: Optional[float] = None):
+        self.incident_id = incident.id
+        self.organization_id = incident.organization_id
+        self.title = incident.title
+        self.severity = incident.severity
+        self.opened_at = opened_at
+
+
+class IncidentThrottle:
+    """
+    Suppression window per incident fingerprint. The first matching event
+    goes through the normal merge/create path and opens the window; until it
+    closes, repeats are absorbed as a count per incident. A flusher thread
+    adds the counts to alert_count in one executemany and pushes one
+    alerts_merged event per incident. Disabled until start() is called.
+    """
+    def __init__(self, window: float = INCIDENT_THROTTLE_SECONDS):
+        self.window = window
+        self.running = False
+        self.session_factory = SessionLocal
+        self.suppressed = 0
+        self.flushes = 0
+        self._windows: Dict[str, _Window] = {}
+        self._pending: Dict[int, list] = {}  # incident_id -> [count, last_seen, organization_id]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop = None
+
+    # ---------------------------------------------------------
+    # Rule engine hooks
+    # ---------------------------------------------------------
+    def absorb(self, fingerprint: Optional[str]) -> Optional[_Window]:
+        """Count a repeat inside an open window. Returns the window, or None if the event must hit the DB."""
+        if not self.running or not fingerprint:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(fingerprint)
+            if window is None or now - window.opened_at >= self.window:
+                return None
+            pending = self._pending.get(window.incident_id)
+            if pending is None:
+                self._pending[window.incident_id] = [1, datetime.utcnow(), window.organization_id]
+            else:
+                pending[0] += 1
+                pending[1] = datetime.utcnow()
+            self.suppressed += 1
+            return window
+
+    def track(self, db: Session, incident: Incident):
+        """
+        An event was just written into `incident`: (re)open its fingerprint's
+        window once `db` commits, so a rolled-back write never absorbs repeats.
+        """
+        if not self.running or not incident.fingerprint:
+            return
+        defer(db, _PENDING_KEY, (incident.fingerprint, _Window(incident)))
+
+    def _commit(self, session: Session):
+        pending = committed(session, _PENDING_KEY)
+        if not pending or not self.running:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for fingerprint, window in pending:
+                window.opened_at = now
+                self._windows[fingerprint] = window
+
+    def _rollback(self, session: Session, previous_transaction):
+        discard_rolled_back(session, _PENDING_KEY, previous_transaction)
+
+    def forget_incident(self, incident_id: int):
+        """Stop absorbing into an incident that was closed or deleted."""
+        with self._lock:
+            for fp in [fp for fp, w in self._windows.items() if w.incident_id == incident_id]:
+                del self._windows[fp]
+
+    # ---------------------------------------------------------
+    # Flushing
+    # ---------------------------------------------------------
+    def flush(self) -> int:
+        """Write suppressed counts to alert_count. Returns incidents updated."""
+        now = time.monotonic()
+        with self._lock:
+            for fp in [fp for fp, w in self._windows.items() if now - w.opened_at >= self.window]:
+                del self._windows[fp]
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+
+        table = Incident.__table__
+        stmt = table.update().where(table.c.id == bindparam("_id")).values(
+            alert_count=func.coalesce(table.c.alert_count, 1) + bindparam("_n"),
+            last_seen=bindparam("_seen"),
+            updated_at=bindparam("_seen"),
+        )
+        db = self.session_factory()
+        try:
+            db.execute(stmt, [{"_id": incident_id, "_n": n, "_seen": seen} for incident_id, (n, seen, _) in batch.items()])
+            for n, _, organization_id in batch.values():
+                incident_stats.alert(db, organization_id, n)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Throttle flush failed ({len(batch)} incidents), will retry: {e}")
+            with self._lock:
+                for incident_id, (n, seen, organization_id) in batch.items():
+                    pending = self._pending.setdefault(incident_id, [0, seen, organization_id])
+                    pending[0] += n
+            return 0
+        finally:
+            db.close()
+
+        self.flushes += 1
+        for incident_id, (n, seen, organization_id) in batch.items():
+            self._emit(incident_id, n, seen, organization_id)
+        return len(batch)
+
+    def _emit(self, incident_id: int, count: int, seen: datetime, organization_id: Optional[int]):
+        if self._loop is None or organization_id is None:
+            return
+        payload = {
+            "type": "alerts_merged",
+            "incident_id": incident_id,
+            "count": count,
+            "last_seen": seen.isoformat(),
+        }
+        try:
+            asyncio.run_coroutine_threadsafe(broadcaster.publish(payload, organization_id=organization_id), self._loop)
+        except RuntimeError:
+            pass  # loop closed during shutdown
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Throttle flusher error")
+
+    # ---------------------------------------------------------
+    # Lifecycle
+    # ---------------------------------------------------------
+    def start(self, main_loop=None, session_factory=None, interval_ms: int = INCIDENT_THROTTLE_FLUSH_MS):
+        """Enable throttling. interval_ms <= 0 enables it without the flusher thread (manual flush)."""
+        if session_factory is not None:
+            self.session_factory = session_factory
+        self._loop = main_loop
+        self.running = True
+        self._stop.clear()
+        if interval_ms > 0 and (self._thread is None or not self._thread.is_alive()):
+            self._thread = threading.Thread(target=self._run, args=(interval_ms / 1000.0,),
+                                            daemon=True, name="incident-throttle")
+            self._thread.start()
+        logger.info(f"🧯 Incident throttling enabled ({self.window:g}s window).")
+
+    def stop(self, flush: bool = True):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.running = False
+        if flush:
+            self.flush()
+
+    def clear(self):
+        with self._lock:
+            self._windows.clear()
+            self._pending.clear()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "window_seconds": self.window,
+            "open_windows": len(self._windows),
+            "pending_incidents": len(self._pending),
+            "suppressed": self.suppressed,
+            "flushes": self.flushes,
+        }
+
+
+# Single global throttle; started by main.startup_event when INCIDENT_THROTTLE_SECONDS > 0
+incident_throttle = IncidentThrottle()
+
+event.listen(Session, "after_commit", incident_throttle._commit)
+event.listen(Session, "after_soft_rollback", incident_throttle._rollback)
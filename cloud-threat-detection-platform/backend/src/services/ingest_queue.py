@@ -0,0 +1,135 @@
+# backend/src/services/ingest_queue.py
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Optional, Tuple
+
+from src.services.broadcaster import broadcaster
+
+logger = logging.getLogger("ctdirp.ingest_queue")
+logger.setLevel(logging.INFO)
+
+# Direct Mode decoupling: off by default so ingest stays synchronous unless enabled
+INGEST_QUEUE_ENABLED = os.getenv("INGEST_QUEUE_ENABLED") == "true"
+INGEST_QUEUE_MAXSIZE = int(os.getenv("INGEST_QUEUE_MAXSIZE", "10000"))
+INGEST_QUEUE_WORKERS = int(os.getenv("INGEST_QUEUE_WORKERS", "4"))
+
+
+class QueueFullError(Exception):
+    """Raised by submit() when the queue is at capacity (caller should shed load)."""
+
+
+# A handler turns one job into an optional (sse_payload, organization_id) to broadcast
+Handler = Callable[[Any], Optional[Tuple[dict, Optional[int]]]]
+
+
+class IngestQueue:
+    """
+    Bounded in-process work queue for Direct Mode (no Kafka).
+    The request handler enqueues and returns 202; worker tasks run the
+    blocking handler (SQLAlchemy, ML) in threads so the event loop stays free,
+    then broadcast the result on the loop.
+    """
+    def __init__(self, maxsize: int = INGEST_QUEUE_MAXSIZE, workers: int = INGEST_QUEUE_WORKERS,
+                 enabled: bool = INGEST_QUEUE_ENABLED):
+        self.maxsize = maxsize
+        self.workers = workers
+        self.enabled = enabled
+        self.handler: Optional[Handler] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._loop = None
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._lag_total = 0.0
+        self._lag_last = 0.0
+        self._lag_max = 0.0
+
+    def _ensure_started(self):
+        """Start workers lazily on the running loop (first submit after boot)."""
+        loop = asyncio.get_running_loop()
+        if self._queue is not None and self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [loop.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"🧵 Ingest queue started ({self.workers} workers, maxsize {self.maxsize}).")
+
+    def submit(self, job: Any):
+        """Enqueue without waiting. Raises QueueFullError when at capacity."""
+        if self.handler is None:
+            raise RuntimeError("IngestQueue.handler is not configured")
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((time.monotonic(), job))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError()
+        self.enqueued += 1
+
+    async def _worker(self, n: int):
+        while True:
+            enqueued_at, job = await self._queue.get()
+            lag = time.monotonic() - enqueued_at
+            self._lag_last = lag
+            self._lag_total += lag
+            self._lag_max = max(self._lag_max, lag)
+            try:
+                result = await asyncio.to_thread(self.handler, job)
+                if result:
+                    sse_payload, organization_id = result
+                    await broadcaster.publish(sse_payload, organization_id=organization_id)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception(f"Ingest worker {n} failed to process job")
+            finally:
+                self._queue.task_done()
+
+    async def join(self):
+        """Wait until every queued job has been processed."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self, drain: bool = True):
+        """Stop workers (optionally after draining) on app shutdown."""
+        if self._queue is None:
+            return
+        if drain:
+            await self.join()
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._loop = None
+
+    def stats(self) -> dict:
+        started = self.enqueued - self.depth
+        return {
+            "enabled": self.enabled,
+            "depth": self.depth,
+            "maxsize": self.maxsize,
+            "workers": self.workers,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "lag_ms_last": round(self._lag_last * 1000, 2),
+            "lag_ms_avg": round(self._lag_total / started * 1000, 2) if started > 0 else 0.0,
+            "lag_ms_max": round(self._lag_max * 1000, 2),
+        }
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+
+# Single global queue; routes/ingest.py installs the handler
+ingest_queue = IngestQueue()
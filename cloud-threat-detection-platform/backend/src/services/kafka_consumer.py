@@ -4,14 +4,15 @@ import os
 import time
 import logging
 import asyncio
-from kafka import KafkaConsumer
+import threading
+from datetime import datetime
+from kafka import KafkaConsumer, ConsumerRebalanceListener
 from kafka.errors import KafkaError
 from sqlalchemy.orm import Session
 
-# from src.services.rule_engine import RuleEngine # Removed
 from src.models.incident import Incident
 from src.database import get_db
-from src.services.anomaly_detector import detect_anomaly
+from src.services.anomaly_detector import detect_anomaly, detect_anomalies_batch
 from src.services.broadcaster import broadcaster
 from src.models.user import User
 from src.services.email_service import EmailService
@@ -23,6 +24,17 @@ KAFKA_TOPIC = os.getenv("KAFKA_TOPIC", "security-events")
 KAFKA_BOOTSTRAP = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
 KAFKA_GROUP = os.getenv("KAFKA_GROUP", "ctdirp-group")
 
+# "batch": poll() micro-batches, one transaction per batch, offsets committed after persist.
+# "stream": legacy one-message-at-a-time loop with auto-commit.
+KAFKA_CONSUMER_MODE = os.getenv("KAFKA_CONSUMER_MODE", "batch")
+KAFKA_BATCH_SIZE = int(os.getenv("KAFKA_BATCH_SIZE", "500"))
+KAFKA_BATCH_LINGER_MS = int(os.getenv("KAFKA_BATCH_LINGER_MS", "200"))
+
+# Consumers in the pool (same KAFKA_GROUP). More than the topic's partition count just idles.
+KAFKA_CONSUMER_WORKERS = int(os.getenv("KAFKA_CONSUMER_WORKERS", "1"))
+# How often the pool checks for dead worker threads and respawns them
+KAFKA_WORKER_CHECK_SECONDS = float(os.getenv("KAFKA_WORKER_CHECK_SECONDS", "10"))
+
 def run_anomaly_detector(event: dict, db: Session) -> dict | None:
     """
     Wrapper to call the external anomaly detector service.
@@ -34,179 +46,369 @@ def run_anomaly_detector(event: dict, db: Session) -> dict | None:
         return None
 
 
-def start_consumer(loop_forever=True, max_retries=20, retry_delay=5, main_loop=None):
-    """
-    Blocking function that attempts to start a Kafka consumer and process messages.
-    Designed to be run in a separate thread.
-    """
+def _connect(max_retries: int, retry_delay: int, stop_event: threading.Event | None = None,
+             listener: ConsumerRebalanceListener | None = None, **overrides) -> KafkaConsumer | None:
+    """Create the Kafka consumer, retrying while the broker comes up."""
     attempt = 0
-    consumer = None
-
-    while attempt < max_retries and consumer is None:
+    while attempt < max_retries and not (stop_event and stop_event.is_set()):
         attempt += 1
         try:
             logger.info(f"Attempting to start Kafka consumer (attempt {attempt}/{max_retries}) -> {KAFKA_BOOTSTRAP}")
-            consumer = KafkaConsumer(
-                KAFKA_TOPIC,
+            options = dict(
                 bootstrap_servers=KAFKA_BOOTSTRAP,
                 group_id=KAFKA_GROUP,
                 value_deserializer=lambda v: json.loads(v.decode("utf-8")),
                 auto_offset_reset="earliest",
                 enable_auto_commit=True
             )
+            options.update(overrides)
+            consumer = KafkaConsumer(**options)
+            consumer.subscribe([KAFKA_TOPIC], listener=listener)
             logger.info("✅ Kafka consumer connected and listening.")
-            break
+            return consumer
         except KafkaError as e:
             logger.warning(f"Kafka not available yet: {e}. Retrying in {retry_delay}s...")
             time.sleep(retry_delay)
-        except Exception as e:
+        except Exception:
             logger.error("Unexpected error while creating Kafka consumer:", exc_info=True)
             time.sleep(retry_delay)
 
-    if consumer is None:
-        logger.error("❌ Failed to connect to Kafka after retries. Consumer not started.")
-        return
+    logger.error("❌ Failed to connect to Kafka after retries. Consumer not started.")
+    return None
+
+
+# ---------------------------------------------------------
+# 🔥 Per-event pipeline
+# ---------------------------------------------------------
+
+_NOT_SCORED = object()
+
+
+def _handle_event(event: dict, db: Session, commit: bool = True, anomaly_result=_NOT_SCORED) -> dict:
+    """
+    Run the rule engine + anomaly detector for one event.
+    Every write is only flushed; commit=True commits them once at the end,
+    commit=False leaves that to the caller (one transaction per batch).
+    Batches pass anomaly_result pre-computed by detect_anomalies_batch.
+    Returns {"broadcast": payload|None, "email": kwargs|None} built while the
+    ORM objects are still loaded, so it is safe to use after the commit.
+    """
+    if event.get("event_type") == "system_heartbeat":
+        logger.debug(f"📥 Received heartbeat: {event}")
+    else:
+        logger.info(f"📥 Received event from Kafka: {event}")
+
+    def persist(obj):
+        db.add(obj)
+        db.flush()
+
+    # 1. Run rule engine (creates incidents if matched)
+    from src.services.rule_engine import process_event
+    rule_incidents = process_event(event, db, commit=False)
+    logger.info(f"🔍 Rule engine created incidents: {len(rule_incidents)}")
+
+    # 2. Run optional anomaly detector
+    if anomaly_result is _NOT_SCORED:
+        anomaly_result = run_anomaly_detector(event, db)
+    if anomaly_result:
+        logger.info(f"⚠️ Anomaly detector flagged: {anomaly_result}")
+
+    # 3. Handle Anomaly & Fallback Incidents
+    incident_obj = None # Keep track of created incident for broadcasting
+    event_id = event.get("event_id")
+
+    # If rule engine created incidents, use the first one for broadcast context
+    if rule_incidents:
+        incident_obj = rule_incidents[0].get("incident")
+
+    if not incident_obj:
+        # Check if we already have an incident for this event (deduplication)
+        if event_id:
+            existing = db.query(Incident).filter(Incident.event_id == event_id).first()
+            if existing:
+                logger.info(f"⚠ Skipping duplicate event_id={event_id}")
+                incident_obj = existing
+
+        if not incident_obj:
+            if anomaly_result:
+                # create a single incident for anomaly detection result
+                inc = Incident(
+                    event_id=event_id,
+                    title=f"Anomaly detected",
+                    description=f"Anomaly details: {anomaly_result}",
+                    severity="high",
+                    status="open",
+                    user_id=event.get("user_id")
+                )
+                persist(inc)
+                incident_obj = inc
+                logger.info(f"🟠 Created anomaly incident id={inc.id}")
 
-    # Main consume loop
+            # 4. Fallback: Create incident for ALL events (for testing visibility)
+            # Only if no rule matched and no anomaly (and not already created)
+            # EXCLUDE system_heartbeat to prevent spam
+            elif not rule_incidents and event.get("event_type") != "system_heartbeat":
+                inc = Incident(
+                    event_id=event_id,
+                    title=event.get("event_type", "Unknown Event"),
+                    description=event.get("details", str(event)),
+                    severity=(event.get("severity") or "low").lower(),
+                    status="open",
+                    timestamp=datetime.utcnow(),
+                    user_id=event.get("user_id")
+                )
+                persist(inc)
+                incident_obj = inc
+                logger.info(f"⚪ Created fallback incident id={inc.id}")
+
+    # ---------------------------------------------------------
+    # EMAIL ALERT (Critical/High) — resolved now, sent after persist
+    # ---------------------------------------------------------
+    email = None
+    if incident_obj and incident_obj.severity in ["critical", "high"]:
+        try:
+            # 1. Fetch User to get Organization
+            user_linked = db.query(User).filter(User.id == incident_obj.user_id).first()
+            if user_linked and user_linked.organization:
+                # 2. Fetch Admin for Organization
+                admin = db.query(User).filter(User.organization == user_linked.organization, User.role == "admin").first()
+                if admin and admin.email:
+                    email = dict(
+                        admin_email=admin.email,
+                        incident_title=incident_obj.title,
+                        incident_id=incident_obj.id,
+                        severity=incident_obj.severity,
+                        organization=user_linked.organization
+                    )
+        except Exception as e:
+            logger.error(f"Failed to resolve email alert recipient: {e}")
+
+    # ---------------------------------------------------------
+    # BROADCAST PAYLOAD
+    # ---------------------------------------------------------
+    # Only broadcast if it's NOT a heartbeat OR if it triggered something
+    broadcast = None
+    # Repeats absorbed by the incident throttle are reported by its flusher instead
+    throttled_only = bool(rule_incidents) and not anomaly_result and all(r.get("throttled") for r in rule_incidents)
+    if not throttled_only and (event.get("event_type") != "system_heartbeat" or rule_incidents or anomaly_result):
+        payload = {
+            "type": "event",
+            "event": event,
+            "rule_results": [r["title"] for r in rule_incidents] if rule_incidents else None,
+        }
+        if incident_obj:
+            payload["incident"] = {
+                "id": incident_obj.id,
+                "event_id": getattr(incident_obj, "event_id", None),
+                "title": incident_obj.title,
+                "severity": incident_obj.severity,
+                "status": incident_obj.status,
+                "timestamp": incident_obj.timestamp.isoformat() if incident_obj.timestamp else None
+            }
+        broadcast = (payload, getattr(incident_obj, "organization_id", None))
+
+    if commit:
+        db.commit()
+    return {"broadcast": broadcast, "email": email}
+
+
+def _dispatch(outcome: dict, main_loop):
+    """Side effects that must only happen once the event is persisted."""
+    if outcome["email"]:
+        try:
+            EmailService.send_critical_threat_alert(**outcome["email"])
+            logger.info(f"📧 Sent critical alert to admin {outcome['email']['admin_email']}")
+        except Exception as e:
+            logger.error(f"Failed to send email alert: {e}")
+
+    if outcome["broadcast"] and main_loop:
+        payload, org_id = outcome["broadcast"]
+        asyncio.run_coroutine_threadsafe(
+            broadcaster.publish(payload, organization_id=org_id), main_loop
+        )
+
+
+def process_batch(events: list, db: Session) -> list:
+    """
+    Persist a micro-batch in ONE transaction (savepoint per event so a
+    poison message is skipped without losing its neighbours).
+    Raises if the final commit fails — the caller must not commit offsets then.
+    """
     try:
-        for msg in consumer:
-            try:
-                event = msg.value
-                if event.get("event_type") == "system_heartbeat":
-                    logger.debug(f"📥 Received heartbeat: {event}")
-                else:
-                    logger.info(f"📥 Received event from Kafka: {event}")
-
-                # Obtain DB session (use generator from get_db())
-                db = next(get_db())
-
-                # 1. Run rule engine (creates incidents if matched)
-                from src.services.rule_engine import process_event
-                rule_incidents = process_event(event, db)
-                logger.info(f"🔍 Rule engine created incidents: {len(rule_incidents)}")
-
-                # 2. Run optional anomaly detector
-                anomaly_result = run_anomaly_detector(event, db)
-                if anomaly_result:
-                    logger.info(f"⚠️ Anomaly detector flagged: {anomaly_result}")
-
-                # 3. Handle Anomaly & Fallback Incidents
-                incident_obj = None # Keep track of created incident for broadcasting
-                
-                # Check for existing incident for this event_id
-                event_id = event.get("event_id")
-                
-                # If rule engine created incidents, use the first one for broadcast context
-                if rule_incidents:
-                    # Fetch the actual incident object for the first one
-                    first_inc_id = rule_incidents[0]["incident_id"]
-                    incident_obj = db.query(Incident).filter(Incident.id == first_inc_id).first()
-
-                if not incident_obj:
-                     # Check if we already have an incident for this event (deduplication)
-                    if event_id:
-                        existing = db.query(Incident).filter(Incident.event_id == event_id).first()
-                        if existing:
-                            logger.info(f"⚠ Skipping duplicate event_id={event_id}")
-                            incident_obj = existing
-                    
-                    if not incident_obj:
-                        if anomaly_result:
-                            # create a single incident for anomaly detection result
-                            inc = Incident(
-                                event_id=event_id,
-                                title=f"Anomaly detected",
-                                description=f"Anomaly details: {anomaly_result}",
-                                severity="high",
-                                status="open",
-                                user_id=event.get("user_id")
-                            )
-                            db.add(inc)
-                            db.commit()
-                            db.refresh(inc)
-                            incident_obj = inc
-                            logger.info(f"🟠 Created anomaly incident id={inc.id}")
-
-                        # 4. Fallback: Create incident for ALL events (for testing visibility)
-                        # Only if no rule matched and no anomaly (and not already created)
-                        # EXCLUDE system_heartbeat to prevent spam
-                        elif not rule_incidents and event.get("event_type") != "system_heartbeat":
-                            from datetime import datetime
-                            inc = Incident(
-                                event_id=event_id,
-                                title=event.get("event_type", "Unknown Event"),
-                                description=event.get("details", str(event)),
-                                severity=(event.get("severity") or "low").lower(),
-                                status="open",
-                                timestamp=datetime.utcnow(),
-                                user_id=event.get("user_id")
-                            )
-                            db.add(inc)
-                            db.commit()
-                            db.refresh(inc)
-                            incident_obj = inc
-                            logger.info(f"⚪ Created fallback incident id={inc.id}")
-
-
-                # ---------------------------------------------------------
-                # EMAIL ALERT (Critical/High)
-                # ---------------------------------------------------------
-                if incident_obj and incident_obj.severity in ["critical", "high"]:
-                    user_linked = None
-                    admin = None
+        anomalies = detect_anomalies_batch(events)
+    except Exception as e:
+        logger.error(f"Batch anomaly detection failed: {e}")
+        anomalies = [None] * len(events)
+
+    outcomes = []
+    for event, anomaly in zip(events, anomalies):
+        try:
+            with db.begin_nested():
+                outcomes.append(_handle_event(event, db, commit=False, anomaly_result=anomaly))
+        except Exception as e:
+            logger.exception(f"Error processing Kafka message (skipped): {e}")
+    db.commit()
+    return outcomes
+
+
+# ---------------------------------------------------------
+# 🔥 Worker stats & rebalance handling
+# ---------------------------------------------------------
+
+class ConsumerStats:
+    """Per-worker throughput counters (read by the stats endpoint, written by one thread)."""
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = time.time()
+        self.messages = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.failed_commits = 0
+        self.restarts = 0
+        self.rebalances = 0
+        self.partitions: list = []
+        self.last_batch_at = None
+
+    def record_batch(self, size: int):
+        self.batches += 1
+        self.messages += size
+        self.last_batch_at = time.time()
+
+    def snapshot(self) -> dict:
+        uptime = max(time.time() - self.started_at, 1e-6)
+        return {
+            "worker": self.name,
+            "messages": self.messages,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "failed_commits": self.failed_commits,
+            "restarts": self.restarts,
+            "messages_per_sec": round(self.messages / uptime, 2),
+            "rebalances": self.rebalances,
+            "partitions": self.partitions,
+            "last_batch_at": datetime.utcfromtimestamp(self.last_batch_at).isoformat() if self.last_batch_at else None,
+        }
+
+
+class _RebalanceListener(ConsumerRebalanceListener):
+    """
+    Tracks partition ownership. Each batch is persisted and its offsets
+    committed before the next poll() — where rebalance callbacks run — so a
+    revoked partition never has uncommitted work to hand over.
+    """
+    def __init__(self, stats: ConsumerStats):
+        self.stats = stats
+
+    def on_partitions_revoked(self, revoked):
+        self.stats.rebalances += 1
+        logger.info(f"🔀 {self.stats.name}: partitions revoked {sorted(str(tp) for tp in revoked)}")
+
+    def on_partitions_assigned(self, assigned):
+        self.stats.partitions = sorted(f"{tp.topic}:{tp.partition}" for tp in assigned)
+        logger.info(f"🔀 {self.stats.name}: partitions assigned {self.stats.partitions}")
+
+
+# ---------------------------------------------------------
+# 🔥 Consume loops
+# ---------------------------------------------------------
+
+def _consume_stream(consumer: KafkaConsumer, main_loop, stop_event=None, stats=None):
+    """Legacy loop: one message, one session, auto-committed offsets."""
+    while not (stop_event and stop_event.is_set()):
+        try:
+            # consumer_timeout_ms ends the iterator periodically so stop_event is honoured
+            for msg in consumer:
+                try:
+                    db = next(get_db())
                     try:
-                        # 1. Fetch User to get Organization
-                        user_linked = db.query(User).filter(User.id == incident_obj.user_id).first()
-                        if user_linked and user_linked.organization:
-                             # 2. Fetch Admin for Organization
-                             admin = db.query(User).filter(User.organization == user_linked.organization, User.role == "admin").first()
-                             if admin and admin.email:
-                                 EmailService.send_critical_threat_alert(
-                                     admin_email=admin.email,
-                                     incident_title=incident_obj.title,
-                                     incident_id=incident_obj.id,
-                                     severity=incident_obj.severity,
-                                     organization=user_linked.organization
-                                 )
-                                 logger.info(f"📧 Sent critical alert to admin {admin.email}")
-                    except Exception as e:
-                        logger.error(f"Failed to send email alert: {e}")
-
-                db.close()
-
-                # ---------------------------------------------------------
-                # BROADCAST TO SSE
-                # ---------------------------------------------------------
-                # Only broadcast if it's NOT a heartbeat OR if it triggered something
-                if event.get("event_type") != "system_heartbeat" or rule_incidents or anomaly_result:
-                    payload = {
-                        "type": "event",
-                        "event": event,
-                        "rule_results": [r["title"] for r in rule_incidents] if rule_incidents else None,
-                    }
-                    
-                    if incident_obj:
-                        payload["incident"] = {
-                            "id": incident_obj.id,
-                            "event_id": getattr(incident_obj, "event_id", None),
-                            "title": incident_obj.title,
-                            "severity": incident_obj.severity,
-                            "status": incident_obj.status,
-                            "timestamp": incident_obj.timestamp.isoformat() if incident_obj.timestamp else None
-                        }
-
-                    if main_loop:
-                        _org_id = getattr(incident_obj, "organization_id", None)
-                        asyncio.run_coroutine_threadsafe(
-                            broadcaster.publish(payload, organization_id=_org_id), main_loop
-                        )
-                
-                else:
-                    pass
-
-            except Exception as e:
-                logger.exception(f"Error processing Kafka message: {e}")
+                        outcome = _handle_event(msg.value, db)
+                    finally:
+                        db.close()
+                    _dispatch(outcome, main_loop)
+                    if stats:
+                        stats.record_batch(1)
+                except Exception as e:
+                    logger.exception(f"Error processing Kafka message: {e}")
+                if stop_event and stop_event.is_set():
+                    break
+        except KafkaError as e:
+            logger.warning(f"Kafka fetch failed, retrying: {e}")
+            time.sleep(1)
+
+
+def _consume_batches(consumer: KafkaConsumer, main_loop, batch_size: int, linger_ms: int,
+                     stop_event=None, stats=None):
+    """Micro-batch loop: poll → persist in one transaction → commit offsets."""
+    while not (stop_event and stop_event.is_set()):
+        try:
+            records = consumer.poll(timeout_ms=linger_ms, max_records=batch_size)
+        except KafkaError as e:
+            logger.warning(f"Kafka poll failed, retrying: {e}")
+            time.sleep(1)
+            continue
+        if not records:
+            continue
+
+        events = [msg.value for msgs in records.values() for msg in msgs]
+        db = next(get_db())
+        try:
+            outcomes = process_batch(events, db)
+        except Exception as e:
+            logger.exception(f"Batch of {len(events)} events failed, will be redelivered: {e}")
+            db.rollback()
+            if stats:
+                stats.failed_batches += 1
+            # Rewind so the uncommitted batch is consumed again
+            for tp, msgs in records.items():
+                consumer.seek(tp, msgs[0].offset)
+            time.sleep(1)
+            continue
+        finally:
+            db.close()
+
+        # Offsets move only after the batch is durable (at-least-once)
+        try:
+            consumer.commit()
+        except KafkaError as e:
+            # e.g. CommitFailedError after a rebalance: the new owner gets the
+            # batch again, and merge-by-fingerprint absorbs the repeat
+            logger.warning(f"Offset commit failed, batch of {len(events)} will be redelivered: {e}")
+            if stats:
+                stats.failed_commits += 1
+        if stats:
+            stats.record_batch(len(events))
+        logger.info(f"📦 Persisted batch of {len(events)} events.")
+
+        for outcome in outcomes:
+            _dispatch(outcome, main_loop)
 
+
+def start_consumer(loop_forever=True, max_retries=20, retry_delay=5, main_loop=None,
+                   mode=None, batch_size=None, linger_ms=None, stop_event=None, stats=None):
+    """
+    Blocking function that attempts to start a Kafka consumer and process messages.
+    Designed to be run in a separate thread; returns once stop_event is set.
+    """
+    mode = mode or KAFKA_CONSUMER_MODE
+    batch_size = batch_size or KAFKA_BATCH_SIZE
+    linger_ms = linger_ms or KAFKA_BATCH_LINGER_MS
+    stats = stats or ConsumerStats(threading.current_thread().name)
+    listener = _RebalanceListener(stats)
+
+    if mode == "batch":
+        consumer = _connect(max_retries, retry_delay, stop_event, listener,
+                            enable_auto_commit=False, max_poll_records=batch_size)
+    else:
+        consumer = _connect(max_retries, retry_delay, stop_event, listener, consumer_timeout_ms=1000)
+    if consumer is None:
+        return
+
+    try:
+        if mode == "batch":
+            logger.info(f"📦 Micro-batch mode: up to {batch_size} records / {linger_ms}ms per poll.")
+            _consume_batches(consumer, main_loop, batch_size, linger_ms, stop_event, stats)
+        else:
+            _consume_stream(consumer, main_loop, stop_event, stats)
     except KeyboardInterrupt:
         logger.info("Kafka consumer stopped by KeyboardInterrupt")
     except Exception:
@@ -217,3 +419,87 @@ def start_consumer(loop_forever=True, max_retries=20, retry_delay=5, main_loop=N
         except Exception:
             pass
         logger.info("Kafka consumer closed")
+
+
+# ---------------------------------------------------------
+# 🔥 Consumer pool
+# ---------------------------------------------------------
+
+class ConsumerPool:
+    """
+    N consumer threads in the same KAFKA_GROUP. Kafka assigns each partition
+    to exactly one member, and each member processes its batches in order,
+    so per-partition ordering is preserved. To use more cores, run more app
+    processes — they join the same group and split the partitions.
+    A supervisor thread respawns workers that die, so the pool keeps its size.
+    """
+    def __init__(self):
+        self.workers = []
+        self.stats = []
+        self._stop = threading.Event()
+        self._main_loop = None
+        self._supervisor = None
+
+    def _spawn(self, stats: ConsumerStats) -> threading.Thread:
+        t = threading.Thread(
+            target=start_consumer,
+            kwargs=dict(main_loop=self._main_loop, stop_event=self._stop, stats=stats),
+            daemon=True,
+            name=stats.name
+        )
+        t.start()
+        return t
+
+    def start(self, workers: int = KAFKA_CONSUMER_WORKERS, main_loop=None,
+              check_interval: float = KAFKA_WORKER_CHECK_SECONDS):
+        self._stop.clear()
+        self._main_loop = main_loop
+        for i in range(max(1, workers)):
+            stats = ConsumerStats(f"kafka-consumer-{i}")
+            self.workers.append(self._spawn(stats))
+            self.stats.append(stats)
+        if check_interval > 0:
+            self._supervisor = threading.Thread(target=self._supervise, args=(check_interval,),
+                                                daemon=True, name="kafka-consumer-supervisor")
+            self._supervisor.start()
+        logger.info(f"🧵 Started {len(self.workers)} Kafka consumer worker(s) in group '{KAFKA_GROUP}'.")
+
+    def check_workers(self) -> int:
+        """Respawn workers whose thread ended while the pool is running. Returns how many."""
+        restarted = 0
+        for i, t in enumerate(self.workers):
+            if t.is_alive() or self._stop.is_set():
+                continue
+            stats = self.stats[i]
+            stats.restarts += 1
+            logger.error(f"💀 {t.name} died, restarting it (restart #{stats.restarts})")
+            self.workers[i] = self._spawn(stats)
+            restarted += 1
+        return restarted
+
+    def _supervise(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.check_workers()
+            except Exception:
+                logger.exception("Kafka consumer supervisor error")
+
+    def stop(self, timeout: float = 10.0):
+        """Signal every worker to finish its current batch, then wait for them."""
+        self._stop.set()
+        if self._supervisor is not None:
+            self._supervisor.join(timeout=timeout)
+            self._supervisor = None
+        for t in self.workers:
+            t.join(timeout=timeout)
+        alive = [t.name for t in self.workers if t.is_alive()]
+        if alive:
+            logger.warning(f"Kafka consumers still running after {timeout}s: {alive}")
+        self.workers = []
+
+    def snapshot(self) -> list:
+        return [s.snapshot() for s in self.stats]
+
+
+# Global pool started by main.startup_event when KAFKA_ENABLED=true
+consumer_pool = ConsumerPool()
@@ -0,0 +1,284 @@
+# backend/src/services/liveness.py
+
+import asyncio
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, or_, update
+from sqlalchemy.orm import Session
+
+from src.database import SessionLocal
+from src.models.server import Server
+from src.services.broadcaster import broadcaster
+from src.services.session_hooks import committed, defer, discard_rolled_back
+
+logger = logging.getLogger("ctdirp.liveness")
+logger.setLevel(logging.INFO)
+
+# A server with no heartbeat for this long is offline (was hard-coded in list_servers)
+SERVER_OFFLINE_AFTER_SECONDS = int(os.getenv("SERVER_OFFLINE_AFTER_SECONDS", "90"))
+
+_PENDING_KEY = "liveness_pending"
+
+
+class _ServerState:
+    __slots__ = ("organization_id", "hostname", "deadline", "online")
+
+    def __init__(self, organization_id, hostname, deadline, online):
+        self.organization_id = organization_id
+        self.hostname = hostname
+        self.deadline = deadline
+        self.online = online
+
+
+class LivenessTracker:
+    """
+    Deadline per server in a min-heap. Each heartbeat pushes a new deadline
+    (older heap entries are skipped lazily); a background thread sleeps until
+    the earliest deadline, marks expired servers offline once in the DB and
+    pushes server_offline / server_online events through the broadcaster.
+
+    Every worker runs a tracker but only sees its own heartbeats, so the DB
+    decides: a server goes offline only if its stored last_heartbeat is stale
+    too, and only the worker whose UPDATE changed the row emits the event.
+    A server that is fresh in the DB is re-armed from that heartbeat.
+    """
+    def __init__(self, timeout: float = SERVER_OFFLINE_AFTER_SECONDS):
+        self.timeout = timeout
+        self.running = False
+        self.session_factory = SessionLocal
+        self._servers: Dict[int, _ServerState] = {}
+        self._heap: List[tuple] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop = None
+
+    # ---------------------------------------------------------
+    # Heartbeats
+    # ---------------------------------------------------------
+    def beat(self, server_id: int, organization_id: Optional[int], hostname: str, now: Optional[float] = None):
+        """Record a heartbeat; emits server_online if the server was offline."""
+        now = time.monotonic() if now is None else now
+        deadline = now + self.timeout
+        with self._lock:
+            state = self._servers.get(server_id)
+            came_back = state is not None and not state.online
+            if state is None:
+                state = _ServerState(organization_id, hostname, deadline, True)
+                self._servers[server_id] = state
+            state.deadline = deadline
+            state.online = True
+            state.hostname = hostname
+            heapq.heappush(self._heap, (deadline, server_id))
+        if came_back:
+            logger.info(f"🟢 Server {hostname} (id={server_id}) is back online.")
+            self._emit("server_online", server_id, state)
+
+    def beat_on_commit(self, db: Session, server_id: int, organization_id: Optional[int], hostname: str):
+        """beat() once the heartbeat's transaction commits (nothing if it rolls back)."""
+        if self.running:
+            defer(db, _PENDING_KEY, (server_id, organization_id, hostname))
+
+    def _commit(self, session: Session):
+        for server_id, organization_id, hostname in committed(session, _PENDING_KEY):
+            self.beat(server_id, organization_id, hostname)
+
+    def _rollback(self, session: Session, previous_transaction):
+        discard_rolled_back(session, _PENDING_KEY, previous_transaction)
+
+    def forget(self, server_id: int):
+        with self._lock:
+            self._servers.pop(server_id, None)
+
+    def status(self, server_id: int) -> Optional[str]:
+        """
+        "online" for servers this process has a live deadline for, else None:
+        their heartbeats may be going to another worker, so callers use the DB.
+        """
+        state = self._servers.get(server_id)
+        if state is None or not state.online:
+            return None
+        return "online"
+
+    def seed(self, rows):
+        """
+        Start from the DB: rows of (server_id, organization_id, hostname,
+        last_heartbeat, status). Servers that expired while nobody was
+        watching are persisted offline once, without events.
+        """
+        now_mono, now_wall = time.monotonic(), datetime.utcnow()
+        stale = []
+        with self._lock:
+            for server_id, organization_id, hostname, last_heartbeat, db_status in rows:
+                age = (now_wall - last_heartbeat).total_seconds() if last_heartbeat else self.timeout
+                deadline = now_mono + self.timeout - age
+                online = age < self.timeout
+                self._servers[server_id] = _ServerState(organization_id, hostname, deadline, online)
+                if online:
+                    heapq.heappush(self._heap, (deadline, server_id))
+                elif db_status != "offline":
+                    stale.append(server_id)
+        if stale:
+            self._persist_offline(stale, now_wall - timedelta(seconds=self.timeout))
+        logger.info(f"💓 Liveness tracker seeded with {len(rows)} servers ({len(stale)} marked offline).")
+
+    # ---------------------------------------------------------
+    # Expiry
+    # ---------------------------------------------------------
+    def tick(self, now: Optional[float] = None) -> List[int]:
+        """Expire every passed deadline. Returns the ids that went offline."""
+        now = time.monotonic() if now is None else now
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, server_id = heapq.heappop(self._heap)
+                state = self._servers.get(server_id)
+                # Stale entry: a later heartbeat pushed a newer deadline
+                if state is None or not state.online or state.deadline != deadline:
+                    continue
+                state.online = False
+                expired.append((server_id, state))
+
+        if not expired:
+            return []
+
+        # Wall-clock equivalent of `now` (tests tick with a future monotonic time)
+        now_wall = datetime.utcnow() + timedelta(seconds=now - time.monotonic())
+        result = self._persist_offline([sid for sid, _ in expired], now_wall - timedelta(seconds=self.timeout))
+        if result is None:
+            # DB unavailable: retry these on a later tick
+            with self._lock:
+                for server_id, state in expired:
+                    state.online = True
+                    state.deadline = now + 1.0
+                    heapq.heappush(self._heap, (state.deadline, server_id))
+            return []
+
+        changed, heartbeats = result
+        went_offline = []
+        with self._lock:
+            for server_id, state in expired:
+                if server_id in changed:
+                    went_offline.append((server_id, state))
+                    continue
+                last_heartbeat = heartbeats.get(server_id)
+                if last_heartbeat is not None and (now_wall - last_heartbeat).total_seconds() < self.timeout:
+                    # Another worker is receiving its heartbeats
+                    state.online = True
+                    state.deadline = now + self.timeout - (now_wall - last_heartbeat).total_seconds()
+                    heapq.heappush(self._heap, (state.deadline, server_id))
+                # else: already offline in the DB, another worker reported it
+
+        for server_id, state in went_offline:
+            logger.info(f"🔴 Server {state.hostname} (id={server_id}) went offline.")
+            self._emit("server_offline", server_id, state)
+        return [sid for sid, _ in went_offline]
+
+    def _persist_offline(self, server_ids: List[int], cutoff: datetime) -> Optional[Tuple[set, dict]]:
+        """
+        One UPDATE for every transition of this tick, limited to rows whose
+        DB heartbeat is older than `cutoff` and not offline yet. Returns
+        (ids changed, {unchanged id: last_heartbeat}), or None on error.
+        """
+        db = self.session_factory()
+        try:
+            changed = set(db.execute(
+                update(Server)
+                .where(
+                    Server.id.in_(server_ids),
+                    Server.status != "offline",
+                    or_(Server.last_heartbeat.is_(None), Server.last_heartbeat < cutoff),
+                )
+                .values(status="offline")
+                .returning(Server.id)
+                .execution_options(synchronize_session=False)
+            ).scalars())
+            unchanged = [sid for sid in server_ids if sid not in changed]
+            heartbeats = dict(
+                db.query(Server.id, Server.last_heartbeat).filter(Server.id.in_(unchanged)).all()
+            ) if unchanged else {}
+            db.commit()
+            return changed, heartbeats
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to persist offline status for {server_ids}: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _emit(self, event_type: str, server_id: int, state: _ServerState):
+        if self._loop is None or state.organization_id is None:
+            return
+        payload = {
+            "type": event_type,
+            "server_id": server_id,
+            "hostname": state.hostname,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        try:
+            asyncio.run_coroutine_threadsafe(
+                broadcaster.publish(payload, organization_id=state.organization_id), self._loop
+            )
+        except RuntimeError:
+            pass  # loop closed during shutdown
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._lock:
+                next_deadline = self._heap[0][0] if self._heap else None
+            delay = 1.0 if next_deadline is None else max(0.0, min(1.0, next_deadline - time.monotonic()))
+            self._stop.wait(delay)
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Liveness tracker error")
+
+    # ---------------------------------------------------------
+    # Lifecycle
+    # ---------------------------------------------------------
+    def start(self, main_loop=None, session_factory=None, background: bool = True):
+        """Seed from the DB and start the expiry thread."""
+        if session_factory is not None:
+            self.session_factory = session_factory
+        self._loop = main_loop
+        db = self.session_factory()
+        try:
+            from src.models.user import User
+            rows = (
+                db.query(Server.id, User.organization_id, Server.hostname, Server.last_heartbeat, Server.status)
+                .join(User, User.id == Server.user_id)
+                .all()
+            )
+        finally:
+            db.close()
+        self.seed(rows)
+        self.running = True
+        self._stop.clear()
+        if background and (self._thread is None or not self._thread.is_alive()):
+            self._thread = threading.Thread(target=self._run, daemon=True, name="liveness-tracker")
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.running = False
+
+    def clear(self):
+        with self._lock:
+            self._servers.clear()
+            self._heap.clear()
+
+
+# Single global tracker; started by main.startup_event
+liveness = LivenessTracker()
+
+event.listen(Session, "after_commit", liveness._commit)
+event.listen(Session, "after_soft_rollback", liveness._rollback)
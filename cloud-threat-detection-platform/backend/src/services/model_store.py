@@ -0,0 +1,209 @@
+# backend/src/services/model_store.py
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import joblib
+
+logger = logging.getLogger("ctdirp.ml")
+
+# Trained versions kept on disk per server (the approved one is always kept)
+ML_MODEL_KEEP_VERSIONS = int(os.getenv("ML_MODEL_KEEP_VERSIONS", "3"))
+# "memory": per-process deque (state.json on eviction); with several workers
+# each one collects its own samples and trains its own model of a server.
+# "sqlite": one buffer shared by every worker process on the host, and a
+# single worker trains. Defaults to "sqlite" when uvicorn runs several
+# workers (WEB_CONCURRENCY > 1).
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1") or 1)
+ML_BUFFER_BACKEND = os.getenv("ML_BUFFER_BACKEND", "sqlite" if WEB_CONCURRENCY > 1 else "memory")
+ML_BUFFER_DB = os.getenv("ML_BUFFER_DB", os.path.join("models", "training_buffers.sqlite3"))
+# A training claim older than this is considered abandoned (worker died mid-fit)
+ML_TRAINING_CLAIM_TTL_SECONDS = int(os.getenv("ML_TRAINING_CLAIM_TTL_SECONDS", "600"))
+
+
+# ---------------------------------------------------------
+# 🔥 Versioned model files
+# ---------------------------------------------------------
+
+class ModelStore:
+    """
+    Versioned model artifacts per detector: <base>.v<N>.joblib plus a
+    <base>.meta.json pointer {"latest", "approved", "versions"}. Each worker
+    process loads its own copy of a model, so model memory grows with the
+    number of workers; files are written uncompressed so that load is a
+    plain read. Workers agree on which version is live through the meta file.
+    """
+
+    @staticmethod
+    def _meta_path(base: str) -> str:
+        return base + ".meta.json"
+
+    @staticmethod
+    def _version_path(base: str, version: int) -> str:
+        return f"{base}.v{version}.joblib"
+
+    def read_meta(self, base: str) -> dict | None:
+        try:
+            with open(self._meta_path(base)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Unreadable model metadata {self._meta_path(base)}: {e}")
+            return None
+
+    def _write_meta(self, base: str, meta: dict):
+        tmp = f"{self._meta_path(base)}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._meta_path(base))
+
+    def exists(self, base: str) -> bool:
+        return os.path.exists(self._meta_path(base)) or os.path.exists(base + ".pkl")
+
+    def load(self, base: str):
+        """Return (model, version, approved) for the latest version, or (None, None, False)."""
+        meta = self.read_meta(base)
+        if meta and meta.get("latest") is not None:
+            version = meta["latest"]
+            model = joblib.load(self._version_path(base, version))
+            return model, version, meta.get("approved") == version
+
+        # Legacy single-file model (pre-versioning): it was live, treat as approved
+        legacy = base + ".pkl"
+        if os.path.exists(legacy):
+            return joblib.load(legacy), 0, True
+        return None, None, False
+
+    def save(self, base: str, model) -> int:
+        """Write a new version and point "latest" at it; "approved" is left alone."""
+        meta = self.read_meta(base) or {"latest": None, "approved": None, "versions": []}
+        version = max(meta["versions"] or [0]) + 1
+        path = self._version_path(base, version)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        joblib.dump(model, tmp)
+        os.replace(tmp, path)
+
+        meta["versions"].append(version)
+        meta["latest"] = version
+        keep = set(meta["versions"][-ML_MODEL_KEEP_VERSIONS:]) | {meta.get("approved")}
+        for old in [v for v in meta["versions"] if v not in keep]:
+            try:
+                os.remove(self._version_path(base, old))
+            except OSError:
+                pass
+        meta["versions"] = [v for v in meta["versions"] if v in keep]
+        self._write_meta(base, meta)
+        return version
+
+    def approve(self, base: str, version: int | None = None):
+        meta = self.read_meta(base)
+        if not meta:
+            return
+        meta["approved"] = meta["latest"] if version is None else version
+        self._write_meta(base, meta)
+
+    def delete(self, base: str):
+        meta = self.read_meta(base) or {"versions": []}
+        paths = [self._version_path(base, v) for v in meta["versions"]]
+        paths += [self._meta_path(base), base + ".pkl"]
+        for path in paths:
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.error(f"Failed to delete model file {path}: {e}")
+
+
+model_store = ModelStore()
+
+
+# ---------------------------------------------------------
+# 🔥 Shared training buffer (SQLite)
+# ---------------------------------------------------------
+
+class SQLiteBufferStore:
+    """
+    Training buffers in one SQLite file so every uvicorn worker feeds the same
+    ring per server. A claim row elects the single process that trains.
+    """
+    def __init__(self, path: str = ML_BUFFER_DB, capacity: int = 100):
+        self.path = path
+        self.capacity = capacity
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS samples (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, features TEXT NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_samples_key ON samples (key, id)")
+            conn.execute("CREATE TABLE IF NOT EXISTS claims (key TEXT PRIMARY KEY, claimed_at REAL NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    def append(self, key: str, features: list) -> int:
+        """Add a sample, trim the ring to capacity, return the buffered count."""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT INTO samples (key, features) VALUES (?, ?)", (key, json.dumps(features)))
+            conn.execute(
+                "DELETE FROM samples WHERE key = ? AND id NOT IN "
+                "(SELECT id FROM samples WHERE key = ? ORDER BY id DESC LIMIT ?)",
+                (key, key, self.capacity)
+            )
+            return conn.execute("SELECT COUNT(*) FROM samples WHERE key = ?", (key,)).fetchone()[0]
+
+    def count(self, key: str) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM samples WHERE key = ?", (key,)).fetchone()[0]
+
+    def load(self, key: str) -> list:
+        rows = self._conn().execute("SELECT features FROM samples WHERE key = ? ORDER BY id", (key,)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def clear(self, key: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM samples WHERE key = ?", (key,))
+
+    def claim(self, key: str) -> bool:
+        """True for exactly one caller until release() (or the claim goes stale)."""
+        conn = self._conn()
+        now = time.time()
+        # Every heartbeat of a full buffer asks; while a live claim is held the
+        # answer is a plain read, not a write lock on the shared file.
+        held = conn.execute("SELECT claimed_at FROM claims WHERE key = ?", (key,)).fetchone()
+        if held is not None and held[0] >= now - ML_TRAINING_CLAIM_TTL_SECONDS:
+            return False
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM claims WHERE key = ? AND claimed_at < ?", (key, now - ML_TRAINING_CLAIM_TTL_SECONDS))
+            cur = conn.execute("INSERT OR IGNORE INTO claims (key, claimed_at) VALUES (?, ?)", (key, now))
+            return cur.rowcount == 1
+
+    def release(self, key: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM claims WHERE key = ?", (key,))
+
+
+_buffer_store = None
+_buffer_store_lock = threading.Lock()
+
+
+def get_buffer_store(capacity: int) -> SQLiteBufferStore | None:
+    """Shared buffer store when ML_BUFFER_BACKEND=sqlite, else None (in-process deque)."""
+    global _buffer_store
+    if ML_BUFFER_BACKEND != "sqlite":
+        return None
+    with _buffer_store_lock:
+        if _buffer_store is None:
+            _buffer_store = SQLiteBufferStore(ML_BUFFER_DB, capacity)
+        return _buffer_store
@@ -0,0 +1,378 @@
+# backend/src/services/rule_cache.py
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from src.models.rule import Rule
+from src.services.broadcast_bus import BROADCAST_BACKEND
+from src.services.broadcaster import broadcaster
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Safety net for rule writes that bypass the API (seed scripts) and for
+# invalidations missed on the broadcast bus. Several workers without a bus
+# only learn about each other's rule changes through it, hence the short default.
+_WORKERS = int(os.getenv("WEB_CONCURRENCY", "1") or 1)
+RULE_CACHE_TTL_SECONDS = float(os.getenv(
+    "RULE_CACHE_TTL_SECONDS", "5" if _WORKERS > 1 and BROADCAST_BACKEND == "local" else "30"
+))
+
+
+# ---------------------------------------------------------
+# 🔥 Condition compilation
+# ---------------------------------------------------------
+
+def _never(event: dict) -> bool:
+    return False
+
+
+def _always(event: dict) -> bool:
+    return True
+
+
+def _compile_getter(field: str) -> Callable[[dict], Any]:
+    """Resolve a dot path ("data.fail_count") once, return a fast accessor."""
+    keys = field.split(".")
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda event: event.get(key)
+
+    def get(event: dict):
+        actual = event
+        for part in keys:
+            if isinstance(actual, dict) and part in actual:
+                actual = actual[part]
+            else:
+                return None
+        return actual
+
+    return get
+
+
+def _compile_condition(cond: dict) -> Callable[[dict], bool]:
+    """Compile one {"field", "op", "value"} condition into a predicate."""
+    field = cond.get("field")
+    op = cond.get("op")
+    val = cond.get("value")
+    if not isinstance(field, str):
+        return _never
+
+    get = _compile_getter(field)
+
+    if op == "equals":
+        expected = str(val)
+        return lambda event: str(get(event)) == expected
+
+    if op == "contains":
+        needle = str(val)
+        return lambda event: needle in str(get(event))
+
+    if op in ("gt", "lt"):
+        try:
+            target = float(val)
+        except (TypeError, ValueError):
+            return _never
+
+        def compare(event: dict) -> bool:
+            try:
+                actual = float(get(event))
+            except (TypeError, ValueError):
+                return False
+            return actual > target if op == "gt" else actual < target
+
+        return compare
+
+    # Unknown operators never rejected an event in the interpreted matcher.
+    return _always
+
+
+_DICT_OPS = {
+    ">": lambda a, b: a > b,
+    "<": lambda a, b: a < b,
+    ">=": lambda a, b: a >= b,
+    "<=": lambda a, b: a <= b,
+    "==": lambda a, b: a == b,
+    "=": lambda a, b: a == b,
+}
+
+
+def _compile_dict_rule(rule: dict) -> List[Callable[[dict], bool]]:
+    """Compile the legacy {"event_type": X, "data.cpu": {">": 90}} format."""
+    preds = []
+    if "event_type" in rule:
+        expected_type = rule["event_type"]
+        preds.append(lambda event: event.get("event_type") == expected_type)
+
+    for k, cond in rule.items():
+        if k == "event_type":
+            continue
+        get = _compile_getter(k)
+
+        if not isinstance(cond, dict):
+            preds.append(lambda event, get=get, cond=cond: get(event) == cond)
+            continue
+
+        for op, target in cond.items():
+            fn = _DICT_OPS.get(op)
+            if fn is None:
+                continue
+
+            def compare(event, get=get, fn=fn, target=target):
+                val = get(event)
+                try:
+                    vnum, tnum = float(val), float(target)
+                except Exception:
+                    vnum, tnum = val, target
+                return fn(vnum, tnum)
+
+            preds.append(compare)
+    return preds
+
+
+def _parse(cond: Any) -> Any:
+    if isinstance(cond, str):
+        try:
+            return json.loads(cond)
+        except Exception:
+            return None
+    return cond
+
+
+def literal_event_type(cond: Any) -> Optional[str]:
+    """
+    The event_type a rule requires outright (an `event_type equals X`
+    condition, or the legacy {"event_type": X} key), else None. Rules with
+    one can only match events of that type, which is what the index uses.
+    """
+    cond = _parse(cond)
+    if isinstance(cond, list):
+        for c in cond:
+            if isinstance(c, dict) and c.get("field") == "event_type" and c.get("op") == "equals":
+                return str(c.get("value"))
+    elif isinstance(cond, dict) and isinstance(cond.get("event_type"), str):
+        return cond["event_type"]
+    return None
+
+
+def compile_conditions(cond: Any) -> Optional[Callable[[dict], bool]]:
+    """
+    Turn a rule's stored conditions (JSON string, list or dict) into a single
+    predicate. Returns None if the conditions cannot be interpreted.
+    """
+    cond = _parse(cond)
+
+    if isinstance(cond, list):
+        preds = [_compile_condition(c) if isinstance(c, dict) else _never for c in cond]
+    elif isinstance(cond, dict):
+        preds = _compile_dict_rule(cond)
+    else:
+        return None
+
+    def matches(event: dict) -> bool:
+        try:
+            for pred in preds:
+                if not pred(event):
+                    return False
+            return True
+        except Exception:
+            return False
+
+    return matches
+
+
+class WindowSpec:
+    """Compiled sliding-window aggregation of a rule (see services/sliding_window.py)."""
+    __slots__ = ("seconds", "threshold", "agg", "value", "group", "key")
+
+    def __init__(self, seconds: float, threshold: float, agg: str, value: Callable[[dict], Optional[float]],
+                 group: Callable[[dict], Any], key: tuple = ()):
+        self.seconds = seconds
+        self.threshold = threshold
+        self.agg = agg
+        self.value = value
+        self.group = group
+        self.key = key  # what the window state depends on; an edited rule starts a fresh window
+
+
+def compile_window(spec: Any) -> Optional[WindowSpec]:
+    """{"seconds", "threshold", "agg": count|sum, "field", "group_by"} -> WindowSpec, None if invalid."""
+    spec = _parse(spec)
+    if not isinstance(spec, dict):
+        return None
+    try:
+        seconds = float(spec["seconds"])
+        threshold = float(spec["threshold"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    agg = spec.get("agg", "count")
+    if seconds <= 0 or agg not in ("count", "sum"):
+        return None
+
+    if agg == "sum":
+        if not isinstance(spec.get("field"), str):
+            return None
+        get_field = _compile_getter(spec["field"])
+
+        def value(event: dict) -> Optional[float]:
+            try:
+                return float(get_field(event))
+            except (TypeError, ValueError):
+                return None
+    else:
+        value = lambda event: 1.0
+
+    group_by = spec.get("group_by") or "source"
+    key = (seconds, agg, spec.get("field") if agg == "sum" else None, group_by)
+    return WindowSpec(seconds, threshold, agg, value, _compile_getter(group_by), key)
+
+
+class CompiledRule:
+    """Detached, pre-compiled view of a Rule row (safe to share across sessions)."""
+    __slots__ = ("id", "name", "severity", "target_server", "event_type", "window", "matches")
+
+    def __init__(self, rule: Rule, matches: Callable[[dict], bool], event_type: Optional[str] = None,
+                 window: Optional[WindowSpec] = None):
+        self.id = rule.id
+        self.name = rule.name
+        self.severity = rule.severity
+        self.target_server = rule.target_server
+        self.event_type = event_type  # None: may match any event type
+        self.window = window  # None: every matching event triggers
+        self.matches = matches
+
+
+# ---------------------------------------------------------
+# 🔥 Per-organization cache
+# ---------------------------------------------------------
+
+# (source, event_type) rule lists memoised per org; reset when exceeded
+_MAX_EVENT_BUCKETS = 10000
+_ANY_TYPE = object()
+
+class _OrgRules:
+    def __init__(self, version: int, rules: List[CompiledRule]):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.targeted: Dict[str, List[CompiledRule]] = {}
+        self.global_rules: List[CompiledRule] = []
+        for r in rules:
+            if r.target_server is None:
+                self.global_rules.append(r)
+            else:
+                self.targeted.setdefault(r.target_server, []).append(r)
+        # Legacy (no org) events historically saw every rule, targeted first.
+        self.all_rules = [r for rs in self.targeted.values() for r in rs] + self.global_rules
+        self._by_source: Dict[Any, List[CompiledRule]] = {}
+        self._by_event: Dict[tuple, List[CompiledRule]] = {}
+
+    def for_source(self, source: Optional[str]) -> List[CompiledRule]:
+        rules = self._by_source.get(source)
+        if rules is None:
+            # Priority: targeted rules are evaluated before global ones.
+            rules = self.targeted.get(source, []) + self.global_rules
+            self._by_source[source] = rules
+        return rules
+
+    def for_event(self, source: Optional[str], event_type: Any, legacy: bool = False) -> List[CompiledRule]:
+        """
+        Rules that can match an event of this source and type: the source's
+        bucket narrowed to rules requiring this event_type plus the wildcard
+        ones, priority order unchanged.
+        """
+        key = (legacy, source, str(event_type))
+        rules = self._by_event.get(key)
+        if rules is None:
+            candidates = self.all_rules if legacy else self.for_source(source)
+            rules = [r for r in candidates if r.event_type is None or r.event_type == key[2]]
+            if len(self._by_event) >= _MAX_EVENT_BUCKETS:
+                self._by_event.clear()
+            self._by_event[key] = rules
+        return rules
+
+
+class RuleCache:
+    """
+    In-process cache of enabled rules per organization, compiled into
+    predicates. create/delete in routes/rules.py bump the org's version so
+    the next event reloads, here and (over the broadcast bus) in every other
+    worker; a TTL bounds staleness for out-of-band writes.
+    """
+    def __init__(self, ttl: float = RULE_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._versions: Dict[Any, int] = {}
+        self._entries: Dict[Any, _OrgRules] = {}
+
+    def invalidate(self, organization_id: Optional[int] = None, broadcast: bool = True):
+        """Bump the org's version so its compiled rules are rebuilt on next use."""
+        with self._lock:
+            self._versions[organization_id] = self._versions.get(organization_id, 0) + 1
+            self._entries.pop(organization_id, None)
+        if broadcast:
+            broadcaster.invalidate("rules", organization_id)
+
+    def clear(self):
+        with self._lock:
+            self._versions.clear()
+            self._entries.clear()
+
+    def _load(self, db: Session, organization_id: Optional[int], version: int) -> _OrgRules:
+        query = db.query(Rule).filter(Rule.enabled == True)
+        if organization_id is not None:
+            query = query.filter(Rule.organization_id == organization_id)
+        else:
+            query = query.filter(Rule.organization_id == None)
+
+        compiled = []
+        for r in query.order_by(Rule.id).all():
+            conditions = _parse(r.conditions)
+            matches = compile_conditions(conditions)
+            if matches is None:
+                logger.warning("Skipping rule id=%s: unparseable conditions", r.id)
+                continue
+            window = None
+            if r.window_spec:
+                window = compile_window(r.window_spec)
+                if window is None:
+                    logger.warning("Skipping rule id=%s: invalid window", r.id)
+                    continue
+            compiled.append(CompiledRule(r, matches, literal_event_type(conditions), window))
+
+        logger.info("Compiled %d rules for org=%s (v%d)", len(compiled), organization_id, version)
+        return _OrgRules(version, compiled)
+
+    def get_rules(self, db: Session, organization_id: Optional[int], source: Optional[str], event_type: Any = _ANY_TYPE) -> List[CompiledRule]:
+        """
+        Return the compiled rules that apply to an event from `source`, in
+        priority order. Passing the event's event_type also drops rules that
+        require a different one.
+        """
+        with self._lock:
+            version = self._versions.get(organization_id, 0)
+            entry = self._entries.get(organization_id)
+
+        if entry is None or entry.version != version or time.monotonic() - entry.loaded_at > self.ttl:
+            entry = self._load(db, organization_id, version)
+            with self._lock:
+                # Only publish if nobody invalidated while we were loading.
+                if self._versions.get(organization_id, 0) == version:
+                    self._entries[organization_id] = entry
+
+        if event_type is not _ANY_TYPE:
+            return entry.for_event(source, event_type, legacy=organization_id is None)
+        if organization_id is None:
+            return entry.all_rules
+        return entry.for_source(source)
+
+
+# Single global cache instance shared by the rule engine and rule routes
+rule_cache = RuleCache()
+
+broadcaster.on_invalidate("rules", lambda organization_id: rule_cache.invalidate(organization_id, broadcast=False))
@@ -1,7 +1,9 @@
 # backend/src/services/rule_engine.py
 
+import json
 import logging
-from typing import Any, Dict, List
+import os
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
@@ -9,32 +11,49 @@ from sqlalchemy import and_
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Per-event history rows are truncated to keep merge cost and row size bounded
+INCIDENT_EVENT_SUMMARY_MAX_CHARS = int(os.getenv("INCIDENT_EVENT_SUMMARY_MAX_CHARS", "2000"))
+
 try:
     from src.models.rule import Rule
 except Exception:
     Rule = None
 
 from src.models.incident import Incident
+from src.models.incident_event import IncidentEvent
+from src.services.rule_cache import rule_cache
+from src.services.incident_dedup import incident_fingerprint, fingerprint_index
+from src.services.incident_stats import incident_stats
+from src.services.incident_sequence import incident_sequence
+from src.services.sliding_window import sliding_windows
+from src.services.incident_throttle import incident_throttle
 
 
 # ---------------------------------------------------------
 # 🔥 Incident lookup / merge logic
 # ---------------------------------------------------------
 
-def _find_existing_incident(db: Session, source: str, event_type: str, user_id: int):
+def _find_existing_incident(db: Session, fingerprint: str):
     """
-    Looks for an existing OPEN incident for the same source + event_type + user_id.
-    Returns the incident object or None.
+    Looks for an existing OPEN incident with the same dedup fingerprint.
+    The in-memory LRU answers with a primary-key lookup; on a miss the
+    partial index on open incidents is used. Returns the incident or None.
     """
     try:
-        logger.info(f"Searching for existing incident: source={source}, event_type={event_type}, user_id={user_id}")
-        query = db.query(Incident).filter(
-            Incident.status == "Open",
-            Incident.title.ilike(f"%{event_type}%"),
-            Incident.description.ilike(f"%{source}%"),
-            Incident.user_id == user_id
-        )
-        incident = query.first()
+        incident_id = fingerprint_index.get(fingerprint)
+        if incident_id is not None:
+            incident = db.get(Incident, incident_id)
+            # Cached ids are hints: the incident may since have been closed or deleted
+            if incident is not None and incident.status == "Open" and incident.fingerprint == fingerprint:
+                return incident
+            fingerprint_index.discard(fingerprint)
+
+        incident = db.query(Incident).filter(
+            Incident.fingerprint == fingerprint,
+            Incident.status == "Open"
+        ).first()
+        if incident is not None:
+            fingerprint_index.put(fingerprint, incident.id)
         logger.info(f"Found existing incident: {incident.id if incident else 'None'}")
         return incident
     except Exception as e:
@@ -45,270 +64,246 @@ def _find_existing_incident(db: Session, source: str, event_type: str, user_id:
 def _update_existing_incident(db: Session, incident: Incident, event: dict, new_severity: str = None):
     """
     Update existing incident instead of creating a new one.
+    The change is only flushed and errors propagate: the caller's unit of
+    work (process_event, or a batch savepoint) commits or rolls back.
     """
-    try:
-        # increase alert count
-        if not hasattr(incident, "alert_count"):
-            incident.alert_count = 1  
-
-        incident.alert_count = (incident.alert_count or 1) + 1
+    # increase alert count
+    if not hasattr(incident, "alert_count"):
+        incident.alert_count = 1  
+
+    incident.alert_count = (incident.alert_count or 1) + 1
+    incident_stats.alert(db, incident.organization_id)
+
+    # keep the merged event in the append-only history (description stays fixed-size)
+    now = datetime.utcnow()
+    db.add(_event_record(incident.id, event, now))
+    incident.last_seen = now
+    incident.updated_at = now
+    
+    # Priority Override System: Upgrade severity if specific rule is higher
+    if new_severity:
+        levels = {"critical": 4, "high": 3, "medium": 2, "low": 1}
+        current_level = levels.get(incident.severity.lower() if incident.severity else "low", 0)
+        new_level = levels.get(new_severity.lower(), 0)
+        if new_level > current_level:
+            incident_stats.changed(db, incident.organization_id, "severity", incident.severity, new_severity)
+            incident.severity = new_severity
+            logger.info(f"Upgraded incident severity to {new_severity} via overriding rule")
+            
+    db.flush()
 
-        # update description with last event summary
-        incident.description = (
-            incident.description
-            + f"\n[+] Additional event at {datetime.utcnow()} → {event}"
-        )
+    incident_throttle.track(db, incident)
+    logger.info("Merged event into existing incident id=%s", incident.id)
 
-        incident.updated_at = datetime.utcnow()
-        
-        # Priority Override System: Upgrade severity if specific rule is higher
-        if new_severity:
-            levels = {"critical": 4, "high": 3, "medium": 2, "low": 1}
-            current_level = levels.get(incident.severity.lower() if incident.severity else "low", 0)
-            new_level = levels.get(new_severity.lower(), 0)
-            if new_level > current_level:
-                incident.severity = new_severity
-                logger.info(f"Upgraded incident severity to {new_severity} via overriding rule")
-                
-        db.commit()
-        db.refresh(incident)
+    return {
+        "id": incident.id,
+        "merged": True,
+        "alert_count": incident.alert_count,
+        "title": incident.title,
+        "severity": incident.severity,
+        "incident": incident # Return full object for kafka consumer compatibility
+    }
 
-        logger.info("Merged event into existing incident id=%s", incident.id)
 
-        return {
-            "id": incident.id,
-            "merged": True,
-            "alert_count": incident.alert_count,
-            "title": incident.title,
-            "severity": incident.severity,
-            "incident": incident # Return full object for kafka consumer compatibility
-        }
-
-    except Exception as e:
-        logger.exception("Failed to update existing incident: %s", e)
-        db.rollback()
-        return {"error": str(e)}
 
+def _event_record(incident_id: int, event: dict, now: datetime) -> IncidentEvent:
+    """Build a bounded history row for an event merged into an incident."""
+    try:
+        summary = json.dumps(event, default=str)
+    except Exception:
+        summary = str(event)
+    return IncidentEvent(
+        incident_id=incident_id,
+        event_id=event.get("event_id"),
+        event_type=event.get("event_type"),
+        summary=summary[:INCIDENT_EVENT_SUMMARY_MAX_CHARS],
+        timestamp=now
+    )
 
 
 # ---------------------------------------------------------
 # 🔥 Create NEW incident (fallback)
 # ---------------------------------------------------------
 
-def _create_incident(db: Session, title: str, description: str, severity: str, user_id: int, source: str = None, status="Open"):
-    try:
-        # Resolve Organization ID from User
-        from src.models.user import User
-        user = db.query(User).filter(User.id == user_id).first()
-        org_id = user.organization_id if user else None
-        
-        # Calculate next scoped ID
-        next_id = 1
-        if org_id:
-            last_inc = db.query(Incident).filter(Incident.organization_id == org_id).order_by(Incident.org_incident_id.desc()).first()
-            if last_inc and last_inc.org_incident_id:
-                next_id = last_inc.org_incident_id + 1
-
-        inc = Incident(
-            title=title,
-            description=description,
-            severity=severity,
-            status=status,
-            timestamp=datetime.utcnow(),
-            updated_at=datetime.utcnow(),
-            alert_count=1,
-            user_id=user_id,
-            organization_id=org_id,
-            org_incident_id=next_id,
-            source=source
-        )
-        db.add(inc)
-        db.commit()
-        db.refresh(inc)
-        logger.info("Created NEW incident id=%s for user_id=%s source=%s", inc.id, user_id, source)
-        return {
-            "id": inc.id, 
-            "merged": False,
-            "title": inc.title,
-            "severity": inc.severity,
-            "incident": inc # Return full object for kafka consumer compatibility
-        }
-    except Exception as e:
-        logger.exception("Error creating incident: %s", e)
-        db.rollback()
-        return {"error": str(e)}
+def _create_incident(db: Session, title: str, description: str, severity: str, user_id: int, source: str = None, status="Open", fingerprint: str = None, event: dict = None):
+    """Create a new incident (flushed only; the caller's unit of work commits)."""
+    # Resolve Organization ID from User
+    from src.models.user import User
+    user = db.query(User).filter(User.id == user_id).first()
+    org_id = user.organization_id if user else None
+    
+    # Next scoped ID from the org's counter
+    next_id = incident_sequence.next_id(db, org_id)
+
+    now = datetime.utcnow()
+    inc = Incident(
+        title=title,
+        description=description,
+        severity=severity,
+        status=status,
+        timestamp=now,
+        updated_at=now,
+        first_seen=now,
+        last_seen=now,
+        alert_count=1,
+        user_id=user_id,
+        organization_id=org_id,
+        org_incident_id=next_id,
+        source=source,
+        fingerprint=fingerprint
+    )
+    db.add(inc)
+    db.flush()
+    incident_stats.created(db, inc)
+    if event is not None:
+        db.add(_event_record(inc.id, event, now))
+    db.flush()
+    if fingerprint:
+        fingerprint_index.put_on_commit(db, fingerprint, inc.id)
+        incident_throttle.track(db, inc)
+    logger.info("Created NEW incident id=%s for user_id=%s source=%s", inc.id, user_id, source)
+    return {
+        "id": inc.id, 
+        "merged": False,
+        "title": inc.title,
+        "severity": inc.severity,
+        "incident": inc # Return full object for kafka consumer compatibility
+    }
 
 
 
 # ---------------------------------------------------------
-# 🔥 Rule matching logic (same as Step 8)
+# 🔥 Throttled repeats
 # ---------------------------------------------------------
 
-def _event_matches_simple_rule(event: dict, rule: dict) -> bool:
-    try:
-        # Support existing "field/op/value" format (list of conditions)
-        if isinstance(rule, list):
-            for cond in rule:
-                field = cond.get("field")
-                op = cond.get("op")
-                val = cond.get("value")
-                
-                keys = field.split(".")
-                actual = event
-                for part in keys:
-                    if isinstance(actual, dict) and part in actual:
-                        actual = actual[part]
-                    else:
-                        actual = None
-                        break
-                
-                if op == "equals":
-                    if str(actual) != str(val): 
-                        print(f"DEBUG: Rule mismatch: {field} ({actual}) != {val}", flush=True)
-                        return False
-                elif op == "contains":
-                    if str(val) not in str(actual): return False
-                elif op == "gt":
-                    try:
-                        if not (float(actual) > float(val)): 
-                            print(f"DEBUG: Rule mismatch: {field} ({actual}) not > {val}", flush=True)
-                            return False
-                    except: return False
-                elif op == "lt":
-                    try:
-                        if not (float(actual) < float(val)): return False
-                    except: return False
-                
-                print(f"✅ DEBUG: Rule Condition Matched: {field} ({actual}) {op} {val}", flush=True)
-            return True
-
-        if "event_type" in rule:
-            if event.get("event_type") != rule["event_type"]:
-                return False
-
-        for k, cond in rule.items():
-            if k == "event_type":
-                continue
-
-            keys = k.split(".")
-            val = event
-            for part in keys:
-                if isinstance(val, dict) and part in val:
-                    val = val[part]
-                else:
-                    val = None
-                    break
+def _throttled(fingerprint: str, label: dict) -> Optional[dict]:
+    """
+    Result for an event absorbed by the incident throttle (counted in memory,
+    no DB work), or None when it must go through merge/create.
+    """
+    window = incident_throttle.absorb(fingerprint)
+    if window is None:
+        return None
+    return {
+        **label,
+        "merged": True,
+        "throttled": True,
+        "incident_id": window.incident_id,
+        "title": window.title,
+        "severity": window.severity,
+        "incident": None
+    }
 
-            # simple equality
-            if not isinstance(cond, dict):
-                if val != cond:
-                    return False
-            else:
-                # operator comparison
-                for op, target in cond.items():
-                    try:
-                        vnum = float(val)
-                        tnum = float(target)
-                    except Exception:
-                        vnum = val
-                        tnum = target
-
-                    if op == ">" and not (vnum > tnum): return False
-                    if op == "<" and not (vnum < tnum): return False
-                    if op in (">=",) and not (vnum >= tnum): return False
-                    if op in ("<=",) and not (vnum <= tnum): return False
-                    if op in ("==","=") and not (vnum == tnum): return False
-
-        return True
 
-    except Exception:
-        return False
+# ---------------------------------------------------------
+# 🔥 Windowed rules
+# ---------------------------------------------------------
 
+def _window_total(rule, event: dict, group: str, organization_id, user_id) -> Optional[float]:
+    """Feed a matching event into the rule's window; returns the aggregate (None if the event has no value)."""
+    value = rule.window.value(event)
+    if value is None:
+        return None
+    scope = organization_id if organization_id is not None else f"user:{user_id}"
+    key = (scope, rule.id, rule.window.key, group)
+    return sliding_windows.observe(key, rule.window.seconds, value)
 
 
 # ---------------------------------------------------------
 # 🔥 Main processing entrypoint
 # ---------------------------------------------------------
 
-def process_event(event: dict, db: Session) -> List[Dict[str, Any]]:
+def process_event(event: dict, db: Session, commit: bool = True) -> List[Dict[str, Any]]:
+    """
+    Evaluate rules for one event and create/merge incidents.
+    The event is one unit of work: writes are only flushed while rules run.
+    commit=True commits them once at the end (on error everything is rolled
+    back and no results are returned); commit=False leaves them uncommitted
+    and lets errors propagate, so callers can add their own writes or
+    persist a whole batch in a single transaction.
+    """
+    if not commit:
+        return _evaluate(event, db)
+    try:
+        results = _evaluate(event, db)
+        db.commit()
+        return results
+    except Exception as e:
+        logger.exception("Rule engine error, event rolled back: %s", e)
+        db.rollback()
+        return []
+
+
+def _evaluate(event: dict, db: Session) -> List[Dict[str, Any]]:
     logger.info("Processing event: %s", event)
-    print(f"🔍 DEBUG: processing event: {event.get('event_type')}", flush=True)
     results = []
 
     # extract these for grouping logic
     source = event.get("source")
     event_type = event.get("event_type")
     user_id = event.get("user_id") # Extracted from event
+    organization_id = event.get("organization_id")
+
+    def fingerprint_for(rule_key, etype=event_type):
+        return incident_fingerprint(organization_id, source, etype, rule_key, user_id=user_id)
 
     # -----------------------------------------------------
     # 1) Try DB rules first (if Rule model exists)
     # -----------------------------------------------------
     if Rule:
-        try:
-            # MULTI-TENANT ISOLATION LOGIC
-            # Only fetch rules that match the event's organization
-            organization_id = event.get("organization_id")
-            
-            query = db.query(Rule).filter(getattr(Rule, "enabled", True) == True)
-            
-            if organization_id is not None:
-                # Isolate: Rules must match Org
-                query = query.filter(Rule.organization_id == organization_id)
-                from sqlalchemy import or_
-                query = query.filter(or_(Rule.target_server == None, Rule.target_server == source))
-                print(f"🔍 DEBUG: Fetching rules for Org ID: {organization_id}", flush=True)
-            else:
-                # Legacy/Global fallback
-                query = query.filter(Rule.organization_id == None)
-                print(f"🔍 DEBUG: Fetching GLOBAL rules (No Org ID in event)", flush=True)
-
-            rules = query.all()
-            # Priority Sorting: Targeted rules (not None) evaluated FIRST
-            rules.sort(key=lambda r: getattr(r, "target_server", None) is None)
-            
-            print(f"🔍 DEBUG: Found {len(rules)} active rules for this context", flush=True)
-
-            for r in rules:
-                cond = getattr(r, "condition", None) or getattr(r, "conditions", None) or getattr(r, "definition", None)
-                if isinstance(cond, str):
-                    import json
-                    try:
-                        cond = json.loads(cond)
-                    except: pass
-
-                if (isinstance(cond, dict) or isinstance(cond, list)) and _event_matches_simple_rule(event, cond):
-                    print(f"✅ DEBUG: Rule '{r.name}' MATCHED event!", flush=True)
-                    # if match → perform merge or create new
-                    existing = _find_existing_incident(db, source, event_type, user_id)
-
-                    if existing:
-                        result = _update_existing_incident(db, existing, event, new_severity=getattr(r, "severity", None))
-                        results.append({
-                            "rule_id": r.id, 
-                            "merged": True, 
-                            "incident_id": result["id"],
-                            "title": result["title"],
-                            "severity": result["severity"],
-                            "incident": result["incident"]
-                        })
-                    else:
-                        title = r.name or f"Match: {r.id}"
-                        desc = f"Rule matched. Event: {event}"
-                        result = _create_incident(db, title, desc, r.severity or "low", user_id, source=source)
-                        results.append({
-                            "rule_id": r.id, 
-                            "merged": False, 
-                            "incident_id": result["id"],
-                            "title": result["title"],
-                            "severity": result["severity"],
-                            "incident": result["incident"]
-                        })
-            
-            if results:
-                return results
-
-        except Exception as e:
-            logger.exception("DB rule engine error: %s", e)
+        # MULTI-TENANT ISOLATION LOGIC
+        # Only rules of the event's organization (targeted to this source
+        # or global) that can match its event_type, pre-compiled and
+        # cached — no query / JSON parse when warm.
+        rules = rule_cache.get_rules(db, organization_id, source, event_type)
+
+        for r in rules:
+            if r.matches(event):
+                window_total = None
+                rule_key = r.id
+                if r.window is not None:
+                    group = str(r.window.group(event))
+                    window_total = _window_total(r, event, group, organization_id, user_id)
+                    if window_total is None or window_total < r.window.threshold:
+                        continue
+                    rule_key = f"{r.id}:{group}"  # one incident per window group
+                logger.debug("Rule '%s' matched event", r.name)
+                # if match → perform merge or create new
+                fingerprint = fingerprint_for(rule_key)
+                throttled = _throttled(fingerprint, {"rule_id": r.id})
+                if throttled:
+                    results.append(throttled)
+                    continue
+                existing = _find_existing_incident(db, fingerprint)
+
+                if existing:
+                    result = _update_existing_incident(db, existing, event, new_severity=getattr(r, "severity", None))
+                    results.append({
+                        "rule_id": r.id, 
+                        "merged": True, 
+                        "incident_id": result["id"],
+                        "title": result["title"],
+                        "severity": result["severity"],
+                        "incident": result["incident"]
+                    })
+                else:
+                    title = r.name or f"Match: {r.id}"
+                    desc = f"Rule matched. Event: {event}"
+                    if window_total is not None:
+                        desc = (f"Window threshold reached: {r.window.agg}={window_total:g} "
+                                f"within {r.window.seconds:g}s (threshold {r.window.threshold:g}). Event: {event}")
+                    result = _create_incident(db, title, desc, r.severity or "low", user_id, source=source, fingerprint=fingerprint, event=event)
+                    results.append({
+                        "rule_id": r.id, 
+                        "merged": False, 
+                        "incident_id": result["id"],
+                        "title": result["title"],
+                        "severity": result["severity"],
+                        "incident": result["incident"]
+                    })
+        
+        if results:
+            return results
 
 
     # -----------------------------------------------------
@@ -319,7 +314,7 @@ def process_event(event: dict, db: Session) -> List[Dict[str, Any]]:
     if event_type in ("manual_test", "quick_test"):
         title = "Test Incident"
         desc = f"Manual test event triggered from {source}. Details: {event.get('details')}"
-        res = _create_incident(db, title, desc, "low", user_id, source=source)
+        res = _create_incident(db, title, desc, "low", user_id, source=source, event=event)
         results.append({
             "rule": "manual_test_rule",
             "incident_id": res["id"],
@@ -332,10 +327,13 @@ def process_event(event: dict, db: Session) -> List[Dict[str, Any]]:
     if event_type == "login_failed":
         fail_count = event.get("data", {}).get("fail_count", 0)
         if fail_count >= 3:
+            fingerprint = fingerprint_for("fallback_login_failed")
+            throttled = _throttled(fingerprint, {"rule": "fallback_login_failed"})
+            existing = None if throttled else _find_existing_incident(db, fingerprint)
 
-            existing = _find_existing_incident(db, source, event_type, user_id)
-
-            if existing:
+            if throttled:
+                results.append(throttled)
+            elif existing:
                 res = _update_existing_incident(db, existing, event)
                 results.append({
                     "rule": "fallback_login_failed",
@@ -347,7 +345,7 @@ def process_event(event: dict, db: Session) -> List[Dict[str, Any]]:
             else:
                 title = "Brute-force login_failed attempt"
                 desc = f"Source {source} repeated failures: {fail_count}"
-                res = _create_incident(db, title, desc, "high", user_id, source=source)
+                res = _create_incident(db, title, desc, "high", user_id, source=source, fingerprint=fingerprint, event=event)
                 results.append({
                     "rule": "fallback_login_failed",
                     "incident_id": res["id"],
@@ -358,39 +356,42 @@ def process_event(event: dict, db: Session) -> List[Dict[str, Any]]:
 
     # Example 2: critical event types
     if event_type in ("malware_detected", "ransomware_activity", "privilege_escalation"):
-        existing = _find_existing_incident(db, source, event_type, user_id)
+        fingerprint = fingerprint_for("fallback_critical")
+        throttled = _throttled(fingerprint, {"rule": "fallback_critical"})
+        existing = None if throttled else _find_existing_incident(db, fingerprint)
 
-        if existing:
+        if throttled:
+            results.append(throttled)
+        elif existing:
             res = _update_existing_incident(db, existing, event)
-            if "error" in res:
-                logger.error(f"Failed to update incident: {res['error']}")
-            else:
-                results.append({
-                    "rule": "fallback_critical",
-                    "incident_id": res["id"],
-                    "title": res["title"],
-                    "severity": res["severity"],
-                    "incident": res["incident"]
-                })
+            results.append({
+                "rule": "fallback_critical",
+                "incident_id": res["id"],
+                "title": res["title"],
+                "severity": res["severity"],
+                "incident": res["incident"]
+            })
         else:
             title = f"Critical Alert: {event_type}"
             desc = f"Detected {event_type} from {source}. Details: {event.get('details', 'No details')}"
             severity = "high"
-            res = _create_incident(db, title, desc, severity, user_id, source=source)
-            if "error" in res:
-                logger.error(f"Failed to create incident: {res['error']}")
-            else:
-                results.append({
-                    "rule": "fallback_critical",
-                    "incident_id": res["id"],
-                    "title": res["title"],
-                    "severity": res["severity"],
-                    "incident": res["incident"]
-                })
+            res = _create_incident(db, title, desc, severity, user_id, source=source, fingerprint=fingerprint, event=event)
+            results.append({
+                "rule": "fallback_critical",
+                "incident_id": res["id"],
+                "title": res["title"],
+                "severity": res["severity"],
+                "incident": res["incident"]
+            })
 
     # Example 3: ML Anomaly
     if event_type == "ml_anomaly":
-        existing = _find_existing_incident(db, source, "ml_anomaly", user_id)
+        fingerprint = fingerprint_for("ml_isolation_forest", etype="ml_anomaly")
+        throttled = _throttled(fingerprint, {"rule": "ml_isolation_forest"})
+        if throttled:
+            results.append(throttled)
+            return results
+        existing = _find_existing_incident(db, fingerprint)
         severity = event.get("severity", "medium")
         
         if existing:
@@ -398,7 +399,7 @@ def process_event(event: dict, db: Session) -> List[Dict[str, Any]]:
         else:
             title = f"ML Anomaly: {source}"
             desc = f"Unusual behavior detected: {event.get('details')} (Score: {event.get('score')})"
-            res = _create_incident(db, title, desc, severity, user_id, source=source)
+            res = _create_incident(db, title, desc, severity, user_id, source=source, fingerprint=fingerprint, event=event)
 
         results.append({
             "rule": "ml_isolation_forest",
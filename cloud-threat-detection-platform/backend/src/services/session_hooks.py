@@ -0,0 +1,37 @@
+# backend/src/services/session_hooks.py
+
+from typing import Any, List
+
+from sqlalchemy.orm import Session
+
+
+def defer(session: Session, key: str, item: Any):
+    """Queue `item` under `key` until the session commits (tagged with the current savepoint)."""
+    session.info.setdefault(key, []).append((item, session.get_nested_transaction()))
+
+
+def committed(session: Session, key: str) -> List[Any]:
+    """Items queued under `key`, removed from the session. Call from an after_commit listener."""
+    return [item for item, _ in session.info.pop(key, ())]
+
+
+def discard_rolled_back(session: Session, key: str, previous_transaction):
+    """
+    Drop the items recorded inside a transaction that rolled back: all of
+    them for the outer transaction, only the savepoint's own (and its
+    children's) for a nested one. Call from an after_soft_rollback listener.
+    """
+    if not previous_transaction.nested:
+        session.info.pop(key, None)
+        return
+
+    def inside(tx):
+        while tx is not None:
+            if tx is previous_transaction:
+                return True
+            tx = tx.parent
+        return False
+
+    pending = session.info.get(key)
+    if pending:
+        session.info[key] = [p for p in pending if not inside(p[1])]
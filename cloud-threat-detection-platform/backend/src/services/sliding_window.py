@@ -0,0 +1,83 @@
+# backend/src/services/sliding_window.py
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+# Ring resolution: a window is tracked in this many buckets (count is exact to 1/N of the window)
+WINDOW_BUCKETS = int(os.getenv("WINDOW_BUCKETS", "30"))
+# Windows kept in memory (org x rule x group); least recently updated are evicted
+WINDOW_STATE_MAX_KEYS = int(os.getenv("WINDOW_STATE_MAX_KEYS", "100000"))
+
+
+class _Window:
+    """Fixed ring of time buckets with a running total."""
+    __slots__ = ("width", "buckets", "head", "total")
+
+    def __init__(self, seconds: float, buckets: int):
+        self.width = seconds / buckets
+        self.buckets = [0.0] * buckets
+        self.head = None  # absolute index of the newest bucket
+        self.total = 0.0
+
+    def add(self, now: float, value: float) -> float:
+        n = len(self.buckets)
+        idx = int(now // self.width)
+        if self.head is not None and idx < self.head:
+            idx = self.head  # never write into a bucket that already expired
+        if self.head is None or idx - self.head >= n:
+            self.buckets = [0.0] * n
+            self.total = 0.0
+        elif idx > self.head:
+            # Expire the buckets that slid out; each bucket is cleared once per lap
+            for i in range(self.head + 1, idx + 1):
+                self.total -= self.buckets[i % n]
+                self.buckets[i % n] = 0.0
+        self.head = idx
+        self.buckets[idx % n] += value
+        self.total += value
+        return self.total
+
+
+class SlidingWindowStore:
+    """
+    In-memory state for windowed rules: one bucketed ring per
+    (org, rule, group) key, so observing an event is O(1) amortised and
+    needs no DB query. Memory is bounded by an LRU over keys. State is per
+    process; it is lost on restart and not shared between workers.
+    """
+    def __init__(self, max_keys: int = WINDOW_STATE_MAX_KEYS, buckets: int = WINDOW_BUCKETS):
+        self.max_keys = max_keys
+        self.buckets = buckets
+        self._windows: "OrderedDict[Hashable, _Window]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, key: Hashable, seconds: float, value: float = 1.0, now: Optional[float] = None) -> float:
+        """Add `value` to the key's window and return the aggregate over the last `seconds`."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                window = self._windows[key] = _Window(seconds, self.buckets)
+                if len(self._windows) > self.max_keys:
+                    self._windows.popitem(last=False)
+            else:
+                self._windows.move_to_end(key)
+            return window.add(now, value)
+
+    def reset(self, key: Hashable):
+        with self._lock:
+            self._windows.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._windows.clear()
+
+    def __len__(self):
+        return len(self._windows)
+
+
+# Single global store used by the rule engine
+sliding_windows = SlidingWindowStore()
@@ -21,6 +21,15 @@ from main import app
 from src.database import Base, get_db
 from src.routes.rules import get_db as rules_get_db
 from src.core.limiter import limiter
+from src.services.rule_cache import rule_cache
+from src.services.incident_dedup import fingerprint_index
+from src.services.heartbeat_buffer import heartbeat_buffer
+from src.services.liveness import liveness
+from src.services.incident_stats import incident_stats
+from src.services.incident_sequence import incident_sequence
+from src.auth.principal_cache import principal_cache
+from src.services.sliding_window import sliding_windows
+from src.services.incident_throttle import incident_throttle
 
 # Import all models to ensure they are registered on Base.metadata
 from src.models.organization import Organization
@@ -30,6 +39,7 @@ from src.models.incident import Incident
 from src.models.rule import Rule
 from src.models.audit_log import AuditLog
 from src.models.incident_note import IncidentNote
+from src.models.incident_event import IncidentEvent
 from src.models.notification import Notification
 
 from src.auth.security import get_password_hash, create_access_token
@@ -70,6 +80,11 @@ def db_session() -> Generator:
         # Drop tables to guarantee isolation between tests
         Base.metadata.drop_all(bind=engine)
 
+@pytest.fixture(scope="function")
+def session_factory(db_session):
+    """Session factory bound to the test database, for code that opens its own sessions."""
+    return TestingSessionLocal
+
 @pytest.fixture(scope="function", autouse=True)
 def override_dependencies(db_session):
     def _override_get_db():
@@ -83,6 +98,23 @@ def override_dependencies(db_session):
     yield
     app.dependency_overrides.clear()
 
+@pytest.fixture(scope="function", autouse=True)
+def reset_service_caches():
+    # In-process caches outlive the per-test database, whose ids are reused.
+    rule_cache.clear()
+    fingerprint_index.clear()
+    heartbeat_buffer.clear()
+    liveness.clear()
+    incident_stats.clear()
+    incident_sequence.clear()
+    principal_cache.clear()
+    sliding_windows.clear()
+    incident_throttle.clear()
+    yield
+    heartbeat_buffer.stop(flush=False)
+    liveness.stop()
+    incident_throttle.stop(flush=False)
+
 import pytest_asyncio
 
 @pytest_asyncio.fixture(scope="function")
@@ -303,3 +303,77 @@ async def test_deactivated_user_cannot_authenticate(client: httpx.AsyncClient, d
     db_session.commit()
 
     assert (await client.get("/api/me", headers=admin_headers)).status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_principal_cache_skips_queries_and_honours_revocation(
+    client: httpx.AsyncClient, db_session, admin_headers, test_admin
+):
+    """Steady-state auth is served from the cache; key rotation and deactivation revoke at once."""
+    from sqlalchemy import event
+
+    old_key = (await client.post("/api/generate-api-key", headers=admin_headers)).json()["api_key"]
+    agent_headers = {"X-API-Key": old_key}
+    payload = {"source": "host-a", "event_type": "heartbeat", "details": "ok", "severity": "low"}
+    assert (await client.post("/api/ingest/", json=payload, headers=agent_headers)).status_code == 200
+
+    user_selects = []
+
+    def _count(conn, cursor, statement, params, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM users" in statement:
+            user_selects.append(statement)
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", _count)
+    try:
+        assert (await client.get("/api/me", headers=admin_headers)).status_code == 200
+        user_selects.clear()
+        assert (await client.get("/api/me", headers=admin_headers)).status_code == 200
+        assert (await client.post("/api/ingest/", json=payload, headers=agent_headers)).status_code == 200
+        assert user_selects == []
+    finally:
+        event.remove(engine, "before_cursor_execute", _count)
+
+    # Rotating the key invalidates the cached principal for the old one
+    new_key = (await client.post("/api/generate-api-key", headers=admin_headers)).json()["api_key"]
+    assert (await client.post("/api/ingest/", json=payload, headers={"X-API-Key": old_key})).status_code == 401
+    assert (await client.post("/api/ingest/", json=payload, headers={"X-API-Key": new_key})).status_code == 200
+
+    # Deactivation (any ORM write to the user) drops it as well
+    test_admin.is_active = False
+    db_session.commit()
+    assert (await client.post("/api/ingest/", json=payload, headers={"X-API-Key": new_key})).status_code == 401
+
+
+def test_principal_invalidations_reach_other_workers(db_session, test_admin):
+    from src.auth.principal_cache import principal_cache
+    from src.services.broadcast_bus import decode_invalidation, encode_invalidation
+    from src.services.broadcaster import broadcaster
+
+    class RecordingBus:
+        node_id = "this-worker"
+
+        def __init__(self):
+            self.sent = []
+
+        def publish(self, payload):
+            self.sent.append(payload)
+
+    broadcaster.bus = bus = RecordingBus()
+    try:
+        # A committed change to the user is announced to the other workers
+        test_admin.role = "analyst"
+        db_session.commit()
+        assert decode_invalidation(bus.sent[-1]) == ("this-worker", "principal_user", test_admin.id)
+
+        # ...and an announcement from another worker drops our cached principal
+        key = principal_cache.api_key_entry("rotated-elsewhere")
+        principal_cache.put(key, test_admin)
+        broadcaster._receive(encode_invalidation("other-worker", "principal_user", test_admin.id))
+        assert principal_cache.get(db_session, key) is None
+
+        principal_cache.put(key, test_admin)
+        broadcaster._receive(encode_invalidation("other-worker", "principal_org", test_admin.organization_id))
+        assert principal_cache.get(db_session, key) is None
+    finally:
+        broadcaster.bus = None
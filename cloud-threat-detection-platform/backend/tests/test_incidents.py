@@ -117,6 +117,61 @@ async def test_alert_merge_into_incident(client: httpx.AsyncClient, admin_header
     assert incidents_after[0].id == incident.id
     assert incidents_after[0].alert_count == 2
 
+@pytest.mark.asyncio
+async def test_merged_events_kept_out_of_description(client: httpx.AsyncClient, admin_headers, db_session):
+    payload = {
+        "source": "host-noisy",
+        "event_type": "login_failed",
+        "details": "Failed attempt",
+        "severity": "high",
+        "data": {"fail_count": 5}
+    }
+    for _ in range(3):
+        assert (await client.post("/api/ingest/", json=payload, headers=admin_headers)).status_code == 200
+
+    incident = db_session.query(Incident).one()
+    description_after_create = incident.description
+    assert incident.alert_count == 3
+    assert incident.first_seen is not None and incident.last_seen >= incident.first_seen
+    assert description_after_create == "Source host-noisy repeated failures: 5"
+
+    response = await client.get(f"/api/incidents/{incident.id}/events", headers=admin_headers)
+    assert response.status_code == 200
+    history = response.json()
+    assert len(history) == 3
+    assert all(e["event_type"] == "login_failed" for e in history)
+
+    response = await client.get(f"/api/incidents/{incident.id}/events", params={"limit": 1}, headers=admin_headers)
+    assert len(response.json()) == 1
+
+@pytest.mark.asyncio
+async def test_merge_uses_fingerprint_of_open_incident(client: httpx.AsyncClient, admin_headers, db_session):
+    payload = {
+        "source": "host-abc",
+        "event_type": "malware_detected",
+        "details": "eicar.com",
+        "severity": "high",
+        "data": {}
+    }
+    assert (await client.post("/api/ingest/", json=payload, headers=admin_headers)).status_code == 200
+    incident = db_session.query(Incident).one()
+    assert incident.fingerprint
+
+    # Same source/event/rule merges; a different source does not.
+    assert (await client.post("/api/ingest/", json=payload, headers=admin_headers)).status_code == 200
+    other = dict(payload, source="host-def")
+    assert (await client.post("/api/ingest/", json=other, headers=admin_headers)).status_code == 200
+    db_session.expire_all()
+    assert db_session.query(Incident).count() == 2
+    assert db_session.get(Incident, incident.id).alert_count == 2
+
+    # Once the incident is closed, the cached fingerprint must not be reused.
+    resp = await client.put(f"/api/incidents/{incident.id}/update-status", params={"new_status": "Resolved"}, headers=admin_headers)
+    assert resp.status_code == 200
+    assert (await client.post("/api/ingest/", json=payload, headers=admin_headers)).status_code == 200
+    db_session.expire_all()
+    assert db_session.query(Incident).filter(Incident.source == "host-abc").count() == 2
+
 @pytest.mark.asyncio
 async def test_analyst_self_assignment(client: httpx.AsyncClient, analyst_headers, db_session, test_analyst, test_admin):
     # Create an unassigned incident first via the admin user
@@ -179,3 +234,312 @@ async def test_admin_assigns_analyst(client: httpx.AsyncClient, admin_headers, d
     assert len(notifications) == 1
     assert "Assigned" in notifications[0].title
     assert "by admin_user" in notifications[0].message
+
+@pytest.mark.asyncio
+async def test_incident_list_keyset_pagination_and_filters(client: httpx.AsyncClient, admin_headers, db_session, test_admin):
+    from datetime import datetime, timedelta
+    base = datetime(2024, 1, 1, 12, 0, 0)
+    # Two incidents share a timestamp so the id tie-breaker matters
+    for n, (minutes, severity) in enumerate([(0, "low"), (1, "high"), (1, "high"), (2, "low"), (3, "high")]):
+        db_session.add(Incident(
+            title=f"Paged {n}", description="x" * 5000, severity=severity, status="Open",
+            timestamp=base + timedelta(minutes=minutes), user_id=test_admin.id,
+            organization_id=test_admin.organization_id
+        ))
+    # Undated rows get a cursor of their own instead of an unparseable one
+    for n in (5, 6, 7):
+        db_session.add(Incident(
+            title=f"Paged {n}", severity="low", status="open",
+            user_id=test_admin.id, organization_id=test_admin.organization_id
+        ))
+    db_session.commit()
+    db_session.query(Incident).filter(Incident.title.in_(["Paged 5", "Paged 6", "Paged 7"])).update({"timestamp": None})
+    db_session.commit()
+    expected = [i.id for i in db_session.query(Incident).order_by(Incident.timestamp.desc(), Incident.id.desc())]
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        resp = await client.get("/api/incidents/", params=params, headers=admin_headers)
+        assert resp.status_code == 200
+        page = resp.json()
+        assert len(page) <= 2
+        assert all("description" not in i and "response_notes" not in i for i in page)
+        seen += [i["id"] for i in page]
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == expected
+
+    resp = await client.get("/api/incidents/", params={"severity": "HIGH"}, headers=admin_headers)
+    assert [i["title"] for i in resp.json()] == ["Paged 4", "Paged 2", "Paged 1"]
+    assert "X-Next-Cursor" not in resp.headers
+
+    resp = await client.get("/api/incidents/", params={"status": "OPEN", "limit": 50}, headers=admin_headers)
+    assert [i["id"] for i in resp.json()] == expected
+
+    resp = await client.get("/api/incidents/", params={"cursor": "garbage"}, headers=admin_headers)
+    assert resp.status_code == 400
+
+@pytest.mark.asyncio
+async def test_incident_stats_follow_writes(client: httpx.AsyncClient, admin_headers, db_session, test_admin):
+    from src.services.incident_stats import incident_stats
+
+    for title, severity in (("a", "high"), ("b", "high"), ("c", "low")):
+        params = {"title": title, "description": "d", "severity": severity, "status": "Open"}
+        assert (await client.post("/api/incidents/", params=params, headers=admin_headers)).status_code == 200
+
+    # First read seeds the counters from the DB
+    stats = (await client.get("/api/incidents/stats", headers=admin_headers)).json()
+    assert stats["total"] == 3
+    assert stats["by_severity"] == {"high": 2, "low": 1}
+    assert stats["by_status"] == {"Open": 3}
+    assert sum(b["count"] for b in stats["hourly"]) == 3
+    assert len(stats["daily"]) == 30
+
+    # Later writes are applied as deltas on commit
+    ids = [i.id for i in db_session.query(Incident).order_by(Incident.id)]
+    await client.post("/api/incidents/", params={"title": "d", "description": "d", "severity": "critical", "status": "Open"}, headers=admin_headers)
+    await client.put(f"/api/incidents/{ids[0]}/update-status", params={"new_status": "Resolved"}, headers=admin_headers)
+    await client.delete(f"/api/incidents/{ids[2]}", headers=admin_headers)
+
+    # A savepoint that rolls back must not leak its delta
+    nested = db_session.begin_nested()
+    ghost = Incident(title="ghost", severity="high", status="Open", user_id=test_admin.id, organization_id=test_admin.organization_id)
+    db_session.add(ghost)
+    db_session.flush()
+    incident_stats.created(db_session, ghost)
+    nested.rollback()
+    db_session.commit()
+
+    stats = (await client.get("/api/incidents/stats", headers=admin_headers)).json()
+    assert stats["total"] == 3
+    assert stats["by_severity"] == {"high": 2, "critical": 1}
+    assert stats["by_status"] == {"Open": 2, "Resolved": 1}
+    assert stats["hourly"][-1]["count"] == 3
+
+@pytest.mark.asyncio
+async def test_incident_stats_are_scoped_by_role_and_windowed(client: httpx.AsyncClient, admin_headers, analyst_headers, viewer_headers,
+                                                             db_session, test_admin, test_analyst):
+    from datetime import datetime, timedelta
+    from src.models.server import Server
+    from src.services.incident_stats import _bucket, _OrgCounters
+
+    server = Server(hostname="assigned-srv", user_id=test_admin.id)
+    server.allowed_users.append(test_analyst)
+    db_session.add(server)
+    for source, severity in (("assigned-srv", "high"), ("other-srv", "high"), ("other-srv", "low")):
+        db_session.add(Incident(title="t", severity=severity, status="Open", source=source, timestamp=datetime.utcnow(),
+                                user_id=test_admin.id, organization_id=test_admin.organization_id))
+    db_session.commit()
+
+    # Everyone gets totals, but only over the incidents they can list
+    admin = (await client.get("/api/incidents/stats", headers=admin_headers)).json()
+    assert admin["total"] == 3 and admin["by_source"] == {"assigned-srv": 1, "other-srv": 2}
+    analyst = (await client.get("/api/incidents/stats", headers=analyst_headers)).json()
+    assert analyst["total"] == 1 and analyst["by_source"] == {"assigned-srv": 1}
+    assert sum(b["count"] for b in analyst["hourly"]) == 1
+    viewer = (await client.get("/api/incidents/stats", headers=viewer_headers)).json()
+    assert viewer["total"] == 0 and viewer["by_severity"] == {}
+
+    # Buckets that age out of the histogram window are dropped as deltas land
+    counters = _OrgCounters()
+    stale = _bucket(datetime.utcnow() - timedelta(days=31))
+    counters.hourly[stale] = 5
+    counters.apply({"hourly": {stale: 1, _bucket(datetime.utcnow()): 1}})
+    assert stale not in counters.hourly
+    assert sum(counters.hourly.values()) == 1
+
+@pytest.mark.asyncio
+async def test_org_incident_ids_come_from_counter(client: httpx.AsyncClient, admin_headers, db_session, test_org, session_factory):
+    from src.services.incident_sequence import IncidentSequence
+
+    # Counter was seeded from an older incident: numbering continues after it
+    test_org.incident_seq = 41
+    db_session.commit()
+
+    params = {"title": "manual", "description": "d", "severity": "low", "status": "Open"}
+    assert (await client.post("/api/incidents/", params=params, headers=admin_headers)).status_code == 200
+    payload = {"source": "host-seq", "event_type": "login_failed", "details": "x", "severity": "high", "data": {"fail_count": 3}}
+    assert (await client.post("/api/ingest/", json=payload, headers=admin_headers)).status_code == 200
+
+    ids = sorted(i.org_incident_id for i in db_session.query(Incident).all())
+    assert ids == [42, 43]
+    db_session.expire_all()
+    assert db_session.get(Organization, test_org.id).incident_seq == 43
+
+    # Block reservation: one UPDATE per block, ids stay unique and increasing
+    seq = IncidentSequence(block_size=10)
+    seq.session_factory = session_factory
+    handed_out = [seq.next_id(db_session, test_org.id) for _ in range(12)]
+    assert handed_out == list(range(44, 56))
+    db_session.expire_all()
+    assert db_session.get(Organization, test_org.id).incident_seq == 63
+
+@pytest.mark.asyncio
+async def test_throttle_collapses_repeat_alerts(client: httpx.AsyncClient, admin_headers, db_session, session_factory):
+    from src.services.broadcaster import broadcaster
+    from src.services.incident_throttle import incident_throttle
+
+    incident_throttle.window = 60
+    incident_throttle.start(session_factory=session_factory, interval_ms=0)
+    sid, q = await broadcaster.subscribe(db_session.query(User).first().organization_id)
+    try:
+        payload = {"source": "host-storm", "event_type": "malware_detected", "details": "x", "severity": "high"}
+        for _ in range(20):
+            assert (await client.post("/api/ingest/", json=payload, headers=admin_headers)).status_code == 200
+
+        # Only the first event reached the DB and the live stream
+        incident = db_session.query(Incident).one()
+        assert incident.alert_count == 1
+        assert q.qsize() == 1
+        assert incident_throttle.stats()["suppressed"] == 19
+
+        assert incident_throttle.flush() == 1
+        db_session.expire_all()
+        assert db_session.get(Incident, incident.id).alert_count == 20
+
+        # Closing the incident ends its window: the next event opens a new incident
+        await client.put(f"/api/incidents/{incident.id}/update-status", params={"new_status": "Closed"}, headers=admin_headers)
+        assert (await client.post("/api/ingest/", json=payload, headers=admin_headers)).status_code == 200
+        assert db_session.query(Incident).count() == 2
+    finally:
+        await broadcaster.unsubscribe(sid)
+
+
+def test_throttle_window_opens_only_after_commit(db_session, session_factory, test_admin):
+    from src.services.incident_dedup import fingerprint_index
+    from src.services.incident_throttle import incident_throttle
+    from src.services.rule_engine import process_event
+
+    incident_throttle.window = 60
+    incident_throttle.start(session_factory=session_factory, interval_ms=0)
+    event = {"source": "host-rb", "event_type": "malware_detected", "user_id": test_admin.id,
+             "organization_id": test_admin.organization_id}
+
+    # Written inside a savepoint that rolls back: no window, no index entry
+    try:
+        with db_session.begin_nested():
+            result = process_event(dict(event), db_session, commit=False)
+            fingerprint = result[0]["incident"].fingerprint
+            raise RuntimeError("bad event")
+    except RuntimeError:
+        pass
+    db_session.commit()
+    assert incident_throttle.stats()["open_windows"] == 0
+    assert fingerprint_index.get(fingerprint) is None
+
+    # The repeat is written for real and only then opens the window
+    assert not process_event(dict(event), db_session)[0].get("throttled")
+    assert incident_throttle.stats()["open_windows"] == 1
+    assert process_event(dict(event), db_session)[0]["throttled"]
+    assert db_session.query(Incident).filter(Incident.source == "host-rb").count() == 1
+
+
+@pytest.mark.asyncio
+async def test_async_handlers_run_queries_off_the_event_loop(client: httpx.AsyncClient, admin_headers, db_session, test_admin):
+    """Hot async routes (and batch ingest) never run their DB work on the loop thread."""
+    import threading
+    from sqlalchemy import event
+    from src.database import async_database_url
+
+    assert async_database_url("postgresql://u:p@db:5432/x") == "postgresql+asyncpg://u:p@db:5432/x"
+    assert async_database_url("sqlite:///./local.db") == "sqlite+aiosqlite:///./local.db"
+
+    incident = Incident(title="Loop check", description="d", severity="low", status="Open",
+                        user_id=test_admin.id, organization_id=test_admin.organization_id)
+    db_session.add(incident)
+    db_session.commit()
+    incident_id = incident.id
+
+    loop_thread = threading.get_ident()
+    threads = set()
+
+    def _record(conn, cursor, statement, params, context, executemany):
+        threads.add(threading.get_ident())
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        resp = await client.put(f"/api/incidents/{incident_id}/update-status", params={"new_status": "Investigating"}, headers=admin_headers)
+        assert resp.status_code == 200
+        resp = await client.post(f"/api/incidents/{incident_id}/notes", json={"note": "on it"}, headers=admin_headers)
+        assert resp.status_code == 200
+        resp = await client.post("/api/ingest/", json={"source": "h", "event_type": "malware_detected"}, headers=admin_headers)
+        assert resp.status_code == 200
+        resp = await client.post("/api/ingest/batch", json=[{"source": "h", "event_type": "malware_detected"}], headers=admin_headers)
+        assert resp.status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
+
+    assert threads and loop_thread not in threads
+    db_session.expire_all()
+    assert db_session.get(Incident, incident_id).status == "Investigating"
+
+
+@pytest.mark.asyncio
+async def test_incident_routes_on_async_engine(client: httpx.AsyncClient, tmp_path):
+    """DB_ASYNC=true path: status, notes and assignment through a real aiosqlite AsyncSession."""
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from main import app
+    from src.auth.security import create_access_token
+    from src.database import Base, get_db, get_async_db, async_database_url, async_session_dependency
+
+    url = f"sqlite:///{tmp_path / 'async.db'}"
+    sync_engine = create_engine(url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(sync_engine)
+    SyncSession = sessionmaker(bind=sync_engine, autoflush=False)
+    async_engine = create_async_engine(async_database_url(url))
+
+    seed = SyncSession()
+    org = Organization(name="Async Org")
+    seed.add(org)
+    seed.flush()
+    admin = User(username="async_admin", email="async@test.com", hashed_password="x", role="admin",
+                 organization=org.name, organization_id=org.id, is_active=True)
+    bob = User(username="bob", email="bob@test.com", hashed_password="x", role="analyst",
+               organization=org.name, organization_id=org.id, is_active=True)
+    seed.add_all([admin, bob])
+    seed.flush()
+    incident = Incident(title="Async", description="d", severity="low", status="Open",
+                        user_id=admin.id, organization_id=org.id)
+    seed.add(incident)
+    seed.commit()
+    incident_id = incident.id
+    seed.close()
+
+    auth_db = SyncSession()
+
+    def _auth_db():
+        yield auth_db
+
+    app.dependency_overrides[get_db] = _auth_db
+    app.dependency_overrides[get_async_db] = async_session_dependency(
+        async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False))
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'async@test.com'})}"}
+    try:
+        resp = await client.put(f"/api/incidents/{incident_id}/update-status", params={"new_status": "Investigating"}, headers=headers)
+        assert resp.status_code == 200
+        resp = await client.post(f"/api/incidents/{incident_id}/notes", json={"note": "ping @bob"}, headers=headers)
+        assert resp.status_code == 200
+        resp = await client.post(f"/api/incidents/{incident_id}/assign", json={"assign_to": "@bob"}, headers=headers)
+        assert resp.status_code == 200
+        assert resp.json()["assignees"] == [{"username": "bob", "role": "analyst"}]
+        assert (await client.post("/api/incidents/9999/notes", json={"note": "x"}, headers=headers)).status_code == 404
+    finally:
+        auth_db.close()
+        await async_engine.dispose()
+
+    check = SyncSession()
+    try:
+        stored = check.get(Incident, incident_id)
+        assert stored.status == "Investigating"
+        assert [u.username for u in stored.assignees] == ["bob"]
+        # status change + note + assignment log
+        assert check.query(IncidentNote).filter(IncidentNote.incident_id == incident_id).count() == 3
+    finally:
+        check.close()
+        sync_engine.dispose()
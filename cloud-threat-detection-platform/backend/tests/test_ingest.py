@@ -54,3 +54,180 @@ async def test_ingest_heartbeat_registers_server(client: httpx.AsyncClient, admi
     assert servers[0].status == "online"
     assert servers[0].ip_address == "192.168.1.99"
     assert servers[0].os_info == "Ubuntu 22.04 LTS"
+
+@pytest.mark.asyncio
+async def test_ingest_batch_per_event_results(client: httpx.AsyncClient, admin_headers, db_session, test_admin):
+    from src.models.incident import Incident
+
+    events = [
+        {"source": "batch-01", "event_type": "system_heartbeat", "data": {"ip": "10.0.0.1", "os": "Debian 12"}},
+        {"source": "batch-01", "event_type": "system_heartbeat", "data": {"ip": "10.0.0.2"}},
+        {"source": "batch-01", "event_type": "malware_detected", "details": "trojan"},
+        {"event_type": "missing_source"},
+        "not-an-object",
+    ]
+    response = await client.post("/api/ingest/batch", json=events, headers=admin_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["accepted"] == 3
+    assert data["rejected"] == 2
+    assert [r["status"] for r in data["results"]] == ["ok", "ok", "ok", "error", "error"]
+    assert len(data["results"][2]["incident_ids"]) == 1
+
+    # Both heartbeats landed on a single inventory row, committed with the batch.
+    db_session.expire_all()
+    servers = db_session.query(Server).filter(Server.user_id == test_admin.id).all()
+    assert len(servers) == 1
+    assert servers[0].ip_address == "10.0.0.2"
+    assert servers[0].os_info == "Debian 12"
+    assert db_session.query(Incident).count() == 1
+
+@pytest.mark.asyncio
+async def test_ingest_batch_ndjson_and_limits(client: httpx.AsyncClient, admin_headers, monkeypatch):
+    body = "\n".join([
+        '{"source": "nd-01", "event_type": "login_failed", "data": {"fail_count": 1}}',
+        '',
+        '{"source": "nd-02", "event_type": "login_failed", "data": {"fail_count": 1}}',
+    ])
+    headers = dict(admin_headers, **{"Content-Type": "application/x-ndjson"})
+    response = await client.post("/api/ingest/batch", content=body, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["accepted"] == 2
+
+    response = await client.post("/api/ingest/batch", content="{not json", headers=headers)
+    assert response.status_code == 400
+
+    from src.routes import ingest
+    monkeypatch.setattr(ingest, "INGEST_BATCH_MAX_EVENTS", 1)
+    events = [{"source": "x", "event_type": "noop"}] * 2
+    response = await client.post("/api/ingest/batch", json=events, headers=admin_headers)
+    assert response.status_code == 413
+
+@pytest.mark.asyncio
+async def test_ingest_queue_accepts_and_processes(client: httpx.AsyncClient, admin_headers, db_session, session_factory, monkeypatch):
+    from src.models.incident import Incident
+    from src.routes import ingest
+    from src.services.ingest_queue import ingest_queue
+
+    monkeypatch.setattr(ingest, "SessionLocal", session_factory)
+    monkeypatch.setattr(ingest_queue, "enabled", True)
+    try:
+        payload = {"source": "queued-01", "event_type": "privilege_escalation", "details": "setuid shell"}
+        response = await client.post("/api/ingest/", json=payload, headers=admin_headers)
+        assert response.status_code == 202
+        assert response.json()["event_id"]
+
+        await ingest_queue.join()
+        db_session.expire_all()
+        assert db_session.query(Incident).filter(Incident.source == "queued-01").count() == 1
+
+        stats = (await client.get("/api/ingest/queue/stats", headers=admin_headers)).json()
+        assert stats["processed"] >= 1
+        assert stats["depth"] == 0
+    finally:
+        await ingest_queue.stop()
+
+@pytest.mark.asyncio
+async def test_ingest_queue_backpressure(client: httpx.AsyncClient, admin_headers, monkeypatch):
+    from src.services.ingest_queue import ingest_queue, QueueFullError
+
+    def full(job):
+        raise QueueFullError()
+
+    monkeypatch.setattr(ingest_queue, "enabled", True)
+    monkeypatch.setattr(ingest_queue, "submit", full)
+    payload = {"source": "queued-02", "event_type": "login_failed"}
+    response = await client.post("/api/ingest/", json=payload, headers=admin_headers)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+@pytest.mark.asyncio
+async def test_heartbeats_coalesced_and_flushed_in_bulk(client: httpx.AsyncClient, admin_headers, db_session, session_factory, test_admin):
+    from src.services.heartbeat_buffer import heartbeat_buffer
+
+    hb = {"source": "coalesce-01", "event_type": "system_heartbeat", "data": {"ip": "10.0.0.1"}}
+    # First heartbeat registers the server through the DB
+    assert (await client.post("/api/ingest/", json=hb, headers=admin_headers)).status_code == 200
+    # Second one loads it and learns its id
+    assert (await client.post("/api/ingest/", json=hb, headers=admin_headers)).status_code == 200
+    server = db_session.query(Server).filter(Server.hostname == "coalesce-01").one()
+    server.status = "offline"
+    db_session.commit()
+
+    heartbeat_buffer.start(session_factory, interval_ms=0)
+    for ip in ("10.0.0.2", "10.0.0.3", "10.0.0.4"):
+        hb["data"] = {"ip": ip}
+        assert (await client.post("/api/ingest/", json=hb, headers=admin_headers)).status_code == 200
+
+    db_session.expire_all()
+    assert db_session.get(Server, server.id).status == "offline"  # nothing written yet
+
+    listed = (await client.get("/api/servers", headers=admin_headers)).json()
+    assert [(s["status"], s["ip_address"]) for s in listed if s["hostname"] == "coalesce-01"] == [("online", "10.0.0.4")]
+
+    assert heartbeat_buffer.flush() == 1
+    db_session.expire_all()
+    persisted = db_session.get(Server, server.id)
+    assert persisted.status == "online"
+    assert persisted.ip_address == "10.0.0.4"
+
+@pytest.mark.asyncio
+async def test_ingest_event_commits_once(client: httpx.AsyncClient, admin_headers, db_session, test_admin):
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+    from src.models.incident import Incident
+    from src.models.incident_event import IncidentEvent
+
+    commits = []
+    listener = lambda session: commits.append(session)
+    event.listen(Session, "after_commit", listener)
+    try:
+        for hostname in ("db-server-7", "db-server-7"):
+            commits.clear()
+            response = await client.post("/api/ingest/", json={
+                "source": hostname, "event_type": "malware_detected", "details": "trojan"
+            }, headers=admin_headers)
+            assert response.status_code == 200
+            assert len(commits) == 1  # create, then merge: one transaction each
+
+        commits.clear()
+        response = await client.post("/api/ingest/", json={
+            "source": "db-server-7", "event_type": "system_heartbeat", "data": {"ip": "10.0.0.7"}
+        }, headers=admin_headers)
+        assert response.status_code == 200
+        assert len(commits) == 1
+    finally:
+        event.remove(Session, "after_commit", listener)
+
+    incident = db_session.query(Incident).filter(Incident.source == "db-server-7").one()
+    assert incident.alert_count == 2
+    assert db_session.query(IncidentEvent).filter(IncidentEvent.incident_id == incident.id).count() == 2
+
+@pytest.mark.asyncio
+async def test_heartbeat_cache_drops_servers_deleted_elsewhere(client: httpx.AsyncClient, admin_headers, db_session, session_factory):
+    from src.services.heartbeat_buffer import heartbeat_buffer
+
+    hb = {"source": "gone-01", "event_type": "system_heartbeat"}
+    assert (await client.post("/api/ingest/", json=hb, headers=admin_headers)).status_code == 200
+    assert (await client.post("/api/ingest/", json=hb, headers=admin_headers)).status_code == 200
+    server = db_session.query(Server).filter(Server.hostname == "gone-01").one()
+    user_id = server.user_id
+
+    heartbeat_buffer.start(session_factory, interval_ms=0)
+    assert (await client.post("/api/ingest/", json=hb, headers=admin_headers)).status_code == 200
+    # Deleted by another worker: this process never saw the DELETE
+    db_session.delete(server)
+    db_session.commit()
+
+    assert heartbeat_buffer.flush() == 0
+    assert heartbeat_buffer.lookup(user_id, "gone-01") is None
+    assert (await client.post("/api/ingest/", json=hb, headers=admin_headers)).status_code == 200
+    db_session.expire_all()
+    assert db_session.query(Server).filter(Server.hostname == "gone-01").count() == 1
+
+    # The id map is an LRU
+    heartbeat_buffer.max_ids = 2
+    for i in range(3):
+        heartbeat_buffer.remember(99, f"h{i}", 1000 + i)
+    assert heartbeat_buffer.lookup(99, "h0") is None and heartbeat_buffer.lookup(99, "h2") == 1002
+    heartbeat_buffer.max_ids = 10000
@@ -0,0 +1,146 @@
+import pytest
+from types import SimpleNamespace
+from src.models.incident import Incident
+from src.services import kafka_consumer
+
+
+class _StopLoop(Exception):
+    pass
+
+
+class FakeConsumer:
+    """Minimal stand-in for KafkaConsumer.poll/commit/seek."""
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.commits = 0
+        self.seeks = []
+
+    def poll(self, timeout_ms=0, max_records=None):
+        if not self.batches:
+            raise _StopLoop()
+        return self.batches.pop(0)
+
+    def commit(self):
+        self.commits += 1
+
+    def seek(self, tp, offset):
+        self.seeks.append((tp, offset))
+
+
+def _records(tp, events, start=0):
+    return {tp: [SimpleNamespace(value=e, offset=start + i) for i, e in enumerate(events)]}
+
+
+def test_batch_persists_once_then_commits_offsets(db_session, session_factory, test_admin, monkeypatch):
+    monkeypatch.setattr(kafka_consumer, "get_db", lambda: iter([session_factory()]))
+    events = [
+        {"source": "k-01", "event_type": "malware_detected", "user_id": test_admin.id, "organization_id": test_admin.organization_id},
+        {"source": "k-01", "event_type": "malware_detected", "user_id": test_admin.id, "organization_id": test_admin.organization_id},
+        {"source": "k-02", "event_type": "port_scan", "user_id": test_admin.id},
+    ]
+    consumer = FakeConsumer([_records("tp0", events)])
+
+    with pytest.raises(_StopLoop):
+        kafka_consumer._consume_batches(consumer, None, batch_size=10, linger_ms=10)
+
+    assert consumer.commits == 1
+    assert consumer.seeks == []
+    db_session.expire_all()
+    # Two malware events merged into one incident + one fallback incident
+    assert db_session.query(Incident).count() == 2
+    assert db_session.query(Incident).filter(Incident.source == "k-01").one().alert_count == 2
+
+
+def test_failed_batch_is_rewound_not_committed(db_session, monkeypatch):
+    def boom(events, db):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(kafka_consumer, "process_batch", boom)
+    monkeypatch.setattr(kafka_consumer, "get_db", lambda: iter([db_session]))
+    monkeypatch.setattr(kafka_consumer.time, "sleep", lambda s: None)
+    consumer = FakeConsumer([_records("tp0", [{"event_type": "x"}], start=42)])
+
+    with pytest.raises(_StopLoop):
+        kafka_consumer._consume_batches(consumer, None, batch_size=10, linger_ms=10)
+
+    assert consumer.commits == 0
+    assert consumer.seeks == [("tp0", 42)]
+
+
+def test_pool_workers_stop_cleanly_and_report_stats(monkeypatch):
+    seen = []
+
+    def fake_start_consumer(main_loop=None, stop_event=None, stats=None):
+        seen.append(stats.name)
+        stats.record_batch(3)
+        stop_event.wait(5)
+
+    monkeypatch.setattr(kafka_consumer, "start_consumer", fake_start_consumer)
+    pool = kafka_consumer.ConsumerPool()
+    pool.start(workers=3)
+    pool.stop(timeout=5)
+
+    assert sorted(seen) == ["kafka-consumer-0", "kafka-consumer-1", "kafka-consumer-2"]
+    assert pool.workers == []
+    snapshot = pool.snapshot()
+    assert [s["messages"] for s in snapshot] == [3, 3, 3]
+    assert all(s["batches"] == 1 for s in snapshot)
+
+
+def test_batch_loop_exits_when_stop_event_set(session_factory, monkeypatch):
+    import threading
+    monkeypatch.setattr(kafka_consumer, "get_db", lambda: iter([session_factory()]))
+    stop = threading.Event()
+    stats = kafka_consumer.ConsumerStats("w0")
+
+    class StoppingConsumer(FakeConsumer):
+        def commit(self):
+            super().commit()
+            stop.set()
+
+    consumer = StoppingConsumer([_records("tp0", [{"event_type": "x"}]), {}])
+    kafka_consumer._consume_batches(consumer, None, 10, 10, stop_event=stop, stats=stats)
+
+    assert consumer.commits == 1
+    assert stats.messages == 1 and stats.batches == 1
+
+
+def test_kafka_errors_do_not_end_the_loop_and_dead_workers_respawn(session_factory, monkeypatch):
+    from kafka.errors import CommitFailedError, KafkaError
+    monkeypatch.setattr(kafka_consumer, "get_db", lambda: iter([session_factory()]))
+    monkeypatch.setattr(kafka_consumer.time, "sleep", lambda s: None)
+    stats = kafka_consumer.ConsumerStats("w0")
+
+    class FlakyConsumer(FakeConsumer):
+        def poll(self, timeout_ms=0, max_records=None):
+            if self.batches and self.batches[0] == "poll-error":
+                self.batches.pop(0)
+                raise KafkaError("broker unavailable")
+            return super().poll(timeout_ms, max_records)
+
+        def commit(self):
+            super().commit()
+            raise CommitFailedError("rebalanced")
+
+    consumer = FlakyConsumer(["poll-error", _records("tp0", [{"event_type": "x"}])])
+    with pytest.raises(_StopLoop):
+        kafka_consumer._consume_batches(consumer, None, 10, 10, stats=stats)
+    assert consumer.commits == 1
+    assert stats.failed_commits == 1 and stats.batches == 1
+
+    # A worker thread that returns is respawned with the same stats
+    runs = []
+
+    def short_lived(main_loop=None, stop_event=None, stats=None):
+        runs.append(stats.name)
+
+    monkeypatch.setattr(kafka_consumer, "start_consumer", short_lived)
+    pool = kafka_consumer.ConsumerPool()
+    pool.start(workers=1, check_interval=0)
+    pool.workers[0].join(timeout=5)
+    assert pool.check_workers() == 1
+    pool.workers[0].join(timeout=5)
+    assert runs == ["kafka-consumer-0", "kafka-consumer-0"]
+    assert pool.snapshot()[0]["restarts"] == 1
+    pool.stop(timeout=5)
+    assert pool.check_workers() == 0
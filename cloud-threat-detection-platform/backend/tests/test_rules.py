@@ -75,3 +75,199 @@ async def test_rule_engine_evaluation(client: httpx.AsyncClient, admin_headers,
     assert incidents[0].title == "Critical Unauthorized Sudo Rule"
     assert incidents[0].severity == "critical"
     assert incidents[0].source == "web-01"
+
+@pytest.mark.asyncio
+async def test_rule_cache_invalidated_on_create_and_delete(client: httpx.AsyncClient, admin_headers, db_session):
+    event = {
+        "source": "web-02",
+        "event_type": "unauthorized_sudo",
+        "details": "sudo attempt",
+        "severity": "low",
+        "data": {"uid": 1001}
+    }
+
+    # Warm the cache with no rules: nothing matches.
+    assert (await client.post("/api/ingest/", json=event, headers=admin_headers)).status_code == 200
+    assert db_session.query(Incident).count() == 0
+
+    # Creating a rule through the API must take effect on the very next event.
+    rule_payload = {
+        "name": "Sudo By Service Account",
+        "conditions": [
+            {"field": "event_type", "op": "equals", "value": "unauthorized_sudo"},
+            {"field": "data.uid", "op": "gt", "value": "1000"}
+        ],
+        "severity": "high"
+    }
+    rule_id = (await client.post("/api/rules/", json=rule_payload, headers=admin_headers)).json()["id"]
+    assert (await client.post("/api/ingest/", json=event, headers=admin_headers)).status_code == 200
+    db_session.expire_all()
+    assert db_session.query(Incident).count() == 1
+
+    # ...and deleting it must stop further matches.
+    db_session.query(Incident).delete()
+    db_session.commit()
+    assert (await client.delete(f"/api/rules/{rule_id}", headers=admin_headers)).status_code == 200
+    assert (await client.post("/api/ingest/", json=event, headers=admin_headers)).status_code == 200
+    db_session.expire_all()
+    assert db_session.query(Incident).count() == 0
+
+
+def test_compiled_conditions_match_interpreted_semantics():
+    from src.services.rule_cache import compile_conditions
+
+    matches = compile_conditions('[{"field": "data.cpu", "op": "gt", "value": "90"}, {"field": "source", "op": "contains", "value": "web"}]')
+    assert matches({"source": "web-01", "data": {"cpu": 95}})
+    assert not matches({"source": "web-01", "data": {"cpu": 50}})
+    assert not matches({"source": "db-01", "data": {"cpu": 95}})
+    # Missing or non-numeric fields never match numeric comparisons.
+    assert not matches({"source": "web-01", "data": {}})
+    assert not matches({"source": "web-01", "data": {"cpu": "n/a"}})
+    assert compile_conditions("not json") is None
+
+
+def test_rule_index_buckets_by_event_type(db_session, test_org):
+    import json
+    from src.models.rule import Rule
+    from src.services.rule_cache import rule_cache
+
+    def add(name, conditions, target_server=None):
+        db_session.add(Rule(name=name, conditions=json.dumps(conditions), severity="low", enabled=True,
+                            organization_id=test_org.id, target_server=target_server))
+
+    add("login", [{"field": "event_type", "op": "equals", "value": "login_failed"}])
+    add("cpu", [{"field": "event_type", "op": "equals", "value": "metrics"}, {"field": "data.cpu", "op": "gt", "value": 90}])
+    add("legacy-malware", {"event_type": "malware_detected"})
+    add("any-web", [{"field": "source", "op": "contains", "value": "web"}])
+    add("web-01-login", [{"field": "event_type", "op": "equals", "value": "login_failed"}], target_server="web-01")
+    db_session.commit()
+
+    def names(source, event_type):
+        return [r.name for r in rule_cache.get_rules(db_session, test_org.id, source, event_type)]
+
+    # Targeted rules still come first; rules for other event types are never offered
+    assert names("web-01", "login_failed") == ["web-01-login", "login", "any-web"]
+    assert names("db-01", "login_failed") == ["login", "any-web"]
+    assert names("db-01", "heartbeat") == ["any-web"]
+    assert names("db-01", "malware_detected") == ["legacy-malware", "any-web"]
+    # Without an event type the full source bucket is returned as before
+    assert len(rule_cache.get_rules(db_session, test_org.id, "db-01")) == 4
+
+
+@pytest.mark.asyncio
+async def test_rule_changes_on_other_workers_invalidate_the_cache(client: httpx.AsyncClient, admin_headers, db_session, test_admin):
+    from src.services.broadcast_bus import decode_invalidation, encode_invalidation
+    from src.services.broadcaster import broadcaster
+
+    class RecordingBus:
+        node_id = "this-worker"
+
+        def __init__(self):
+            self.sent = []
+
+        def publish(self, payload):
+            self.sent.append(payload)
+
+    event = {"source": "web-03", "event_type": "unauthorized_sudo", "details": "x", "severity": "low"}
+    rule = {"name": "Any sudo", "conditions": [{"field": "event_type", "op": "equals", "value": "unauthorized_sudo"}], "severity": "high"}
+
+    broadcaster.bus = bus = RecordingBus()
+    try:
+        rule_id = (await client.post("/api/rules/", json=rule, headers=admin_headers)).json()["id"]
+        assert decode_invalidation(bus.sent[-1]) == ("this-worker", "rules", test_admin.organization_id)
+        assert (await client.post("/api/ingest/", json=event, headers=admin_headers)).status_code == 200
+
+        # Another worker deletes the rule: its announcement stops matches here too
+        db_session.query(Rule).filter(Rule.id == rule_id).delete()
+        db_session.query(Incident).delete()
+        db_session.commit()
+        broadcaster._receive(encode_invalidation("other-worker", "rules", test_admin.organization_id))
+        assert (await client.post("/api/ingest/", json=event, headers=admin_headers)).status_code == 200
+        db_session.expire_all()
+        assert db_session.query(Incident).count() == 0
+    finally:
+        broadcaster.bus = None
+
+
+@pytest.mark.asyncio
+async def test_windowed_count_rule_fires_at_threshold(client: httpx.AsyncClient, admin_headers, db_session):
+    from src.models.incident import Incident
+
+    rule = {
+        "name": "3 failed logins per source in 60s",
+        "conditions": [{"field": "event_type", "op": "equals", "value": "auth_failure"}],
+        "severity": "high",
+        "window": {"seconds": 60, "threshold": 3},
+    }
+    assert (await client.post("/api/rules/", json=rule, headers=admin_headers)).status_code == 200
+    listed = (await client.get("/api/rules/", headers=admin_headers)).json()
+    assert listed[0]["window"]["agg"] == "count" and listed[0]["window"]["group_by"] == "source"
+
+    def event(source):
+        return {"source": source, "event_type": "auth_failure", "details": "bad password", "severity": "low"}
+
+    for _ in range(2):
+        assert (await client.post("/api/ingest/", json=event("host-a"), headers=admin_headers)).status_code == 200
+    # Another source has its own window
+    assert (await client.post("/api/ingest/", json=event("host-b"), headers=admin_headers)).status_code == 200
+    assert db_session.query(Incident).count() == 0
+
+    assert (await client.post("/api/ingest/", json=event("host-a"), headers=admin_headers)).status_code == 200
+    incident = db_session.query(Incident).one()
+    assert incident.source == "host-a"
+    assert incident.description.startswith("Window threshold reached: count=3 within 60s")
+
+    # A sum window without a field is rejected
+    bad = dict(rule, window={"seconds": 300, "threshold": 500, "agg": "sum"})
+    assert (await client.post("/api/rules/", json=bad, headers=admin_headers)).status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_windowed_rule_groups_get_their_own_incident(client: httpx.AsyncClient, admin_headers, db_session):
+    from src.models.incident import Incident
+
+    rule = {
+        "name": "2 failed logins per user in 60s",
+        "conditions": [{"field": "event_type", "op": "equals", "value": "auth_failure"}],
+        "severity": "high",
+        "window": {"seconds": 60, "threshold": 2, "group_by": "data.user"},
+    }
+    assert (await client.post("/api/rules/", json=rule, headers=admin_headers)).status_code == 200
+
+    for user in ("alice", "alice", "bob", "bob"):
+        payload = {"source": "host-a", "event_type": "auth_failure", "details": "x", "severity": "low", "data": {"user": user}}
+        assert (await client.post("/api/ingest/", json=payload, headers=admin_headers)).status_code == 200
+
+    # Same source, different group: bob's burst is not merged into alice's incident
+    assert db_session.query(Incident).count() == 2
+
+
+def test_window_state_is_keyed_by_rule_spec():
+    from src.services.rule_cache import compile_window
+    from src.services.rule_engine import _window_total
+
+    class Rule:
+        id = 7
+        window = compile_window({"seconds": 60, "threshold": 2})
+
+    event = {"source": "host-a"}
+    assert _window_total(Rule, event, "host-a", 1, None) == 1.0
+    assert _window_total(Rule, event, "host-a", 1, None) == 2.0
+    # Reloaded with a different window: counting starts over
+    Rule.window = compile_window({"seconds": 600, "threshold": 2})
+    assert _window_total(Rule, event, "host-a", 1, None) == 1.0
+
+
+def test_sliding_window_expires_old_buckets():
+    from src.services.sliding_window import SlidingWindowStore
+
+    store = SlidingWindowStore(max_keys=2, buckets=10)
+    assert store.observe("k", 10, 5.0, now=100.0) == 5.0
+    assert store.observe("k", 10, 1.0, now=105.0) == 6.0
+    # t=100 bucket has slid out of the 10s window
+    assert store.observe("k", 10, 1.0, now=110.5) == 2.0
+    assert store.observe("k", 10, 1.0, now=500.0) == 1.0
+    # Bounded: the least recently used key is evicted
+    store.observe("a", 10, now=500.0)
+    store.observe("b", 10, now=500.0)
+    assert len(store) == 2 and store.observe("k", 10, now=500.0) == 1.0
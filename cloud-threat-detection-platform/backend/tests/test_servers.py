@@ -59,3 +59,264 @@ async def test_list_servers_rbac(client: httpx.AsyncClient, db_session, test_adm
     servers_analyst = response_analyst.json()
     assert len(servers_analyst) == 1
     assert servers_analyst[0]["hostname"] == "analyst-srv-01"
+
+
+def test_batch_scoring_matches_predict_with_one_call_per_model(monkeypatch):
+    import numpy as np
+    from sklearn.ensemble import IsolationForest
+    from src.services import anomaly_detector as ad
+
+    rng = np.random.RandomState(0)
+    model = IsolationForest(n_estimators=20, contamination=0.05, random_state=42).fit(rng.normal(50, 5, size=(200, 5)))
+    det = ad.AnomalyDetector(organization_id="t8", source="batch-srv")
+    det.model, det.is_trained, det.training_mode, det.pending_approval = model, True, False, False
+    monkeypatch.setitem(ad.manager.detectors, "t8:batch-srv", det)
+
+    calls = []
+    real = model.score_samples
+    monkeypatch.setattr(model, "score_samples", lambda X: calls.append(len(X)) or real(X))
+
+    rows = [[50, 50, 50, 50, 50], [99, 1, 400, 0, 3], [51, 49, 50, 52, 48]]
+    events = [{"event_type": "system_heartbeat", "source": "batch-srv",
+               "data": dict(zip(["cpu", "ram", "disk_write_mb", "net_out_mb", "process_count"], r))} for r in rows]
+    events.insert(1, {"event_type": "login_failed", "source": "batch-srv"})
+
+    results = ad.detect_anomalies_batch(events, organization_id="t8")
+
+    assert calls == [3]
+    assert results[1] is None
+    expected = [p == -1 for p in model.predict(np.array(rows))]
+    assert [r is not None for r in (results[0], results[2], results[3])] == expected
+
+
+@pytest.mark.asyncio
+async def test_scoring_batcher_never_waits_on_the_event_loop():
+    import threading
+    import time
+    from src.services.anomaly_detector import ScoringBatcher
+
+    class FakeDetector:
+        def __init__(self):
+            self.calls = []
+
+        def score_rows(self, rows):
+            self.calls.append(len(rows))
+            return [float(r[0]) for r in rows]
+
+    det = FakeDetector()
+    batcher = ScoringBatcher(window_ms=300, max_batch=2)
+
+    started = time.monotonic()
+    assert batcher.score(det, [7]) == 7.0
+    assert time.monotonic() - started < 0.2
+    assert det.calls == [1]
+
+    results = {}
+    threads = [threading.Thread(target=lambda v=v: results.__setitem__(v, batcher.score(det, [v]))) for v in (1, 2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+
+    assert results == {1: 1.0, 2: 2.0}
+    assert det.calls == [1, 2]
+
+
+def test_training_runs_off_request_path_and_swaps_model(monkeypatch, tmp_path):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from src.services import anomaly_detector as ad
+
+    release = threading.Event()
+    real_fit = ad._fit_model
+
+    def gated_fit(X):
+        release.wait(5)
+        return real_fit(X)
+
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(ad, "MODEL_DIR", str(tmp_path))
+    monkeypatch.setattr(ad, "_fit_model", gated_fit)
+    monkeypatch.setattr(ad, "get_training_pool", lambda: pool)
+
+    det = ad.AnomalyDetector(organization_id="t9", source="train-srv")
+    for i in range(ad.TRAINING_BUFFER_SIZE):
+        det.process_event({"event_type": "system_heartbeat", "data": {"cpu": 40 + i % 5, "ram": 50}})
+
+    # Fit is queued, the heartbeat that filled the buffer returned immediately
+    assert det.is_training
+    assert det.get_status()["mode"] == "Training"
+    assert det.model is None
+
+    release.set()
+    det.training_future.result(timeout=5)
+    pool.shutdown(wait=True)
+
+    status = det.get_status()
+    assert status["mode"] == "Pending Approval"
+    assert status["training_in_progress"] is False
+    assert det.model is not None
+    assert (tmp_path / "model_org_t9_src_train_srv.v1.joblib").exists()
+
+
+def test_concurrent_train_calls_start_a_single_fit(monkeypatch, tmp_path):
+    import time
+    from concurrent.futures import Future, ThreadPoolExecutor
+    from src.services import anomaly_detector as ad
+
+    submitted = []
+
+    class SlowPool:
+        def submit(self, fn, X):
+            submitted.append(len(X))
+            time.sleep(0.05)  # widen the window between the check and the hand-off
+            return Future()  # never completes: the fit stays in flight
+
+    monkeypatch.setattr(ad, "MODEL_DIR", str(tmp_path))
+    monkeypatch.setattr(ad, "get_training_pool", lambda: SlowPool())
+    det = ad.AnomalyDetector(organization_id="t9", source="race-srv")
+    det.buffer.extend([[40, 50, 0, 0, 10]] * ad.TRAINING_BUFFER_SIZE)
+
+    with ThreadPoolExecutor(max_workers=8) as callers:
+        list(callers.map(lambda _: det.train(), range(8)))
+
+    assert submitted == [ad.TRAINING_BUFFER_SIZE]
+    assert det.is_training
+
+
+def test_detector_registry_evicts_lru_and_reloads_buffer(monkeypatch, tmp_path):
+    from src.services import anomaly_detector as ad
+
+    monkeypatch.setattr(ad, "MODEL_DIR", str(tmp_path))
+    registry = ad.OrganizationMLManager(max_detectors=2)
+    hb = {"event_type": "system_heartbeat", "data": {"cpu": 10, "ram": 20}}
+
+    for _ in range(3):
+        registry.get_detector(7, "srv-a").process_event(hb)
+    registry.get_detector(7, "srv-b")
+    registry.get_detector(7, "srv-c")  # evicts srv-a (least recently used)
+
+    assert list(registry.detectors) == ["7:srv-b", "7:srv-c"]
+    assert registry.evicted == 1
+    assert {st["source"] for st in registry.statuses(7)} == {"srv-a", "srv-b", "srv-c"}
+
+    reloaded = registry.find(7, "srv-a")
+    assert reloaded is not None
+    assert len(reloaded.buffer) == 3
+    assert registry.find(7, "never-seen") is None
+
+    # Statuses of evicted detectors don't accumulate past the registry size
+    for n in range(10):
+        registry.get_detector(7, f"churn-{n}")
+    assert len(registry._evicted_status) == 2
+
+
+def test_model_store_shares_versions_and_approval_between_workers(monkeypatch, tmp_path):
+    import sqlite3
+    from src.services import anomaly_detector as ad
+    from src.services import model_store as ms
+
+    monkeypatch.setattr(ad, "MODEL_DIR", str(tmp_path))
+    monkeypatch.setattr(ad, "ML_TRAINING_WORKERS", 0)
+    monkeypatch.setattr(ms, "ML_BUFFER_BACKEND", "sqlite")
+    monkeypatch.setattr(ms, "_buffer_store", ms.SQLiteBufferStore(str(tmp_path / "buffers.sqlite3"), ad.TRAINING_BUFFER_SIZE))
+
+    # Two "worker processes" for the same server share one buffer
+    worker_a = ad.AnomalyDetector(organization_id="t11", source="shared-srv")
+    worker_b = ad.AnomalyDetector(organization_id="t11", source="shared-srv")
+    for i in range(ad.TRAINING_BUFFER_SIZE):
+        w = worker_a if i % 2 else worker_b
+        w.process_event({"event_type": "system_heartbeat", "data": {"cpu": 40 + i % 7, "ram": 50 + i % 3}})
+
+    trained = worker_a if worker_a.model is not None else worker_b
+    other = worker_b if trained is worker_a else worker_a
+    assert trained.model_version == 1 and trained.pending_approval
+    assert other.model is None
+
+    other.refresh(force=True)
+    assert other.model_version == 1 and other.pending_approval
+
+    # A live claim is answered by a read: no wait on another writer's lock
+    store = ms._buffer_store
+    assert store.claim("busy-srv")
+    writer = sqlite3.connect(store.path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        assert store.claim("busy-srv") is False
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+    store.release("busy-srv")
+
+    trained.approve()
+    other.refresh(force=True)
+    assert other.is_active
+
+    trained.reset()
+    other.refresh(force=True)
+    assert other.training_mode and other.model is None
+
+
+@pytest.mark.asyncio
+async def test_liveness_tracker_expires_and_pushes_transitions(client: httpx.AsyncClient, db_session, session_factory, test_admin, admin_headers):
+    import asyncio
+    import time
+    from datetime import datetime
+    from src.services.liveness import liveness
+    from src.services.broadcaster import broadcaster
+
+    server = Server(hostname="live-01", user_id=test_admin.id, status="online", last_heartbeat=datetime.utcnow())
+    db_session.add(server)
+    db_session.commit()
+
+    liveness.start(asyncio.get_running_loop(), session_factory, background=False)
+    sid, q = await broadcaster.subscribe(test_admin.organization_id)
+    try:
+        assert liveness.status(server.id) == "online"
+
+        # Nothing expires before the deadline, everything after it
+        assert liveness.tick(now=time.monotonic()) == []
+        assert liveness.tick(now=time.monotonic() + liveness.timeout + 1) == [server.id]
+        event = await asyncio.wait_for(q.get(), 1)
+        assert event["type"] == "server_offline" and event["server_id"] == server.id
+
+        db_session.expire_all()
+        assert db_session.get(Server, server.id).status == "offline"
+        listed = (await client.get("/api/servers", headers=admin_headers)).json()
+        assert [s["status"] for s in listed if s["id"] == server.id] == ["offline"]
+
+        liveness.beat(server.id, test_admin.organization_id, "live-01")
+        event = await asyncio.wait_for(q.get(), 1)
+        assert event["type"] == "server_online"
+        # Already offline: a second expiry pass doesn't re-emit or re-persist
+        assert liveness.tick(now=time.monotonic()) == []
+    finally:
+        await broadcaster.unsubscribe(sid)
+
+
+@pytest.mark.asyncio
+async def test_liveness_defers_to_heartbeats_seen_by_other_workers(client: httpx.AsyncClient, db_session, session_factory, test_admin, admin_headers):
+    import time
+    from datetime import datetime, timedelta
+    from src.services.liveness import liveness
+
+    liveness.start(None, session_factory, background=False)
+    resp = await client.post("/api/ingest/", json={"source": "multi-01", "event_type": "system_heartbeat"}, headers=admin_headers)
+    assert resp.status_code == 200
+    server = db_session.query(Server).filter(Server.hostname == "multi-01").one()
+    # Registered with the tracker once the heartbeat committed
+    assert liveness.status(server.id) == "online"
+
+    # Later heartbeats went to another worker: the DB row is fresh at expiry time
+    server.last_heartbeat = datetime.utcnow() + timedelta(seconds=liveness.timeout)
+    db_session.commit()
+    later = time.monotonic() + liveness.timeout + 1
+    assert liveness.tick(now=later) == []
+    db_session.expire_all()
+    assert db_session.get(Server, server.id).status == "online"
+    assert liveness.status(server.id) == "online"
+
+    # Re-armed from the DB heartbeat: it expires once that one is stale too
+    assert liveness.tick(now=later + liveness.timeout) == [server.id]
+    db_session.expire_all()
+    assert db_session.get(Server, server.id).status == "offline"
@@ -69,3 +69,137 @@ async def test_broadcaster_tenant_isolation():
         await broadcaster.unsubscribe(sid2)
 
 
+
+
+@pytest.mark.asyncio
+async def test_broadcaster_bounded_queues_apply_overflow_policy():
+    from src.services.broadcaster import Broadcaster, DISCONNECT
+
+    for policy, expected in (("drop_oldest", [2, 3]), ("drop_newest", [0, 1])):
+        b = Broadcaster(maxsize=2, overflow_policy=policy)
+        sid, q = await b.subscribe(organization_id=1)
+        for i in range(4):
+            await b.publish({"n": i}, organization_id=1)
+        assert [q.get_nowait()["n"] for _ in range(q.qsize())] == expected
+        assert b.stats(1)["subscribers"][0]["dropped"] == 2
+        await b.unsubscribe(sid)
+        assert b.stats()["subscribers"] == []
+
+    b = Broadcaster(maxsize=2, overflow_policy="disconnect")
+    sid, q = await b.subscribe(organization_id=1)
+    other_sid, other_q = await b.subscribe(organization_id=2)
+    for i in range(3):
+        await b.publish({"n": i}, organization_id=1)
+    assert q.get_nowait() is DISCONNECT and q.empty()
+    assert other_q.empty()
+    assert b.stats(2)["subscribers"][0]["dropped"] == 0
+
+
+@pytest.mark.asyncio
+async def test_broadcaster_cross_worker_bus_messages():
+    from src.services.broadcaster import Broadcaster
+    from src.services.broadcast_bus import PostgresNotifyBus, encode, decode
+
+    b = Broadcaster()
+    b.bus = PostgresNotifyBus("postgresql://unused")  # not started: publish only fills the outbox
+    b.bus.next_seq = lambda: 41  # stands in for nextval() on the shared sequence
+    sid, q = await b.subscribe(organization_id=7)
+
+    # Local subscribers get the event immediately and it is queued, with its id, for the other workers
+    await b.publish({"n": 1}, organization_id=7)
+    assert q.get_nowait() == {"n": 1}
+    assert decode(b.bus._outbox.get_nowait()) == (b.bus.node_id, 7, {"n": 1}, 41)
+
+    # Our own NOTIFY echo is ignored; another worker's event is fanned out to its org only
+    b._receive(encode(b.bus.node_id, 7, {"n": 1}))
+    b._receive(encode("other-worker", 7, {"n": 2}))
+    b._receive(encode("other-worker", 8, {"n": 3}))
+    assert q.get_nowait() == {"n": 2}
+    assert q.empty()
+
+    b.bus.publish(encode("x", 7, {"blob": "x" * 9000}))
+    assert b.bus.oversized == 1
+
+
+@pytest.mark.asyncio
+async def test_broadcaster_replays_missed_events_after_last_event_id():
+    from src.services.broadcaster import Broadcaster
+
+    b = Broadcaster(maxsize=10)
+    b.replay_size = 3
+    sid, q = await b.subscribe(organization_id=1)
+    for i in range(1, 5):
+        await b.publish({"n": i}, organization_id=1)
+    await b.publish({"n": "other-org"}, organization_id=2)
+    ids = [q.get_nowait().event_id for _ in range(4)]
+    assert ids == [f"{b.stream_id}-{i}" for i in range(1, 5)]
+    await b.unsubscribe(sid)
+
+    # Ids 3 and 4 are still buffered: only those are replayed
+    sid, q = await b.subscribe(organization_id=1, last_event_id=ids[1])
+    assert [q.get_nowait()["n"] for _ in range(q.qsize())] == [3, 4]
+    await b.unsubscribe(sid)
+
+    # Up to date: nothing to replay, live events continue the sequence
+    sid, q = await b.subscribe(organization_id=1, last_event_id=ids[3])
+    assert q.empty()
+    await b.publish({"n": 5}, organization_id=1)
+    assert q.get_nowait().event_id == f"{b.stream_id}-5"
+    await b.unsubscribe(sid)
+
+    # Outside the buffer, or an id from another process: ask for a refetch
+    for stale in (ids[0], "deadbeef-3", "garbage"):
+        sid, q = await b.subscribe(organization_id=1, last_event_id=stale)
+        assert q.get_nowait()["type"] == "resync" and q.empty()
+        await b.unsubscribe(sid)
+
+
+@pytest.mark.asyncio
+async def test_broadcaster_replays_across_workers_with_shared_ids():
+    import itertools
+    from src.services.broadcaster import Broadcaster
+
+    class FakeBus:
+        """Two workers on one channel: what one publishes the other receives."""
+        channel = "ctdirp_events"
+
+        def __init__(self, node_id, seq):
+            self.node_id = node_id
+            self.next_seq = seq
+            self.peer = None
+
+        def start(self, on_message):
+            pass
+
+        def publish(self, payload):
+            self.peer.bus.on_message(payload)
+
+        def stop(self):
+            pass
+
+    seq = itertools.count(1).__next__
+    loop = asyncio.get_running_loop()
+    worker_a, worker_b = Broadcaster(maxsize=10), Broadcaster(maxsize=10)
+    worker_a.start_bus(loop, FakeBus("a", seq))
+    worker_b.start_bus(loop, FakeBus("b", seq))
+    worker_a.bus.peer, worker_b.bus.peer = worker_b, worker_a
+    worker_a.bus.on_message, worker_b.bus.on_message = worker_a._receive, worker_b._receive
+
+    sid, q = await worker_a.subscribe(organization_id=1)
+    await worker_a.publish({"n": 1}, organization_id=1)
+    await worker_b.publish({"n": 2}, organization_id=1)
+    seen = [q.get_nowait().event_id for _ in range(2)]
+    assert seen == ["ctdirp_events-1", "ctdirp_events-2"]
+    await worker_a.unsubscribe(sid)
+    await worker_a.publish({"n": 3}, organization_id=1)
+
+    # The client reconnects to the other worker: only what it missed is replayed
+    sid, q = await worker_b.subscribe(organization_id=1, last_event_id=seen[-1])
+    replayed = q.get_nowait()
+    assert replayed["n"] == 3 and replayed.event_id == "ctdirp_events-3" and q.empty()
+    await worker_b.unsubscribe(sid)
+
+    # An org this worker hasn't heard from since it started can't be replayed
+    sid, q = await worker_b.subscribe(organization_id=2, last_event_id="ctdirp_events-2")
+    assert q.get_nowait()["type"] == "resync"
+    await worker_b.unsubscribe(sid)
@@ -78,6 +78,8 @@ export default function Dashboard({ apiBase = "/api" }) {
   const [severity, setSeverity] = useState("low");
   const [selectedIncident, setSelectedIncident] = useState(null);
   const [visibleCount, setVisibleCount] = useState(10);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   // Handle URL params for deep linking
   useEffect(() => {
@@ -100,6 +102,7 @@ export default function Dashboard({ apiBase = "/api" }) {
     if (!token) return; // Wait for token
     setLoading(true);
     try {
+      // Newest page only; older pages are fetched on demand via X-Next-Cursor
       const res = await axios.get(`${apiBase}/incidents/`, {
         headers: { Authorization: `Bearer ${token}` }
       });
@@ -111,6 +114,7 @@ export default function Dashboard({ apiBase = "/api" }) {
       else arr = [];
 
       setIncidents(arr);
+      setNextCursor(res.headers["x-next-cursor"] || null);
       setStatusMsg("System Updated");
     } catch (err) {
       console.error("fetchIncidents error:", err);
@@ -120,11 +124,34 @@ export default function Dashboard({ apiBase = "/api" }) {
         setStatusMsg(`Error: ${err.response?.status || "Network"}`);
       }
       setIncidents([]);
+      setNextCursor(null);
     } finally {
       setLoading(false);
     }
   }
 
+  async function loadMoreIncidents() {
+    if (!token || !nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const res = await axios.get(`${apiBase}/incidents/`, {
+        headers: { Authorization: `Bearer ${token}` },
+        params: { cursor: nextCursor }
+      });
+      const older = Array.isArray(res.data) ? res.data : [];
+      setIncidents(prev => {
+        const seen = new Set(prev.map(i => i.id));
+        return [...prev, ...older.filter(i => !seen.has(i.id))];
+      });
+      setNextCursor(res.headers["x-next-cursor"] || null);
+      setVisibleCount(count => count + older.length);
+    } catch (err) {
+      console.error("loadMoreIncidents error:", err);
+    } finally {
+      setLoadingMore(false);
+    }
+  }
+
   // SSE: subscribe to real-time events from Context
   const { lastEvent } = useContext(EventsContext);
 
@@ -142,6 +169,12 @@ export default function Dashboard({ apiBase = "/api" }) {
     const payload = lastEvent;
     console.log("Dashboard received event:", payload.type, payload);
 
+    // Reconnected after a gap the server no longer buffers: reload the list
+    if (payload.type === "resync") {
+      fetchIncidents();
+      return;
+    }
+
     // Logic from previous SSE handler
     // If an incident was created, update incidents list.
     if (payload.incident) {
@@ -158,6 +191,17 @@ export default function Dashboard({ apiBase = "/api" }) {
       setStatusMsg("New Incident Detected");
     }
 
+    // Throttled repeats, reported in bulk by the backend
+    if (payload.type === "alerts_merged") {
+      setIncidents((prev) =>
+        prev.map((i) =>
+          i.id == payload.incident_id
+            ? { ...i, alert_count: (i.alert_count || 1) + payload.count, last_seen: payload.last_seen }
+            : i
+        )
+      );
+    }
+
     if (payload.type === "status_update") {
       setIncidents((prev) =>
         prev.map((i) =>
@@ -269,7 +313,7 @@ export default function Dashboard({ apiBase = "/api" }) {
 
           {/* Main Column */}
           <div className="grid" style={{ gap: 24 }}>
-            <QuickStats incidents={incidentsList} statusMsg={statusMsg} />
+            <QuickStats statusMsg={statusMsg} />
 
             <div className="card">
               <div className="header" style={{ display: 'flex', justifyContent: 'space-between' }}>
@@ -297,6 +341,19 @@ export default function Dashboard({ apiBase = "/api" }) {
                   </button>
                 </div>
               )}
+
+              {visibleCount >= incidentsList.length && nextCursor && (
+                <div style={{ textAlign: 'center', padding: '10px 0' }}>
+                  <button
+                    className="btn secondary"
+                    onClick={loadMoreIncidents}
+                    disabled={loadingMore}
+                    style={{ fontSize: 12, padding: '6px 16px' }}
+                  >
+                    {loadingMore ? 'Loading...' : 'Load Older Incidents'}
+                  </button>
+                </div>
+              )}
             </div>
           </div>
 
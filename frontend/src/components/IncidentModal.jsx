@@ -61,6 +61,20 @@ export default function IncidentModal({ incident, onClose, apiBase = "/api" }) {
 
     const { lastEvent } = useContext(EventsContext); // Added useContext for EventsContext
 
+    // The incident list is slim (no description); load the full record on open
+    const [detail, setDetail] = useState(null);
+    const description = detail?.description ?? incident.description;
+
+    useEffect(() => {
+        if (!incident?.id) return;
+        setDetail(null);
+        axios.get(`${apiBase}/incidents/${incident.id}`, {
+            headers: { Authorization: `Bearer ${token}` }
+        })
+            .then(res => setDetail(res.data))
+            .catch(e => console.error("Failed to fetch incident detail", e));
+    }, [incident.id]);
+
     // Fetch notes on open
     useEffect(() => {
         if (!incident?.id) return;
@@ -225,9 +239,9 @@ export default function IncidentModal({ incident, onClose, apiBase = "/api" }) {
                         overflowWrap: 'anywhere',
                         WebkitOverflowScrolling: 'touch'
                     }}>
-                        {incident.description}
+                        {description}
                     </div>
-                    {incident.description && incident.description.length > 140 && (
+                    {description && description.length > 140 && (
                         <button
                             onClick={() => setDescExpanded(v => !v)}
                             className="btn-ghost"
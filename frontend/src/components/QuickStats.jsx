@@ -1,10 +1,13 @@
 import React, { useEffect, useState, useContext } from "react";
 import axios from "axios";
 import { AuthContext } from "../context/AuthContext";
+import { EventsContext } from "../context/EventsContext";
 
-export default function QuickStats({ incidents, statusMsg, apiBase = "/api" }) {
+export default function QuickStats({ statusMsg, apiBase = "/api" }) {
   const { token } = useContext(AuthContext);
   const [servers, setServers] = useState([]);
+  const [incidentStats, setIncidentStats] = useState(null);
+  const { lastEvent } = useContext(EventsContext);
 
   useEffect(() => {
     if (!token) return;
@@ -25,6 +28,41 @@ export default function QuickStats({ incidents, statusMsg, apiBase = "/api" }) {
     return () => clearInterval(interval);
   }, [token, apiBase]);
 
+  // Incident counters from the backend (the incident list is only the newest
+  // page), scoped to what this user can see; polled like the server list
+  useEffect(() => {
+    if (!token) return;
+    const fetchStats = async () => {
+      try {
+        const res = await axios.get(`${apiBase}/incidents/stats`, {
+          headers: { Authorization: `Bearer ${token}` }
+        });
+        setIncidentStats(res.data);
+      } catch (e) {
+        console.error("Failed to load incident stats", e);
+      }
+    };
+
+    fetchStats();
+    const interval = setInterval(fetchStats, 15000);
+    return () => clearInterval(interval);
+  }, [token, apiBase]);
+
+  // Liveness transitions pushed by the backend
+  useEffect(() => {
+    if (!lastEvent) return;
+    if (lastEvent.type === "server_offline" || lastEvent.type === "server_online") {
+      const status = lastEvent.type === "server_online" ? "online" : "offline";
+      setServers(prev => prev.map(s => s.id === lastEvent.server_id ? { ...s, status } : s));
+    }
+  }, [lastEvent]);
+
+  const countBy = (counts, value) =>
+    Object.entries(counts || {}).reduce((n, [k, c]) => (k.toLowerCase() === value ? n + c : n), 0);
+  const totalIncidents = incidentStats ? incidentStats.total : "—";
+  const openIncidents = incidentStats ? countBy(incidentStats.by_status, "open") : "—";
+  const highIncidents = incidentStats ? countBy(incidentStats.by_severity, "high") : "—";
+
   const activeServers = servers.filter(s => s.status !== "offline").length;
   const offlineServers = servers.length - activeServers;
 
@@ -35,9 +73,9 @@ export default function QuickStats({ incidents, statusMsg, apiBase = "/api" }) {
         
         {/* Incident Stats */}
         <div style={{ paddingRight: 16, borderRight: '1px solid rgba(255,255,255,0.1)' }}>
-            <div style={{ marginBottom: 4 }}>Total incidents: <strong style={{ color: "var(--text-main)" }}>{incidents.length}</strong></div>
-            <div style={{ marginBottom: 4, color: "var(--muted)" }}>Open: <span style={{ color: "#fff" }}>{incidents.filter(i=>i.status?.toLowerCase() === "open").length}</span></div>
-            <div style={{ color: "var(--muted)" }}>High severity: <span style={{ color: "var(--error)" }}>{incidents.filter(i=>i.severity?.toLowerCase() === "high").length}</span></div>
+            <div style={{ marginBottom: 4 }}>Total incidents: <strong style={{ color: "var(--text-main)" }}>{totalIncidents}</strong></div>
+            <div style={{ marginBottom: 4, color: "var(--muted)" }}>Open: <span style={{ color: "#fff" }}>{openIncidents}</span></div>
+            <div style={{ color: "var(--muted)" }}>High severity: <span style={{ color: "var(--error)" }}>{highIncidents}</span></div>
         </div>
 
         {/* Server Stats */}
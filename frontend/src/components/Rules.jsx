@@ -16,6 +16,11 @@ export default function Rules({ apiBase = "/api" }) {
     const [value, setValue] = useState("");
     const [status, setStatus] = useState("");
     const [targetServer, setTargetServer] = useState("");
+    // Optional sliding window: "" (every match), "count" or "sum"
+    const [windowAgg, setWindowAgg] = useState("");
+    const [windowSeconds, setWindowSeconds] = useState("60");
+    const [windowThreshold, setWindowThreshold] = useState("");
+    const [windowField, setWindowField] = useState("");
     const [showHelp, setShowHelp] = useState(false);
 
     async function fetchRules() {
@@ -58,14 +63,20 @@ export default function Rules({ apiBase = "/api" }) {
                 description,
                 severity,
                 target_server: targetServer || null,
-                conditions: [{ field, op, value }]
+                conditions: [{ field, op, value }],
+                window: windowAgg ? {
+                    agg: windowAgg,
+                    seconds: Number(windowSeconds),
+                    threshold: Number(windowThreshold),
+                    field: windowAgg === "sum" ? windowField : null
+                } : null
             };
             const res = await axios.post(`${apiBase}/rules/`, payload, {
                 headers: { Authorization: `Bearer ${token}` }
             });
             setStatus("Rule created");
             // reset form
-            setName(""); setDescription(""); setValue(""); setField("event_type"); setOp("equals"); setTargetServer("");
+            setName(""); setDescription(""); setValue(""); setField("event_type"); setOp("equals"); setTargetServer(""); setWindowAgg(""); setWindowThreshold(""); setWindowField("");
             fetchRules();
         } catch (err) {
             console.error("createRule error", err);
@@ -158,10 +169,31 @@ export default function Rules({ apiBase = "/api" }) {
                                 </div>
                             </div>
 
+                            {/* Optional sliding window */}
+                            <div style={{ marginBottom: 12 }}>
+                                <span style={{ color: "var(--text-muted)", fontSize: 12, textTransform: 'uppercase', letterSpacing: '0.5px', display: 'block', marginBottom: 8 }}>Window (optional)</span>
+                                <div style={{ display: 'grid', gridTemplateColumns: '1fr 1fr', gap: 8 }}>
+                                    <select value={windowAgg} onChange={e => setWindowAgg(e.target.value)} className="select">
+                                        <option value="">Every matching event</option>
+                                        <option value="count">Count of matches</option>
+                                        <option value="sum">Sum of a field</option>
+                                    </select>
+                                    {windowAgg === "sum" && (
+                                        <input list="field-suggestions" placeholder="Field to sum (e.g. data.net_out_mb)" value={windowField} onChange={e => setWindowField(e.target.value)} className="input" required />
+                                    )}
+                                    {windowAgg && (
+                                        <>
+                                            <input type="number" min="1" placeholder="Threshold (≥)" value={windowThreshold} onChange={e => setWindowThreshold(e.target.value)} className="input" required />
+                                            <input type="number" min="1" placeholder="Within seconds" value={windowSeconds} onChange={e => setWindowSeconds(e.target.value)} className="input" required />
+                                        </>
+                                    )}
+                                </div>
+                            </div>
+
                             {/* Action buttons */}
                             <div style={{ display: 'flex', gap: 10 }}>
                                 <button type="submit" className="btn" style={{ flex: 1 }}>Create Rule</button>
-                                <button type="button" className="btn-ghost" style={{ flex: 1 }} onClick={() => { setName(""); setDescription(""); setValue(""); setField("event_type"); setOp("equals"); setTargetServer(""); }}>Clear</button>
+                                <button type="button" className="btn-ghost" style={{ flex: 1 }} onClick={() => { setName(""); setDescription(""); setValue(""); setField("event_type"); setOp("equals"); setTargetServer(""); setWindowAgg(""); setWindowThreshold(""); setWindowField(""); }}>Clear</button>
                             </div>
                         </form>
 
@@ -189,6 +221,11 @@ export default function Rules({ apiBase = "/api" }) {
                                         <div style={{ fontSize: 11, fontFamily: "var(--font-mono)", color: "var(--primary)", wordBreak: "break-word", whiteSpace: "pre-wrap", background: "rgba(0,0,0,0.25)", padding: 8, borderRadius: 4, overflowX: 'auto' }}>
                                             {JSON.stringify(r.conditions, null, 2)}
                                         </div>
+                                        {r.window && (
+                                            <div style={{ fontSize: 12, color: "var(--text-muted)", marginTop: 6 }}>
+                                                ⏱ {r.window.agg === "sum" ? `sum(${r.window.field})` : "count"} ≥ {r.window.threshold} within {r.window.seconds}s per {r.window.group_by || "source"}
+                                            </div>
+                                        )}
                                         <div style={{ marginTop: 10 }}>
                                             <button className="btn-ghost btn-danger" onClick={() => deleteRule(r.id)} style={{ padding: "8px 16px", fontSize: 12, width: '100%' }}>Delete</button>
                                         </div>
@@ -31,9 +31,9 @@ export const EventsProvider = ({ children, apiBase = "/api" }) => {
 
         es.onerror = (err) => {
             // console.warn("SSE Error", err);
-            setStatus("error");
-            es.close();
-            // Retry handled by browser or manual? Browser retries usually.
+            // Keep the EventSource: the browser reconnects and sends Last-Event-ID,
+            // so the backend replays missed events (or sends "resync").
+            setStatus(es.readyState === EventSource.CLOSED ? "error" : "reconnecting");
         };
 
         return () => {